@@ -0,0 +1,138 @@
+"""Peak memory and step time of training against the batch size, and the fastest batch size that fits in memory.
+
+Run from `attend_infer_repeat`:
+
+    python batch_finder.py --max_steps 3 --memory_budget_mb 8000 --output batch_config.json
+
+Every batch size is measured in a fresh process with `profiling.benchmark_train_step`, in increasing order; the
+sweep stops at the first batch size that exceeds the budget, since memory only grows with the batch size. The
+report lists all measurements and the batch size with the highest throughput (samples per second) within the
+budget. `scripts/multi_mnist.py --batch_config batch_config.json` trains with its batch size and `max_steps`.
+
+The sweep measures a single model fed from a placeholder. The training script also holds the datasets in memory:
+their size once loaded (`--data`, the MNIST training and validation sets by default) is subtracted from the budget.
+Pass `--data` without files for training with `--mmap_data`, and only the validation set with `--online_data`.
+Stacked models (`--n_models`) aren't measured, and `multi_mnist.py` rejects a batch config together with them.
+"""
+import os
+import sys
+import json
+import argparse
+
+
+def physical_memory_mb():
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 2. ** 20
+
+
+def dataset_mb(paths):
+    """Memory taken by the arrays of the datasets at `paths` once loaded with `data.load_data`."""
+    from data import load_data
+
+    total = 0
+    for path in paths:
+        data = load_data(path)
+        total += sum(v.nbytes for v in data.itervalues() if hasattr(v, 'nbytes'))
+    return total / 2. ** 20
+
+
+def recommend(measurements, memory_budget_mb):
+    """The measurement with the highest throughput whose peak memory is within the budget, or None."""
+    fitting = [m for m in measurements if m['peak_rss_mb'] <= memory_budget_mb]
+    if not fitting:
+        return None
+    return max(fitting, key=lambda m: m['samples_per_sec'])
+
+
+def sweep(batch_sizes, memory_budget_mb, max_steps=3, img_size=(50, 50), n_iter=10, verbose=False,
+          **model_kwargs):
+    """Measures training steps at increasing `batch_sizes` until one exceeds `memory_budget_mb`.
+
+    :return: list of dicts with the batch size and the results of `profiling.benchmark_train_step`
+    """
+    from profiling import benchmark_train_step, run_in_subprocess
+
+    measurements = []
+    for batch_size in sorted(batch_sizes):
+        result = run_in_subprocess(benchmark_train_step, batch_size, n_iter=n_iter, max_steps=max_steps,
+                                   img_size=img_size, **model_kwargs)
+        result['batch_size'] = batch_size
+        measurements.append(result)
+        if verbose:
+            print '{batch_size:>12} {peak_rss_mb:>14.0f} {step_time:>14.4f} {samples_per_sec:>16.1f}'.format(**result)
+
+        if result['peak_rss_mb'] > memory_budget_mb:
+            break
+    return measurements
+
+
+def find_batch_size(memory_budget_mb, batch_sizes=(8, 16, 32, 64, 128, 256, 512), max_steps=3, img_size=(50, 50),
+                    n_iter=10, verbose=False, reserved_mb=0., **model_kwargs):
+    """Runs `sweep` and returns a report with the configuration, all measurements and the recommended batch size
+    (None if no batch size fits).
+
+    :param reserved_mb: memory the training process needs on top of the measured step, e.g. `dataset_mb`; it is
+        subtracted from `memory_budget_mb`
+    """
+    budget = memory_budget_mb - reserved_mb
+    measurements = sweep(batch_sizes, budget, max_steps, img_size, n_iter, verbose, **model_kwargs)
+    return dict(
+        config=dict(max_steps=max_steps, img_size=list(img_size), model_kwargs=model_kwargs),
+        memory_budget_mb=memory_budget_mb,
+        reserved_mb=reserved_mb,
+        measurements=measurements,
+        recommended=recommend(measurements, budget)
+    )
+
+
+def load_batch_config(path):
+    """Reads a report written by `main`; returns the recommended (batch_size, max_steps)."""
+    with open(path) as f:
+        report = json.load(f)
+
+    if report['recommended'] is None:
+        raise ValueError('"{}" has no batch size within the memory budget of {} MB'.format(
+            path, report['memory_budget_mb']))
+    return report['recommended']['batch_size'], report['config']['max_steps']
+
+
+def main(argv=None):
+    from mnist_model import multi_mnist_kwargs
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', required=True, help='JSON report')
+    parser.add_argument('--memory_budget_mb', type=float, default=None,
+                        help='peak resident memory of the training process; 80%% of physical memory by default')
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[8, 16, 32, 64, 128, 256, 512])
+    parser.add_argument('--max_steps', type=int, default=3)
+    parser.add_argument('--img_size', type=int, nargs=2, default=[50, 50])
+    parser.add_argument('--n_iter', type=int, default=10, help='number of timed training steps per batch size')
+    parser.add_argument('--data', nargs='*', default=['mnist_train.pickle', 'mnist_validation.pickle'],
+                        help='datasets the training script loads into memory; their size is subtracted from the budget')
+    parser.add_argument('--model_kwargs', default='{}',
+                        help='JSON dict overriding the hyperparameters in `mnist_model.multi_mnist_kwargs`')
+    args = parser.parse_args(argv)
+
+    memory_budget_mb = args.memory_budget_mb or .8 * physical_memory_mb()
+    model_kwargs = dict(multi_mnist_kwargs, **json.loads(args.model_kwargs))
+
+    reserved_mb = dataset_mb(args.data)
+
+    print 'Memory budget: {:.0f} MB, of which {:.0f} MB for the datasets'.format(memory_budget_mb, reserved_mb)
+    print '{:>12} {:>14} {:>14} {:>16}'.format('batch size', 'peak [MB]', 'step [s]', 'samples/s')
+    report = find_batch_size(memory_budget_mb, args.batch_sizes, args.max_steps, tuple(args.img_size), args.n_iter,
+                             verbose=True, reserved_mb=reserved_mb, **model_kwargs)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    if report['recommended'] is None:
+        print 'No batch size fits within the memory budget'
+        return 1
+
+    print 'Recommended batch size: {batch_size} ({samples_per_sec:.1f} samples/s, ' \
+          '{peak_rss_mb:.0f} MB)'.format(**report['recommended'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,227 @@
+"""Micro and macro benchmarks of AIR with a comparison of two runs.
+
+Run from `attend_infer_repeat`:
+
+    python benchmark.py run --output before.json
+    python benchmark.py run --output after.json
+    python benchmark.py compare before.json after.json --tolerance .1
+
+Comparisons are only meaningful for runs made on the same machine.
+"""
+import sys
+import json
+import time
+import socket
+import platform
+import argparse
+import itertools
+
+import numpy as np
+import tensorflow as tf
+import sonnet as snt
+
+from modules import SpatialTransformer
+from prior import presence_prob_table, tabular_kl, geometric_prior
+from profiling import build_benchmark_air, time_fetches, time_callable
+
+
+def _session():
+    sess = tf.Session()
+    sess.run(tf.global_variables_initializer())
+    return sess
+
+
+def bench_cell_step(batch_size, img_size, max_steps, n_iter):
+    air, _ = build_benchmark_air(batch_size, (img_size, img_size), max_steps, train=False)
+    state = air.cell.initial_state(air.obs)
+    output, _ = air.cell(tf.zeros((batch_size, 1)), state)
+    return time_fetches(_session(), output, n_iter)
+
+
+def bench_train_step(batch_size, img_size, max_steps, n_iter):
+    air, train_step = build_benchmark_air(batch_size, (img_size, img_size), max_steps)
+    return time_fetches(_session(), train_step, n_iter)
+
+
+def bench_eval(batch_size, img_size, max_steps, n_iter):
+    from evaluation import make_expr_logger
+
+    air, _ = build_benchmark_air(batch_size, (img_size, img_size), max_steps)
+    exprs = {
+        'loss': air.loss.value,
+        'rec_loss': air.rec_loss,
+        'num_step_acc': air.num_step_accuracy,
+        'num_step': air.num_step
+    }
+    n_batches = 10
+    logger = make_expr_logger(_session(), None, n_batches, exprs, name='benchmark')
+    # time per evaluated batch
+    return time_callable(lambda: logger(write=False), n_iter) / n_batches
+
+
+def bench_prior(batch_size, max_steps, n_iter):
+    presence_prob = tf.placeholder(tf.float32, (batch_size, max_steps))
+    table = presence_prob_table(presence_prob)
+    kl = tabular_kl(table, geometric_prior(.5, max_steps))
+    feed_dict = {presence_prob: np.random.rand(batch_size, max_steps)}
+    return time_fetches(_session(), [table, kl], n_iter, feed_dict=feed_dict)
+
+
+def bench_stn(batch_size, img_size, n_iter, inverse=False):
+    img_size, crop_size = (img_size, img_size), (20, 20)
+    constraints = snt.AffineWarpConstraints.no_shear_2d()
+    stn = SpatialTransformer(img_size, crop_size, constraints, inverse=inverse)
+
+    size = crop_size if inverse else img_size
+    img = tf.random_uniform((batch_size,) + size)
+    params = tf.random_uniform((batch_size, 4), .2, 1.)
+    return time_fetches(_session(), stn(img, params), n_iter)
+
+
+def bench_create_mnist(batch_size, img_size, n_iter):
+    from data.data import create_mnist
+    return time_callable(lambda: create_mnist('validation', (img_size, img_size), n_samples=batch_size), n_iter,
+                         n_warmup=1)
+
+
+# name -> (function, grid parameters it depends on, fixed keyword arguments)
+BENCHMARKS = [
+    ('cell_step', bench_cell_step, ('batch_size', 'img_size', 'max_steps'), {}),
+    ('train_step', bench_train_step, ('batch_size', 'img_size', 'max_steps'), {}),
+    ('eval', bench_eval, ('batch_size', 'img_size', 'max_steps'), {}),
+    ('prior', bench_prior, ('batch_size', 'max_steps'), {}),
+    ('stn_forward', bench_stn, ('batch_size', 'img_size'), {}),
+    ('stn_inverse', bench_stn, ('batch_size', 'img_size'), dict(inverse=True)),
+    ('create_mnist', bench_create_mnist, ('batch_size', 'img_size'), {}),
+]
+
+
+def run(grid, n_iter=10, only=None):
+    """Runs every benchmark over the part of `grid` it depends on.
+
+    :param grid: dict of parameter name -> list of values
+    :param n_iter: int, number of timed iterations
+    :param only: list of benchmark names to run or None for all of them
+    :return: list of result dicts
+    """
+    results = []
+    for name, func, param_names, kwargs in BENCHMARKS:
+        if only and name not in only:
+            continue
+
+        for values in itertools.product(*[grid[p] for p in param_names]):
+            params = dict(zip(param_names, values))
+            result = dict(name=name, params=params)
+
+            tf.reset_default_graph()
+            try:
+                times = np.asarray(func(n_iter=n_iter, **dict(params, **kwargs))) * 1e3
+                result.update(median_ms=float(np.median(times)), mean_ms=float(times.mean()),
+                              std_ms=float(times.std()), n_iter=len(times))
+                print '{} {}: {:.3f} ms'.format(name, params, result['median_ms'])
+            except Exception as e:
+                result['error'] = '{}: {}'.format(type(e).__name__, e)
+                print '{} {} failed with {}'.format(name, params, result['error'])
+
+            results.append(result)
+    return results
+
+
+def machine_info():
+    return dict(host=socket.gethostname(), platform=platform.platform(), processor=platform.processor(),
+                tensorflow=tf.__version__, time=time.strftime('%Y-%m-%d %H:%M:%S'))
+
+
+def _key(result):
+    return result['name'], tuple(sorted(result['params'].items()))
+
+
+def compare_results(base, new, tolerance=.1):
+    """Compares median times of two runs.
+
+    :param base: list of result dicts, the reference run
+    :param new: list of result dicts
+    :param tolerance: float, relative slowdown above which a benchmark counts as a regression
+    :return: list of (name, params, base_ms, new_ms, ratio, status), where status is one of
+        'regression', 'improvement', 'ok' or 'missing'
+    """
+    new = {_key(r): r for r in new if 'error' not in r}
+    comparison = []
+    for b in base:
+        if 'error' in b:
+            continue
+
+        n = new.get(_key(b))
+        if n is None:
+            comparison.append((b['name'], b['params'], b['median_ms'], None, None, 'missing'))
+            continue
+
+        ratio = n['median_ms'] / max(b['median_ms'], 1e-8)
+        if ratio > 1. + tolerance:
+            status = 'regression'
+        elif ratio < 1. - tolerance:
+            status = 'improvement'
+        else:
+            status = 'ok'
+        comparison.append((b['name'], b['params'], b['median_ms'], n['median_ms'], ratio, status))
+    return comparison
+
+
+def format_comparison(comparison):
+    lines = ['{:<14} {:<50} {:>10} {:>10} {:>7} {}'.format('benchmark', 'params', 'base [ms]', 'new [ms]', 'ratio',
+                                                           'status')]
+    for name, params, base_ms, new_ms, ratio, status in comparison:
+        params = ', '.join('{}={}'.format(k, v) for k, v in sorted(params.items()))
+        if new_ms is None:
+            lines.append('{:<14} {:<50} {:>10.3f} {:>10} {:>7} {}'.format(name, params, base_ms, '-', '-', status))
+        else:
+            lines.append('{:<14} {:<50} {:>10.3f} {:>10.3f} {:>7.3f} {}'.format(name, params, base_ms, new_ms,
+                                                                                ratio, status))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command')
+
+    run_parser = subparsers.add_parser('run', help='runs the benchmarks and writes the results as JSON')
+    run_parser.add_argument('--output', required=True)
+    run_parser.add_argument('--batch_sizes', type=int, nargs='+', default=[16, 64])
+    run_parser.add_argument('--img_sizes', type=int, nargs='+', default=[50, 100])
+    run_parser.add_argument('--max_steps', type=int, nargs='+', default=[3, 6])
+    run_parser.add_argument('--n_iter', type=int, default=10)
+    run_parser.add_argument('--only', nargs='+', choices=[b[0] for b in BENCHMARKS])
+
+    compare_parser = subparsers.add_parser('compare', help='flags regressions between two runs')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--tolerance', type=float, default=.1)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        grid = dict(batch_size=args.batch_sizes, img_size=args.img_sizes, max_steps=args.max_steps)
+        results = run(grid, args.n_iter, args.only)
+        with open(args.output, 'w') as f:
+            json.dump(dict(machine=machine_info(), results=results), f, indent=2)
+        return 0
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    if base['machine']['host'] != new['machine']['host']:
+        print 'Warning: comparing runs from different machines ({} vs {})'.format(base['machine']['host'],
+                                                                                 new['machine']['host'])
+
+    comparison = compare_results(base['results'], new['results'], args.tolerance)
+    print format_comparison(comparison)
+
+    n_regressions = sum(c[-1] == 'regression' for c in comparison)
+    print '{} regression(s) beyond {:.0f}%'.format(n_regressions, 100 * args.tolerance)
+    return int(n_regressions > 0)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,19 +1,74 @@
 import numpy as  np
 import sonnet as snt
 import tensorflow as tf
-from tensorflow.contrib.distributions import Bernoulli, NormalWithSoftplusScale
+from tensorflow.contrib.distributions import Bernoulli, Normal, NormalWithSoftplusScale
 
 from distrib import ParametrisedGaussian
 from modules import SpatialTransformer
-from neural import Affine
+from neural import Affine, batch_dim, stacked_shape, stacked_tile
+from precision import as_policy
 
 
-class AIRCell(snt.RNNCore):
+class _GlimpseMixin(object):
+    """Glimpse encoding and decoding shared by `AIRCell` and `ParallelAIRCell`.
+
+    Expects the attributes `_spatial_transformer`, `_inverse_transformer`, `_glimpse_encoder`, `_what_distrib`,
+    `_glimpse_decoder`, `_precision` and `_deterministic`.
+    """
+
+    def _glimpse(self, img, where_code, what_noise=None):
+        """Crops, encodes and reconstructs the object at `where_code`.
+
+        :return: decoded glimpse, glimpse transformed back to image size, `what` code, loc and scale
+        """
+        cropped = self._spatial_transformer(self._precision.cast(img), where_code)
+        what_params = self._precision.apply(self._glimpse_encoder, cropped)
+        what_distrib = self._what_distrib(what_params)
+        what_code = self._sample(what_distrib, what_noise)
+        decoder_inpt = tf.concat([what_code, tf.stop_gradient(where_code)], -1)
+        decoded = self._glimpse_decoder(self._precision.cast(decoder_inpt))
+        inversed = self._precision.uncast(self._inverse_transformer(decoded, where_code))
+        decoded = self._precision.uncast(decoded)
+        return decoded, inversed, what_code, what_distrib.loc, what_distrib.scale
+
+    def _sample(self, distrib, noise=None):
+        """Draws a reparametrised sample from a Normal `distrib`, using `noise` ~ N(0, 1) if given.
+
+        Using external noise makes the step a deterministic function of its inputs, which is what
+        allows the unroll to be recomputed during the backward pass. Returns the mean in deterministic mode.
+        """
+        if self._deterministic:
+            return distrib.loc
+        if noise is None:
+            return distrib.sample()
+        return distrib.loc + distrib.scale * noise
+
+
+class AIRCell(_GlimpseMixin, snt.RNNCore):
     _n_transform_param = 4
 
     def __init__(self, img_size, crop_size, n_appearance,
                  transition, input_encoder, glimpse_encoder, glimpse_decoder, transform_estimator, steps_predictor,
-                 discrete_steps=True, canvas_init=-10., explore_eps=None, debug=False):
+                 discrete_steps=True, canvas_init=-10., explore_eps=None, external_noise=False, precision=None,
+                 input_pyramid_level=None, learned_input_pooling=False, deterministic=False, where_proposals=False,
+                 marginalise_presence=False, compact_absent=False, debug=False):
+        """Single step of AIR: attends to, encodes and reconstructs one object.
+
+        :param input_pyramid_level: int or None; if given, the input encoder sees the image downsampled by a factor
+            of 2 ** input_pyramid_level, while glimpses are still cropped from the full-resolution image
+        :param learned_input_pooling: boolean, downsamples with a learned strided convolution (initialised to
+            average pooling) instead of average pooling if True
+        :param deterministic: boolean, uses means of `what` and `where` and thresholds presence probability at .5
+            instead of sampling if True; meant for inference
+        :param where_proposals: boolean; if True, the last `proposal_size` entries of every step's input are a
+            `where` proposal followed by a mask, and the mean of `where` is replaced by the proposal wherever the
+            mask is 1
+        :param marginalise_presence: boolean; if True, presence is not sampled and every step is executed, so that
+            the model can weight the canvases after every step by the probability of stopping there
+        :param compact_absent: boolean; if True, glimpses are cropped, encoded and decoded only for examples whose
+            object is present at this step, as a batch gathered from present rows. Outputs of absent rows are zero
+            (`what_scale` is one), where they would otherwise be computed and then masked by presence.
+        """
 
         super(AIRCell, self).__init__(self.__class__.__name__)
         self._img_size = img_size
@@ -25,6 +80,13 @@ class AIRCell(snt.RNNCore):
 
         self._sample_presence = discrete_steps
         self._explore_eps = explore_eps
+        self._external_noise = external_noise
+        self._precision = as_policy(precision)
+        self._input_pooling_factor = 2 ** input_pyramid_level if input_pyramid_level else None
+        self._deterministic = deterministic
+        self._where_proposals = where_proposals
+        self._marginalise_presence = marginalise_presence
+        self._compact_absent = compact_absent
         self._debug = debug
 
         with self._enter_variable_scope():
@@ -49,6 +111,13 @@ class AIRCell(snt.RNNCore):
             self._steps_predictor = steps_predictor()
             self._rnn_projection = Affine(self._n_hidden, transfer=None)
 
+            self._learned_input_pooling = None
+            if self._input_pooling_factor is not None and learned_input_pooling:
+                factor = self._input_pooling_factor
+                init = {'w': tf.constant_initializer(1. / factor ** 2), 'b': tf.zeros_initializer()}
+                self._learned_input_pooling = snt.Conv2D(1, factor, stride=factor, initializers=init,
+                                                         name='input_pooling')
+
     @property
     def state_size(self):
         return [
@@ -75,23 +144,35 @@ class AIRCell(snt.RNNCore):
             1  # presence
         ]
 
+    @property
+    def noise_size(self):
+        """Size of the per-step input expected when `external_noise=True`: noise for where, what and presence."""
+        return self._n_transform_param + self._n_appearance + 1
+
+    @property
+    def proposal_size(self):
+        """Size of the per-step input expected when `where_proposals=True`: a `where` code and a mask."""
+        return self._n_transform_param + 1
+
     @property
     def output_names(self):
         return 'canvas glimpse what what_loc what_scale where where_loc where_scale presence_prob presence'.split()
 
     def initial_state(self, img):
-        batch_size = img.get_shape().as_list()[0]
+        batch_size = batch_dim(img)
         hidden_state = self._transition.initial_state(batch_size, tf.float32, trainable=True)
 
-        where_code = tf.get_variable('where_init', shape=[1, self._n_transform_param], dtype=tf.float32)
+        where_code = tf.get_variable('where_init', shape=stacked_shape([1, self._n_transform_param]),
+                                     dtype=tf.float32)
 
-        what_code = tf.get_variable('what_init', shape=[1, self._n_appearance], dtype=tf.float32)
+        what_code = tf.get_variable('what_init', shape=stacked_shape([1, self._n_appearance]), dtype=tf.float32)
 
         flat_canvas = tf.reshape(self._canvas, (1, self._n_pix))
 
-        where_code, what_code, flat_canvas = (tf.tile(i, (batch_size, 1)) for i in (where_code, what_code, flat_canvas))
+        where_code, what_code = (stacked_tile(i, batch_size) for i in (where_code, what_code))
+        flat_canvas = tf.tile(flat_canvas, (batch_size, 1))
 
-        flat_img = tf.reshape(img, (batch_size, self._n_pix))
+        flat_img = tf.reshape(img, (-1, self._n_pix))
         init_presence = tf.ones((batch_size, 1), dtype=tf.float32)
         return [flat_img, flat_canvas,
                 what_code, where_code, hidden_state, init_presence]
@@ -101,45 +182,68 @@ class AIRCell(snt.RNNCore):
         img_flat, canvas_flat, what_code, where_code, hidden_state, presence = state
         img = tf.reshape(img_flat, (-1,) + tuple(self._img_size))
 
-        inpt_encoding = img
-        inpt_encoding = self._input_encoder(inpt_encoding)
+        proposal, proposal_mask = None, None
+        if self._where_proposals:
+            proposal = inpt[..., -self.proposal_size:-1]
+            proposal_mask = inpt[..., -1:]
+            inpt = inpt[..., :-self.proposal_size]
+
+        where_noise, what_noise, presence_noise = None, None, None
+        if self._external_noise:
+            split = [self._n_transform_param, self._n_appearance, 1]
+            where_noise, what_noise, presence_noise = tf.split(inpt, split, -1)
+
+        inpt_encoding = self._downsample_input(img)
+        inpt_encoding = self._precision.apply(self._input_encoder, inpt_encoding)
 
         with tf.variable_scope('rnn_inpt'):
             rnn_inpt = tf.concat((inpt_encoding, what_code, where_code, presence), -1)
             rnn_inpt = self._rnn_projection(rnn_inpt)
             hidden_output, hidden_state = self._transition(rnn_inpt, hidden_state)
 
-        where_param = self._transform_estimator(hidden_output)
+        where_param = self._precision.apply(self._transform_estimator, hidden_output)
         where_distrib = NormalWithSoftplusScale(*where_param,
                                                 validate_args=self._debug, allow_nan_stats=not self._debug)
         where_loc, where_scale = where_distrib.loc, where_distrib.scale
-        where_code = where_distrib.sample()
-
-        cropped = self._spatial_transformer(img, where_code)
+        if proposal is not None:
+            where_loc = proposal_mask * proposal + (1. - proposal_mask) * where_loc
+            where_distrib = Normal(where_loc, where_scale)
+        where_code = self._sample(where_distrib, where_noise)
 
         with tf.variable_scope('presence'):
-            presence_prob = self._steps_predictor(hidden_output)
+            presence_prob = self._precision.apply(self._steps_predictor, hidden_output)
 
             if self._explore_eps is not None:
                 clipped_prob = tf.clip_by_value(presence_prob, self._explore_eps, 1. - self._explore_eps)
                 presence_prob = tf.stop_gradient(clipped_prob - presence_prob) + presence_prob
 
             if self._sample_presence:
-                presence_distrib = Bernoulli(probs=presence_prob, dtype=tf.float32,
-                                             validate_args=self._debug, allow_nan_stats=not self._debug)
+                if self._marginalise_presence:
+                    new_presence = tf.ones_like(presence_prob)
+                elif self._deterministic:
+                    new_presence = tf.to_float(tf.greater(presence_prob, .5))
+                elif presence_noise is None:
+                    presence_distrib = Bernoulli(probs=presence_prob, dtype=tf.float32,
+                                                 validate_args=self._debug, allow_nan_stats=not self._debug)
+                    new_presence = presence_distrib.sample()
+                else:
+                    new_presence = tf.to_float(tf.less(presence_noise, presence_prob))
 
-                new_presence = presence_distrib.sample()
                 presence *= new_presence
 
             else:
                 presence = presence_prob
 
-        what_params = self._glimpse_encoder(cropped)
-        what_distrib = self._what_distrib(what_params)
-        what_loc, what_scale = what_distrib.loc, what_distrib.scale
-        what_code = what_distrib.sample()
-        decoded = self._glimpse_decoder(tf.concat([what_code, tf.stop_gradient(where_code)], -1))
-        inversed = self._inverse_transformer(decoded, where_code)
+        if self._compact_absent:
+            with tf.variable_scope('compaction'):
+                present = tf.to_int32(tf.where(tf.greater(presence[:, 0], 0.))[:, 0])
+                gather = lambda x: None if x is None else tf.gather(x, present)
+                compacted = self._glimpse(gather(img), gather(where_code), gather(what_noise))
+
+                decoded, inversed, what_code, what_loc = (_scatter_rows(x, present, img) for x in compacted[:4])
+                what_scale = _scatter_rows(compacted[4], present, img, fill=1.)
+        else:
+            decoded, inversed, what_code, what_loc, what_scale = self._glimpse(img, where_code, what_noise)
 
         with tf.variable_scope('rnn_outputs'):
             inversed_flat = tf.reshape(inversed, (-1, self._n_pix))
@@ -153,6 +257,164 @@ class AIRCell(snt.RNNCore):
                  what_code, where_code, hidden_state, presence]
         return output, state
 
+    def _downsample_input(self, img):
+        """Returns the image at the pyramid level consumed by the input encoder."""
+        if self._input_pooling_factor is None:
+            return img
+
+        img = img[..., tf.newaxis]
+        if self._learned_input_pooling is not None:
+            img = self._learned_input_pooling(img)
+        else:
+            factor = self._input_pooling_factor
+            ksize = [1, factor, factor, 1]
+            img = tf.nn.avg_pool(img, ksize, ksize, 'SAME')
+        return img[..., 0]
+
+class ParallelAIRCell(_GlimpseMixin, snt.AbstractModule):
+    """Infers all `n_slots` objects at once instead of one after the other.
+
+    Every slot gets its own hidden vector from the shared encoding of the image and a learned slot embedding;
+    `where`, presence and `what` of all slots are then computed as one batch of size n_slots * batch_size with the
+    same modules as `AIRCell`. Presence keeps the semantics of the sequential model: slot k is present only if
+    all earlier slots are, so `NumStepsDistribution` and the prior losses of `AIRModel` apply unchanged, and
+    `canvas` holds the reconstruction after every slot. Slots can't condition on each other, which the sequential
+    model uses to avoid explaining an object twice; in exchange latency doesn't grow with the number of slots.
+
+    Takes the arguments of `AIRCell`; `transition` only sets the size of the hidden vectors. Options that need the
+    recurrence (`external_noise`, `where_proposals`) and `compact_absent`, `input_pyramid_level` are not
+    supported.
+    """
+
+    def __init__(self, img_size, crop_size, n_appearance, n_slots,
+                 transition, input_encoder, glimpse_encoder, glimpse_decoder, transform_estimator, steps_predictor,
+                 discrete_steps=True, canvas_init=-10., explore_eps=None, precision=None, deterministic=False,
+                 marginalise_presence=False, debug=False, **unsupported):
+
+        unsupported = [k for k, v in unsupported.iteritems() if v]
+        if unsupported:
+            raise ValueError('ParallelAIRCell does not support {}'.format(', '.join(sorted(unsupported))))
+
+        super(ParallelAIRCell, self).__init__(self.__class__.__name__)
+        self._img_size = img_size
+        self._n_pix = np.prod(self._img_size)
+        self._crop_size = crop_size
+        self._n_appearance = n_appearance
+        self._n_slots = n_slots
+        self._n_hidden = transition.output_size[0]
+
+        self._sample_presence = discrete_steps
+        self._explore_eps = explore_eps
+        self._precision = as_policy(precision)
+        self._deterministic = deterministic
+        self._marginalise_presence = marginalise_presence
+        self._debug = debug
+
+        with self._enter_variable_scope():
+            self._canvas = tf.zeros(self._img_size, dtype=tf.float32)
+            if canvas_init is not None:
+                self._canvas_value = tf.get_variable('canvas_value', dtype=tf.float32, initializer=canvas_init)
+                self._canvas += self._canvas_value
+
+            transform_constraints = snt.AffineWarpConstraints.no_shear_2d()
+            self._spatial_transformer = SpatialTransformer(img_size, crop_size, transform_constraints)
+            self._inverse_transformer = SpatialTransformer(img_size, crop_size, transform_constraints, inverse=True)
+
+            self._transform_estimator = transform_estimator(AIRCell._n_transform_param)
+            self._input_encoder = input_encoder()
+            self._glimpse_encoder = glimpse_encoder()
+            self._glimpse_decoder = glimpse_decoder(crop_size)
+
+            self._what_distrib = ParametrisedGaussian(n_appearance, scale_offset=-1.,
+                                                      validate_args=self._debug, allow_nan_stats=not self._debug)
+
+            self._steps_predictor = steps_predictor()
+            self._slot_embedding = tf.get_variable('slot_embedding', shape=(n_slots, 1, self._n_hidden),
+                                                   dtype=tf.float32)
+            self._slot_projection = Affine(self._n_hidden)
+
+    @property
+    def output_size(self):
+        return [
+            np.prod(self._img_size),  # canvas
+            np.prod(self._crop_size),  # glimpse
+            self._n_appearance,  # what code
+            self._n_appearance,  # what loc
+            self._n_appearance,  # what scale
+            AIRCell._n_transform_param,  # where code
+            AIRCell._n_transform_param,  # where loc
+            AIRCell._n_transform_param,  # where scale
+            1,  # presence prob
+            1  # presence
+        ]
+
+    @property
+    def output_names(self):
+        return 'canvas glimpse what what_loc what_scale where where_loc where_scale presence_prob presence'.split()
+
+    def initial_state(self, img):
+        """Image and empty canvas, the first two entries of `AIRCell.initial_state`."""
+        flat_canvas = tf.tile(tf.reshape(self._canvas, (1, self._n_pix)), (batch_dim(img), 1))
+        return [tf.reshape(img, (-1, self._n_pix)), flat_canvas]
+
+    def _build(self, img):
+        """Returns the outputs of `AIRCell` for all slots, time-major like those of `tf.nn.dynamic_rnn`."""
+        batch_size = batch_dim(img)
+        n_slots = self._n_slots
+        img_flat, canvas_flat = self.initial_state(img)
+
+        # slot-major rows: row k * batch_size + i is slot k of example i
+        inpt_encoding = self._precision.apply(self._input_encoder, img)
+        slot_inpt = tf.concat((tf.tile(inpt_encoding[tf.newaxis], (n_slots, 1, 1)),
+                               tf.tile(self._slot_embedding, (1, batch_size, 1))), -1)
+        hidden = self._slot_projection(tf.reshape(slot_inpt, (-1, slot_inpt.get_shape()[-1].value)))
+
+        where_param = self._precision.apply(self._transform_estimator, hidden)
+        where_distrib = NormalWithSoftplusScale(*where_param,
+                                                validate_args=self._debug, allow_nan_stats=not self._debug)
+        where_code = self._sample(where_distrib)
+
+        with tf.variable_scope('presence'):
+            presence_prob = self._precision.apply(self._steps_predictor, hidden)
+
+            if self._explore_eps is not None:
+                clipped_prob = tf.clip_by_value(presence_prob, self._explore_eps, 1. - self._explore_eps)
+                presence_prob = tf.stop_gradient(clipped_prob - presence_prob) + presence_prob
+
+            if self._sample_presence:
+                if self._marginalise_presence:
+                    presence = tf.ones_like(presence_prob)
+                elif self._deterministic:
+                    presence = tf.to_float(tf.greater(presence_prob, .5))
+                else:
+                    presence = Bernoulli(probs=presence_prob, dtype=tf.float32, validate_args=self._debug,
+                                         allow_nan_stats=not self._debug).sample()
+                # a slot is only present if all previous slots are
+                presence = tf.reshape(tf.cumprod(tf.reshape(presence, (n_slots, -1, 1)), 0), (-1, 1))
+            else:
+                presence = presence_prob
+
+        tiled_img = tf.reshape(tf.tile(img[tf.newaxis], (n_slots, 1, 1, 1)), (-1,) + tuple(self._img_size))
+        decoded, inversed, what_code, what_loc, what_scale = self._glimpse(tiled_img, where_code)
+
+        inversed_flat = tf.reshape(presence * tf.reshape(inversed, (-1, self._n_pix)),
+                                   (n_slots, -1, self._n_pix))
+        canvas = canvas_flat[tf.newaxis] + tf.cumsum(inversed_flat, 0)
+        decoded_flat = tf.reshape(decoded, (-1, int(np.prod(self._crop_size))))
+
+        outputs = [decoded_flat, what_code, what_loc, what_scale, where_code, where_distrib.loc,
+                   where_distrib.scale, presence_prob, presence]
+        return [canvas] + [tf.reshape(o, (n_slots, -1, size))
+                           for o, size in zip(outputs, self.output_size[1:])]
+
+
+def _scatter_rows(x, rows, like, fill=0.):
+    """Inverse of `tf.gather(y, rows)` for `y` with as many rows as `like`; other rows are set to `fill`."""
+    shape = tf.concat((tf.shape(like)[:1], tf.shape(x)[1:]), 0)
+    scattered = tf.scatter_nd(rows[:, tf.newaxis], x - fill, shape) + fill
+    scattered.set_shape(like.get_shape()[:1].concatenate(x.get_shape()[1:]))
+    return scattered
+
 
 if __name__ == '__main__':
     learning_rate = 1e-4
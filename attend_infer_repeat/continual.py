@@ -0,0 +1,156 @@
+"""Continual training of AIR on images that keep arriving, instead of retraining from scratch.
+
+Run from `attend_infer_repeat`, with new scenes written as `.npy` files to `incoming/`:
+
+    python continual.py --watch_dir incoming --logdir ../results/continual
+
+or sent to a local port with `data.stream.send_images(('localhost', 5555), imgs)`:
+
+    python continual.py --port 5555 --logdir ../results/continual
+
+Images go into a `data.stream.ReplayBuffer`, and every training step uses a batch sampled from it. Training resumes
+from the latest checkpoint in `logdir` (or `--init_checkpoint`, e.g. a model trained by `scripts/multi_mnist.py`),
+saves a checkpoint every `--checkpoint_interval` steps and appends loss, ingest rate, buffer occupancy and training
+lag to `metrics.jsonl` in `logdir`.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import tensorflow as tf
+
+from data.stream import ReplayBuffer, DirectoryStream, SocketStream
+from mnist_model import AIRonMNIST
+from profiling import default_priors
+
+
+class ContinualTrainer(object):
+    """Trains `AIRonMNIST` on batches sampled from `buffer`.
+
+    :param init_checkpoint: restored if `logdir` has no checkpoint yet; variables are initialised randomly if None
+    """
+
+    def __init__(self, buffer, logdir, batch_size=64, max_steps=3, learning_rate=1e-4, checkpoint_interval=1000,
+                 log_every=100, init_checkpoint=None, **model_kwargs):
+        self.buffer = buffer
+        self.logdir = logdir
+        self.batch_size = batch_size
+        self.checkpoint_interval = checkpoint_interval
+        self.log_every = log_every
+        self.checkpoint_path = os.path.join(logdir, 'model.ckpt')
+        self.metrics_path = os.path.join(logdir, 'metrics.jsonl')
+
+        obs = tf.py_func(lambda: buffer.sample(batch_size), [], tf.float32, stateful=True)
+        obs.set_shape((batch_size,) + buffer.img_size)
+        self.air = AIRonMNIST(obs, None, max_steps=max_steps, **model_kwargs)
+        self.train_step, self.global_step = self.air.train_step(learning_rate, guard_numerics=True,
+                                                                **default_priors())
+
+        self.sess = tf.Session()
+        self.saver = tf.train.Saver(max_to_keep=5)
+        self.restore(init_checkpoint)
+
+    def restore(self, init_checkpoint=None):
+        checkpoint = tf.train.latest_checkpoint(self.logdir) or init_checkpoint
+        self.sess.run(tf.global_variables_initializer())
+        if checkpoint is not None:
+            self.saver.restore(self.sess, checkpoint)
+        return checkpoint
+
+    def save(self):
+        return self.saver.save(self.sess, self.checkpoint_path, global_step=self.global_step)
+
+    def wait_for_data(self, min_size, timeout=None):
+        """Blocks until the buffer holds `min_size` images; returns False if that takes longer than `timeout`."""
+        start = time.time()
+        while self.buffer.size < min_size:
+            if timeout is not None and time.time() - start > timeout:
+                return False
+            time.sleep(.1)
+        return True
+
+    def run(self, n_iter=None):
+        """Trains for `n_iter` steps or until interrupted; saves a checkpoint at the end."""
+        i, start_step = 0, self.step
+        try:
+            while n_iter is None or i < n_iter:
+                i += 1
+                if i % self.log_every == 0:
+                    _, loss = self.sess.run([self.train_step, self.air.loss.value])
+                    self.log(loss)
+                else:
+                    self.sess.run(self.train_step)
+
+                # every training step advances the global step, even if `guard_numerics` skips its update
+                if (start_step + i) % self.checkpoint_interval == 0:
+                    self.save()
+        except KeyboardInterrupt:
+            pass
+        return self.save()
+
+    @property
+    def step(self):
+        return int(self.sess.run(self.global_step))
+
+    def log(self, loss):
+        metrics = dict(step=self.step, loss=float(loss), time=time.time(), **self.buffer.metrics())
+        with open(self.metrics_path, 'a') as f:
+            f.write(json.dumps(metrics) + '\n')
+
+        print 'step {step}: loss {loss:.2f}, ingest {ingest_rate:.1f} img/s, occupancy {occupancy:.2f}, ' \
+              'training lag {training_lag:.1f}s'.format(**metrics)
+        return metrics
+
+    def close(self):
+        self.sess.close()
+
+
+def main(argv=None):
+    from mnist_model import multi_mnist_kwargs
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--watch_dir', help='directory that new `.npy` files are written to')
+    source.add_argument('--port', type=int, help='local port to receive images on')
+    parser.add_argument('--logdir', required=True)
+    parser.add_argument('--init_checkpoint', default=None)
+    parser.add_argument('--capacity', type=int, default=50000, help='number of images in the replay buffer')
+    parser.add_argument('--min_size', type=int, default=1000, help='number of images before training starts')
+    parser.add_argument('--batch_size', type=int, default=64)
+    parser.add_argument('--max_steps', type=int, default=3)
+    parser.add_argument('--img_size', type=int, nargs=2, default=[50, 50])
+    parser.add_argument('--checkpoint_interval', type=int, default=1000)
+    parser.add_argument('--log_every', type=int, default=100)
+    parser.add_argument('--max_train_iter', type=int, default=0, help='0 trains until interrupted')
+    parser.add_argument('--model_kwargs', default='{}',
+                        help='JSON dict overriding the hyperparameters in `mnist_model.multi_mnist_kwargs`')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.logdir):
+        os.makedirs(args.logdir)
+
+    buffer = ReplayBuffer(args.capacity, args.img_size)
+    if args.watch_dir is not None:
+        source = DirectoryStream(args.watch_dir, buffer)
+    else:
+        source = SocketStream(buffer, port=args.port)
+
+    model_kwargs = dict(multi_mnist_kwargs, **json.loads(args.model_kwargs))
+    trainer = ContinualTrainer(buffer, args.logdir, args.batch_size, args.max_steps,
+                               checkpoint_interval=args.checkpoint_interval, log_every=args.log_every,
+                               init_checkpoint=args.init_checkpoint, **model_kwargs)
+
+    with source:
+        print 'Waiting for {} images'.format(args.min_size)
+        trainer.wait_for_data(args.min_size)
+        path = trainer.run(args.max_train_iter or None)
+
+    print 'Saved "{}"'.format(path)
+    trainer.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
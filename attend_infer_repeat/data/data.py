@@ -1,14 +1,12 @@
 import os
 import sys
+import shutil
 import numpy as np
 import itertools
 import cPickle as pickle
 
 import tensorflow as tf
 from tensorflow.python.util import nest
-from tensorflow.examples.tutorials.mnist import input_data
-
-from scipy.misc import imresize
 
 
 _this_dir = os.path.dirname(__file__)
@@ -33,7 +31,18 @@ def template_dimensions(template):
 
 
 def create_mnist(partition='train', canvas_size=(50, 50), obj_size=(28, 28), n_objects=(0, 2), n_samples=None,
-                 dtype=np.uint8, expand_nums=True, with_overlap=False):
+                 dtype=np.uint8, expand_nums=False, with_overlap=False):
+    """Creates images with up to `max(n_objects)` digits.
+
+    :param expand_nums: if True, `nums` are stored in the legacy format [max_objects + 1, n_samples, 1] with ones
+        at the first `n` steps instead of counts
+    :return: dict with `imgs`, `labels`, `nums` [n_samples] and `boxes` [n_samples, max_objects, 4]: tight
+        ground-truth boxes of the digits as [y, x, height, width] in pixels, where a box [y, x, h, w] covers rows
+        y to y + h - 1
+    """
+
+    from scipy.misc import imresize
+    from tensorflow.examples.tutorials.mnist import input_data
 
     mnist = input_data.read_data_sets(_MNIST_PATH, one_hot=False)
     mnist_data = getattr(mnist, partition)
@@ -48,6 +57,7 @@ def create_mnist(partition='train', canvas_size=(50, 50), obj_size=(28, 28), n_o
 
     imgs = np.zeros((n_samples,) + tuple(canvas_size), dtype=dtype)
     labels = np.zeros((n_samples, n_objects[-1]), dtype=np.uint8)
+    boxes = np.zeros((n_samples, n_objects[-1], 4), dtype=np.float32)
     nums = np.random.randint(max_objects + 1, size=n_samples, dtype=np.uint8)
 
     templates = np.reshape(mnist_data.images, (-1, 28, 28))
@@ -90,6 +100,7 @@ def create_mnist(partition='train', canvas_size=(50, 50), obj_size=(28, 28), n_o
                         break
 
                 imgs[i, p[0]:p[0]+size[0], p[1]:p[1]+size[1]] = template[st[0]:st[0]+size[0], st[1]:st[1]+size[1]]
+                boxes[i, j] = p[0], p[1], size[0], size[1]
                 occupancy[p[0]:p[0]+size[0], p[1]:p[1]+size[1]] = True
 
         if not retry:
@@ -104,17 +115,103 @@ def create_mnist(partition='train', canvas_size=(50, 50), obj_size=(28, 28), n_o
             expanded[:n, i] = 1
         nums = expanded
 
-    return dict(imgs=imgs, labels=labels, nums=nums)
+    return dict(imgs=imgs, labels=labels, nums=nums, boxes=boxes)
+
 
+def create_moving_mnist(partition='validation', n_sequences=1000, n_frames=10, canvas_size=(50, 50),
+                        obj_size=(28, 28), n_objects=(0, 2), max_speed=2., dtype=np.uint8):
+    """Creates sequences of frames with digits moving at constant speed and bouncing off the canvas borders.
 
-def load_data(path, data_path=_MNIST_PATH):
+    :return: dict with `imgs` [n_sequences, n_frames, height, width], `labels` [n_sequences, max_objects],
+        `nums` [n_sequences] and `positions` [n_sequences, n_frames, max_objects, 2] (top-left corners in pixels)
+    """
+    from scipy.misc import imresize
+    from tensorflow.examples.tutorials.mnist import input_data
+
+    mnist = input_data.read_data_sets(_MNIST_PATH, one_hot=False)
+    mnist_data = getattr(mnist, partition)
+    templates = np.reshape(mnist_data.images, (-1, 28, 28))
+
+    n_objects = nest.flatten(n_objects)
+    max_objects = max(n_objects)
+    canvas_size = np.asarray(canvas_size)
+
+    imgs = np.zeros((n_sequences, n_frames) + tuple(canvas_size), dtype=dtype)
+    labels = np.zeros((n_sequences, max_objects), dtype=np.uint8)
+    nums = np.random.randint(min(n_objects), max_objects + 1, size=n_sequences).astype(np.uint8)
+    positions = np.zeros((n_sequences, n_frames, max_objects, 2), dtype=np.float32)
+
+    for i in xrange(n_sequences):
+        for j, idx in enumerate(np.random.choice(mnist_data.num_examples, nums[i], replace=False)):
+            labels[i, j] = mnist_data.labels[idx]
+            template = imresize(templates[idx], obj_size)
+            st, size = template_dimensions(template)
+            template = template[st[0]:st[0] + size[0], st[1]:st[1] + size[1]]
+
+            position_range = canvas_size - size
+            p = np.random.rand(2) * position_range
+            angle = np.random.rand() * 2 * np.pi
+            v = np.random.rand() * max_speed * np.asarray([np.sin(angle), np.cos(angle)])
+
+            for t in xrange(n_frames):
+                y, x = np.round(p).astype(np.int32)
+                frame = imgs[i, t, y:y + size[0], x:x + size[1]]
+                np.maximum(frame, template, out=frame)
+                positions[i, t, j] = p
+
+                p = p + v
+                bounce = (p < 0) | (p > position_range)
+                v[bounce] *= -1
+                p = np.clip(p, 0, position_range)
+
+    return dict(imgs=imgs, labels=labels, nums=nums, positions=positions)
+
+
+def load_data(path, data_path=_MNIST_PATH, mmap=False):
+    """Loads a dataset pickle with images scaled to [0, 1].
+
+    If `mmap` is True, the converted arrays are written as `.npy` files into a directory next to the pickle on
+    first use and memory-mapped read-only from there, so that processes training in parallel share one copy
+    of the data in the page cache.
+    """
     path = os.path.join(data_path, path)
+    if mmap:
+        return _load_mmap(path)
 
     with open(path) as f:
         data = pickle.load(f)
 
     data['imgs'] = data['imgs'].astype(np.float32) / 255.
-    data['nums'] = data['nums'].astype(np.float32)
+    data['nums'] = compact_nums(data['nums'])
+    return data
+
+
+def compact_nums(nums):
+    """Number of objects per sample as uint8 [n_samples], from counts or the expanded format of `create_mnist`."""
+    nums = np.asarray(nums)
+    if nums.ndim == 3:
+        nums = nums.sum(0)[:, 0]
+    return nums.astype(np.uint8)
+
+
+def _load_mmap(path):
+    npy_dir = os.path.splitext(path)[0] + '_npy'
+    if not os.path.exists(npy_dir):
+        data = load_data(path, data_path='')
+        # written to a temporary directory and renamed, so that concurrent readers never see partial files
+        tmp_dir = '{}.tmp{}'.format(npy_dir, os.getpid())
+        os.makedirs(tmp_dir)
+        for k, v in data.iteritems():
+            np.save(os.path.join(tmp_dir, k + '.npy'), v)
+        try:
+            os.rename(tmp_dir, npy_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir)
+
+    data = {os.path.splitext(f)[0]: np.load(os.path.join(npy_dir, f), mmap_mode='r')
+            for f in os.listdir(npy_dir) if f.endswith('.npy')}
+    # directories written before counts were stored compactly
+    data['nums'] = compact_nums(data['nums'])
     return data
 
 
@@ -124,7 +221,7 @@ def tensors_from_data(data_dict, batch_size, axes=None, shuffle=False):
         axes = {k: 0 for k in keys}
 
     key = keys[0]
-    ax = axes[key]
+    ax = axes.get(key, 0)
     n_entries = data_dict[key].shape[ax]
 
     if shuffle:
@@ -143,7 +240,7 @@ def tensors_from_data(data_dict, batch_size, axes=None, shuffle=False):
         minibatch = []
         for k in keys:
             item = data_dict[k]
-            minibatch_item = item.take(idx, axes[k])
+            minibatch_item = item.take(idx, axes.get(k, 0))
             minibatch.append(minibatch_item)
         return minibatch
 
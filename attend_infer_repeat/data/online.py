@@ -0,0 +1,279 @@
+"""Multi-MNIST scenes synthesised on the fly by worker processes.
+
+Workers place digits with the same logic as `create_mnist`, but for a whole batch at once, and write the
+batches straight into a ring buffer in shared memory. The training process reads batches in place: nothing is
+pickled or sent through pipes. If the workers fall behind, the last batch is used again instead of waiting, so
+training never stalls on data; `OnlineScenes.metrics` reports how often that happens.
+
+    with OnlineScenes(SceneSynthesiser.from_mnist('train'), batch_size=64, n_workers=4) as scenes:
+        tensors = scenes.tensors()
+
+Workers are forked, so this works only where `multiprocessing` forks (Linux, macOS).
+"""
+import time
+import ctypes
+import multiprocessing
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.python.util import nest
+
+from data import template_dimensions
+
+
+class SceneSynthesiser(object):
+    """Places digit templates on an empty canvas, a batch at a time.
+
+    :param templates: np.array of shape [n_templates, height, width], already resized to the object size;
+        uint8 templates are scaled to [0, 1]
+    :param n_objects: int or iterable of ints; the number of objects is uniform in [0, max(n_objects)], as in
+        `create_mnist`
+    :param with_overlap: if False, object placement is resampled until bounding boxes don't overlap; an image
+        is started over with new templates after `n_tries` unsuccessful attempts
+    """
+
+    def __init__(self, templates, canvas_size=(50, 50), n_objects=(0, 2), with_overlap=False, n_tries=5):
+        templates = np.asarray(templates)
+        if templates.dtype == np.uint8:
+            templates = templates.astype(np.float32) / 255.
+
+        self.canvas_size = tuple(canvas_size)
+        self.max_objects = max(nest.flatten(n_objects))
+        self.with_overlap = with_overlap
+        self.n_tries = n_tries
+
+        starts, sizes = zip(*[template_dimensions(t) for t in templates])
+        self.starts = np.asarray(starts, dtype=np.int32)
+        self.sizes = np.asarray(sizes, dtype=np.int32)
+        self.templates = templates.astype(np.float32)
+
+    @classmethod
+    def from_mnist(cls, partition='train', obj_size=(28, 28), **kwargs):
+        from scipy.misc import imresize
+        from tensorflow.examples.tutorials.mnist import input_data
+        from data import _MNIST_PATH
+
+        mnist_data = getattr(input_data.read_data_sets(_MNIST_PATH, one_hot=False), partition)
+        templates = np.reshape(mnist_data.images, (-1, 28, 28))
+        templates = np.stack([imresize(t, obj_size) for t in templates])
+        return cls(templates, **kwargs)
+
+    def batch_arrays(self, batch_size):
+        """Shapes and dtypes of one batch, in the format of `load_data`."""
+        return dict(
+            imgs=((batch_size,) + self.canvas_size, np.float32),
+            nums=((batch_size,), np.uint8),
+            boxes=((batch_size, self.max_objects, 4), np.float32)
+        )
+
+    def _positions(self, sizes, rng):
+        position_range = np.asarray(self.canvas_size) - sizes
+        return np.round(rng.rand(*sizes.shape) * position_range).astype(np.int32)
+
+    def _overlaps(self, positions, sizes, present):
+        """Objects whose box overlaps the box of an earlier object in the same image, [batch_size, max_objects]."""
+        start, end = positions[:, :, np.newaxis], (positions + sizes)[:, :, np.newaxis]
+        overlap = ((start < end.swapaxes(1, 2)) & (start.swapaxes(1, 2) < end)).all(-1)
+        overlap &= present[:, :, np.newaxis] & present[:, np.newaxis, :]
+        earlier = np.tril(np.ones((self.max_objects,) * 2, dtype=bool), -1)
+        return (overlap & earlier).any(-1)
+
+    def fill(self, imgs, nums, boxes, rng=np.random):
+        """Writes a new batch into the given arrays, see `batch_arrays`."""
+        batch_size = imgs.shape[0]
+        n = rng.randint(self.max_objects + 1, size=batch_size)
+        present = np.arange(self.max_objects)[np.newaxis] < n[:, np.newaxis]
+
+        idx = rng.randint(len(self.templates), size=(batch_size, self.max_objects))
+        sizes = self.sizes[idx]
+        positions = self._positions(sizes, rng)
+
+        tries = np.zeros(batch_size, dtype=np.int32)
+        while not self.with_overlap:
+            clash = self._overlaps(positions, sizes, present)
+            if not clash.any():
+                break
+
+            tries += clash.any(1)
+            restart = tries > self.n_tries
+            if restart.any():
+                idx[restart] = rng.randint(len(self.templates), size=(restart.sum(), self.max_objects))
+                sizes = self.sizes[idx]
+                clash[restart] = True
+                tries[restart] = 0
+
+            positions = np.where(clash[..., np.newaxis], self._positions(sizes, rng), positions)
+
+        imgs[...] = 0.
+        for i, j in zip(*np.nonzero(present)):
+            (y, x), (h, w), (sy, sx) = positions[i, j], sizes[i, j], self.starts[idx[i, j]]
+            patch = imgs[i, y:y + h, x:x + w]
+            np.maximum(patch, self.templates[idx[i, j], sy:sy + h, sx:sx + w], out=patch)
+
+        boxes[...] = np.where(present[..., np.newaxis], np.concatenate((positions, sizes), -1), 0)
+        nums[...] = n
+
+
+class SharedRingBuffer(object):
+    """Fixed-size batches in shared memory, written by any number of producer processes and read by one consumer.
+
+    Producers fill free slots or, when the consumer falls behind, overwrite the oldest unread batch. The consumer
+    takes unread batches in the order they were written and keeps the slot it reads from until the next `read`;
+    if no new batch is ready, it reads the same slot again.
+
+    :param arrays: dict of name -> (shape, dtype) of one batch
+    """
+    FREE, WRITING, READY, READING = range(4)
+
+    def __init__(self, n_slots, arrays):
+        self.n_slots = n_slots
+        self._raw = {}
+        self._slots = {}
+        for name, (shape, dtype) in arrays.iteritems():
+            dtype = np.dtype(dtype)
+            raw = multiprocessing.RawArray(ctypes.c_byte, n_slots * int(np.prod(shape)) * dtype.itemsize)
+            self._raw[name] = raw
+            self._slots[name] = np.frombuffer(raw, dtype=dtype).reshape((n_slots,) + tuple(shape))
+
+        self._state = multiprocessing.RawArray(ctypes.c_int, n_slots)
+        self._seq = multiprocessing.RawArray(ctypes.c_long, n_slots)
+        self._n_written = multiprocessing.RawValue(ctypes.c_long, 0)
+        self._changed = multiprocessing.Condition(multiprocessing.Lock())
+
+        # consumer state, only used in the reading process
+        self._held = None
+        self.n_read = 0
+        self.n_reused = 0
+
+    def slot(self, i):
+        return {k: v[i] for k, v in self._slots.iteritems()}
+
+    def acquire_write(self, timeout=None):
+        """Reserves a slot for writing; returns its index or None if no slot was available within `timeout`."""
+        with self._changed:
+            while True:
+                free = [i for i in xrange(self.n_slots) if self._state[i] == self.FREE]
+                ready = [i for i in xrange(self.n_slots) if self._state[i] == self.READY]
+                if free or ready:
+                    i = free[0] if free else min(ready, key=lambda i: self._seq[i])
+                    self._state[i] = self.WRITING
+                    return i
+                if not self._wait(timeout):
+                    return None
+
+    def commit_write(self, i):
+        with self._changed:
+            self._n_written.value += 1
+            self._seq[i] = self._n_written.value
+            self._state[i] = self.READY
+            self._changed.notify_all()
+
+    def read(self, timeout=None):
+        """Returns the next batch as views into shared memory, valid until the next call.
+
+        Waits only until the very first batch is written; raises RuntimeError if that takes longer than `timeout`.
+        """
+        with self._changed:
+            while True:
+                ready = [i for i in xrange(self.n_slots) if self._state[i] == self.READY]
+                if ready:
+                    if self._held is not None:
+                        self._state[self._held] = self.FREE
+                        self._changed.notify_all()
+                    self._held = min(ready, key=lambda i: self._seq[i])
+                    self._state[self._held] = self.READING
+                    break
+                if self._held is not None:
+                    self.n_reused += 1
+                    break
+                if not self._wait(timeout):
+                    raise RuntimeError('No batch was written within {}s'.format(timeout))
+
+        self.n_read += 1
+        return self.slot(self._held)
+
+    @property
+    def n_written(self):
+        return self._n_written.value
+
+    def _wait(self, timeout):
+        start = time.time()
+        self._changed.wait(.1 if timeout is None else timeout)
+        return timeout is None or time.time() - start < timeout
+
+
+def _produce(buffer, synthesiser, seed, stop):
+    rng = np.random.RandomState(seed)
+    while not stop.is_set():
+        i = buffer.acquire_write(timeout=.1)
+        if i is not None:
+            synthesiser.fill(rng=rng, **buffer.slot(i))
+            buffer.commit_write(i)
+
+
+class OnlineScenes(object):
+    """Endless training data: `n_workers` processes fill a `SharedRingBuffer` with batches from `synthesiser`.
+
+    :param n_slots: int, defaults to two slots per worker plus two, so that every worker can write while the
+        consumer holds a batch and a finished batch is waiting
+    """
+
+    def __init__(self, synthesiser, batch_size, n_workers=2, n_slots=None, seed=None):
+        self.synthesiser = synthesiser
+        self.batch_size = batch_size
+        self.n_workers = n_workers
+        self.seed = np.random.randint(1 << 30) if seed is None else seed
+        self.buffer = SharedRingBuffer(n_slots or 2 * n_workers + 2, synthesiser.batch_arrays(batch_size))
+
+        self._stop = multiprocessing.Event()
+        self._workers = []
+
+    def start(self):
+        self._stop.clear()
+        for w in xrange(self.n_workers):
+            worker = multiprocessing.Process(target=_produce, args=(self.buffer, self.synthesiser, self.seed + w,
+                                                                    self._stop))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for worker in self._workers:
+            worker.join(1.)
+            if worker.is_alive():
+                worker.terminate()
+        self._workers = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def next_batch(self, timeout=60.):
+        return self.buffer.read(timeout)
+
+    def tensors(self, keys=('imgs', 'nums')):
+        """Tensors with a new batch every time they are evaluated, in the format of `tensors_from_data`."""
+        shapes = self.synthesiser.batch_arrays(self.batch_size)
+
+        def data_fun():
+            batch = self.next_batch()
+            return [batch[k] for k in keys]
+
+        types = [tf.as_dtype(shapes[k][1]) for k in keys]
+        tensors = tf.py_func(data_fun, [], types, stateful=True)
+        for t, k in zip(tensors, keys):
+            t.set_shape(shapes[k][0])
+        return dict(zip(keys, tensors))
+
+    def metrics(self):
+        n_read = self.buffer.n_read
+        return dict(
+            written=self.buffer.n_written,
+            read=n_read,
+            reused=self.buffer.n_reused,
+            reused_fraction=self.buffer.n_reused / float(max(n_read, 1))
+        )
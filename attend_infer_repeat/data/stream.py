@@ -0,0 +1,299 @@
+"""Images arriving continuously from a local source, kept in a bounded replay buffer.
+
+A source runs in a background thread and adds every image it receives to a `ReplayBuffer`, which keeps a uniform
+sample of everything seen so far (reservoir sampling) in a fixed amount of memory:
+
+    buffer = ReplayBuffer(10000, (50, 50))
+    source = DirectoryStream('incoming', buffer).start()
+    imgs = buffer.sample(64)
+
+`DirectoryStream` picks up `.npy` files written to a directory; `SocketStream` listens on a local TCP port for
+arrays sent with `send_images`. Both accept a single image [height, width] or a batch [n, height, width] with
+intensities in [0, 1] (or uint8 in [0, 255]).
+"""
+import os
+import io
+import glob
+import time
+import socket
+import struct
+import threading
+import collections
+
+import numpy as np
+
+
+class ReplayBuffer(object):
+    """A uniform sample of at most `capacity` images of all images added so far.
+
+    Images are quantised to uint8, which takes a quarter of the memory of float32 and is the precision of MNIST.
+    Reservoir sampling: the first `capacity` images are stored, and the n-th image after that replaces a random
+    stored one with probability capacity / n, so that every image seen so far is equally likely to be stored.
+
+    Training lag is the time between the arrival of an image and the first batch it is sampled into.
+    """
+
+    def __init__(self, capacity, img_size, rate_window=10., seed=None):
+        self.capacity = capacity
+        self.img_size = tuple(img_size)
+        self._imgs = np.zeros((capacity,) + self.img_size, dtype=np.uint8)
+        self._arrival = np.zeros(capacity)
+        self._sampled = np.zeros(capacity, dtype=bool)
+        self._rng = np.random.RandomState(seed)
+        self._lock = threading.Lock()
+
+        self.size = 0
+        self.n_seen = 0
+        self.n_sampled = 0
+        self._rate_window = rate_window
+        self._arrivals = collections.deque()
+        self._lags = collections.deque(maxlen=1000)
+
+    def add(self, imgs):
+        """Adds an image or a batch of images."""
+        imgs = np.asarray(imgs)
+        if imgs.ndim == len(self.img_size):
+            imgs = imgs[np.newaxis]
+        if imgs.shape[1:] != self.img_size:
+            raise ValueError('Expected images of size {}, got {}'.format(self.img_size, imgs.shape[1:]))
+        if imgs.dtype != np.uint8:
+            imgs = np.round(np.clip(imgs, 0., 1.) * 255).astype(np.uint8)
+
+        now = time.time()
+        with self._lock:
+            for img in imgs:
+                self.n_seen += 1
+                if self.size < self.capacity:
+                    slot = self.size
+                    self.size += 1
+                else:
+                    slot = self._rng.randint(self.n_seen)
+                    if slot >= self.capacity:
+                        continue
+
+                self._imgs[slot] = img
+                self._arrival[slot] = now
+                self._sampled[slot] = False
+
+            self._arrivals.append((now, len(imgs)))
+
+    def sample(self, batch_size):
+        """A batch of float32 images drawn uniformly with replacement from the stored ones."""
+        with self._lock:
+            if self.size == 0:
+                raise ValueError('The buffer is empty')
+
+            idx = self._rng.randint(self.size, size=batch_size)
+            first = np.unique(idx[~self._sampled[idx]])
+            now = time.time()
+            self._lags.extend(now - self._arrival[first])
+            self._sampled[first] = True
+            self.n_sampled += batch_size
+            imgs = self._imgs[idx]
+        return imgs.astype(np.float32) / 255.
+
+    def metrics(self):
+        with self._lock:
+            now = time.time()
+            while self._arrivals and self._arrivals[0][0] < now - self._rate_window:
+                self._arrivals.popleft()
+
+            return dict(
+                seen=self.n_seen,
+                sampled=self.n_sampled,
+                occupancy=self.size / float(self.capacity),
+                ingest_rate=sum(n for _, n in self._arrivals) / self._rate_window,
+                never_sampled=int(self.size - self._sampled[:self.size].sum()),
+                training_lag=float(np.mean(self._lags)) if self._lags else float('nan')
+            )
+
+
+class _StreamSource(object):
+    """Runs `_poll` in a background thread until stopped; `_poll` returns arrays to add to the buffer."""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.n_errors = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5.)
+        self._close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _run(self):
+        while not self._stop.is_set():
+            for imgs in self._poll():
+                try:
+                    self.buffer.add(imgs)
+                except ValueError:
+                    self.n_errors += 1
+
+    def _poll(self):
+        raise NotImplementedError
+
+    def _close(self):
+        pass
+
+
+class DirectoryStream(_StreamSource):
+    """Adds every `.npy` file that appears in `path`, in the order of modification times.
+
+    Files are read once they haven't changed for `settle_time` seconds, so that partially written files are
+    skipped; they are deleted after reading if `remove` is True. Files that can't be loaded are retried on the
+    next polls and moved to `quarantine_dir` (`path/failed` by default) after `max_attempts` failures.
+
+    Without `remove`, read files are remembered by a high-water mark of their modification times, so memory use
+    doesn't grow with the number of files; new files are expected to be newer than the ones read before.
+    """
+
+    def __init__(self, path, buffer, pattern='*.npy', poll_interval=.5, settle_time=.1, remove=False,
+                 max_attempts=3, quarantine_dir=None):
+        super(DirectoryStream, self).__init__(buffer)
+        self.path = path
+        self.pattern = pattern
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.remove = remove
+        self.max_attempts = max_attempts
+        self.quarantine_dir = quarantine_dir or os.path.join(path, 'failed')
+        self.n_quarantined = 0
+
+        self._high_water = None
+        # files read with a modification time equal to the high-water mark
+        self._at_high_water = set()
+        self._failures = {}
+
+    def _is_new(self, name, mtime):
+        if name in self._failures or self._high_water is None or mtime > self._high_water:
+            return True
+        return mtime == self._high_water and name not in self._at_high_water
+
+    def _mark_read(self, name, mtime):
+        if self._high_water is None or mtime > self._high_water:
+            self._high_water = mtime
+            self._at_high_water = {name}
+        elif mtime == self._high_water:
+            self._at_high_water.add(name)
+
+    def _failed(self, name, mtime):
+        self.n_errors += 1
+        n_attempts = self._failures.get(name, 0) + 1
+        if n_attempts < self.max_attempts:
+            self._failures[name] = n_attempts
+            return
+
+        del self._failures[name]
+        try:
+            if not os.path.exists(self.quarantine_dir):
+                os.makedirs(self.quarantine_dir)
+            os.rename(name, os.path.join(self.quarantine_dir, os.path.basename(name)))
+            self.n_quarantined += 1
+        except OSError:
+            self._mark_read(name, mtime)
+
+    def _poll(self):
+        self._stop.wait(self.poll_interval)
+
+        now = time.time()
+        files = []
+        for name in glob.glob(os.path.join(self.path, self.pattern)):
+            try:
+                mtime = os.path.getmtime(name)
+            except OSError:
+                continue
+            if mtime < now - self.settle_time and self._is_new(name, mtime):
+                files.append((mtime, name))
+
+        arrays = []
+        for mtime, name in sorted(files):
+            try:
+                arrays.append(np.load(name))
+            except (IOError, ValueError):
+                self._failed(name, mtime)
+                continue
+
+            self._failures.pop(name, None)
+            if self.remove:
+                try:
+                    os.remove(name)
+                    continue
+                except OSError:
+                    pass
+            self._mark_read(name, mtime)
+        return arrays
+
+
+def send_images(address, imgs):
+    """Sends an image or a batch of images to a `SocketStream` listening on `address` = (host, port)."""
+    f = io.BytesIO()
+    np.save(f, np.asarray(imgs))
+    data = f.getvalue()
+
+    sock = socket.create_connection(address)
+    try:
+        sock.sendall(struct.pack('>Q', len(data)) + data)
+    finally:
+        sock.close()
+
+
+class SocketStream(_StreamSource):
+    """Listens on a local TCP port; every connection sends one array as its length (8 bytes) and `.npy` bytes.
+
+    A stand-in for a message queue: run with port 0 to pick a free port, see `address`.
+    """
+
+    def __init__(self, buffer, host='localhost', port=0, timeout=.5):
+        super(SocketStream, self).__init__(buffer)
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((host, port))
+        self._server.listen(16)
+        self._server.settimeout(timeout)
+        self.address = self._server.getsockname()
+
+    def _poll(self):
+        try:
+            conn, _ = self._server.accept()
+        except socket.timeout:
+            return []
+
+        try:
+            conn.settimeout(10.)
+            header = _receive(conn, 8)
+            data = _receive(conn, struct.unpack('>Q', header)[0])
+            return [np.load(io.BytesIO(data))]
+        except (socket.error, IOError, ValueError, struct.error):
+            self.n_errors += 1
+            return []
+        finally:
+            conn.close()
+
+    def _close(self):
+        self._server.close()
+
+
+def _receive(conn, n_bytes):
+    chunks, n_received = [], 0
+    while n_received < n_bytes:
+        chunk = conn.recv(min(n_bytes - n_received, 1 << 20))
+        if not chunk:
+            raise IOError('Connection closed after {} of {} bytes'.format(n_received, n_bytes))
+        chunks.append(chunk)
+        n_received += len(chunk)
+    return ''.join(chunks)
@@ -0,0 +1,156 @@
+"""Localisation quality of AIR: `where` codes as boxes, matched to ground-truth boxes.
+
+Run from `attend_infer_repeat` on a dataset created with ground-truth boxes:
+
+    python export.py --checkpoint ../results/multi_mnist/model.ckpt-300000 --output air.pb
+    python detection.py --model air.pb --data mnist_validation.pickle
+
+Everything below `evaluate` is vectorised over the dataset; boxes are [y, x, height, width] in pixels, where
+pixel (i, j) covers [i, i + 1) x [j, j + 1).
+"""
+import sys
+import time
+import itertools
+import argparse
+
+import numpy as np
+
+
+def where_to_boxes(where, img_size):
+    """Turns `where` codes [..., 4] = (sx, tx, sy, ty) into boxes [..., 4] = (y, x, height, width)."""
+    height, width = img_size
+    sx, tx, sy, ty = np.split(np.asarray(where, dtype=np.float32), 4, -1)
+    x = width * (1. - sx + tx) / 2
+    y = height * (1. - sy + ty) / 2
+    return np.concatenate((y, x, height * sy, width * sx), -1)
+
+
+def iou(a, b):
+    """Intersection over union of every pair of boxes from a [..., n, 4] and b [..., m, 4]; returns [..., n, m]."""
+    a, b = a[..., :, np.newaxis, :], b[..., np.newaxis, :, :]
+    top = np.maximum(a[..., 0], b[..., 0])
+    left = np.maximum(a[..., 1], b[..., 1])
+    bottom = np.minimum(a[..., 0] + a[..., 2], b[..., 0] + b[..., 2])
+    right = np.minimum(a[..., 1] + a[..., 3], b[..., 1] + b[..., 3])
+
+    intersection = np.maximum(bottom - top, 0.) * np.maximum(right - left, 0.)
+    union = a[..., 2] * a[..., 3] + b[..., 2] * b[..., 3] - intersection
+    return intersection / np.maximum(union, 1e-8)
+
+
+def match(ious, pred_valid, gt_valid):
+    """Assigns predictions to ground-truth objects, maximising the total IoU per image.
+
+    The number of objects per image is small, so all assignments are enumerated at once for every image.
+
+    :param ious: [n_imgs, n_pred, n_gt]
+    :param pred_valid: boolean [n_imgs, n_pred], e.g. presence
+    :param gt_valid: boolean [n_imgs, n_gt]
+    :return: int array [n_imgs, n_pred] with the index of the matched ground-truth object or -1
+    """
+    n_imgs, n_pred, n_gt = ious.shape
+    k = max(n_pred, n_gt)
+    if k > 8:
+        raise ValueError('Exhaustive matching of {} objects per image is too expensive'.format(k))
+
+    square = np.zeros((n_imgs, k, k), dtype=np.float32)
+    valid = pred_valid[:, :, np.newaxis] & gt_valid[:, np.newaxis, :]
+    square[:, :n_pred, :n_gt] = np.where(valid, ious, 0.)
+
+    perms = np.asarray(list(itertools.permutations(range(k))))
+    # total IoU of every assignment for every image: [n_imgs, n_perms]
+    totals = square[:, np.arange(k), perms].sum(-1)
+    best = perms[totals.argmax(1)][:, :n_pred]
+
+    if n_gt == 0:
+        return -np.ones_like(best)
+
+    img_idx, pred_idx = np.indices(best.shape)
+    matched = (best < n_gt) & valid[img_idx, pred_idx, np.minimum(best, n_gt - 1)]
+    return np.where(matched, best, -1)
+
+
+def average_precision(scores, true_positive, n_gt):
+    """Area under the precision-recall curve of detections ranked by `scores` (all-point interpolation)."""
+    if n_gt == 0:
+        return float('nan')
+
+    order = np.argsort(-scores, kind='mergesort')
+    tp = np.cumsum(true_positive[order])
+    fp = np.cumsum(~true_positive[order])
+    recall = np.concatenate(([0.], tp / float(n_gt), [1.]))
+    precision = np.concatenate(([1.], tp / np.maximum(tp + fp, 1e-8), [0.]))
+
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    return float(np.sum(np.diff(recall) * precision[1:]))
+
+
+def evaluate(where, presence, scores, gt_boxes, n_objects, img_size, iou_thresholds=np.arange(.5, 1., .05)):
+    """Detection metrics over a dataset.
+
+    :param where: [n_imgs, max_steps, 4] `where` codes
+    :param presence: [n_imgs, max_steps], detections are steps with presence > .5
+    :param scores: [n_imgs, max_steps] detection confidence, e.g. presence probability
+    :param gt_boxes: [n_imgs, max_objects, 4]
+    :param n_objects: [n_imgs] number of ground-truth objects
+    :return: dict with AP at IoU .5 and .75, AP averaged over `iou_thresholds`, mean IoU of matched pairs and
+        count accuracy
+    """
+    n_objects = np.asarray(n_objects)
+    pred_valid = np.asarray(presence) > .5
+    gt_valid = np.arange(gt_boxes.shape[1])[np.newaxis] < n_objects[:, np.newaxis]
+
+    ious = iou(where_to_boxes(where, img_size), gt_boxes)
+    assignment = match(ious, pred_valid, gt_valid)
+    matched = assignment >= 0
+    img_idx, pred_idx = np.indices(assignment.shape)
+    matched_iou = np.where(matched, ious[img_idx, pred_idx, np.maximum(assignment, 0)], 0.)
+
+    n_gt = int(gt_valid.sum())
+    scores, detection_iou = np.asarray(scores)[pred_valid], matched_iou[pred_valid]
+
+    def ap(threshold):
+        return average_precision(scores, detection_iou >= threshold, n_gt)
+
+    return dict(
+        ap50=ap(.5),
+        ap75=ap(.75),
+        ap=float(np.mean([ap(t) for t in iou_thresholds])),
+        mean_iou=float(matched_iou[matched].mean()) if matched.any() else float('nan'),
+        count_accuracy=float(np.mean(pred_valid.sum(1) == n_objects)),
+        n_detections=int(pred_valid.sum()),
+        n_objects=n_gt
+    )
+
+
+def main(argv=None):
+    from data import load_data
+    from export import load_inference_fn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', required=True, help='graph exported with `export.py`')
+    parser.add_argument('--data', required=True, help='dataset pickle created with ground-truth boxes')
+    args = parser.parse_args(argv)
+
+    data = load_data(args.data)
+    if 'boxes' not in data:
+        print >> sys.stderr, '"{}" has no ground-truth boxes; recreate it with `create_mnist`'.format(args.data)
+        return 1
+
+    infer_fn = load_inference_fn(args.model)
+    start = time.time()
+    outputs = infer_fn(data['imgs'])
+    inference_time = time.time() - start
+
+    start = time.time()
+    # detections are ranked by the presence probability of their step; thresholded presence would tie them all
+    results = evaluate(outputs['where'], outputs['presence'], outputs['presence_prob'], data['boxes'],
+                       data['nums'], infer_fn.img_size)
+    print 'Inference: {:.2f}s, evaluation: {:.2f}s'.format(inference_time, time.time() - start)
+    for k in sorted(results):
+        print '{:>16}: {:.4f}'.format(k, results[k])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,6 +3,8 @@ import sonnet as snt
 import tensorflow as tf
 from tensorflow.contrib.distributions import NormalWithSoftplusScale
 
+from neural import Linear
+
 
 class ParametrisedGaussian(snt.AbstractModule):
 
@@ -13,7 +15,7 @@ class ParametrisedGaussian(snt.AbstractModule):
         self._create_distrib = lambda x, y: NormalWithSoftplusScale(x, y, *args, **kwargs)
 
     def _build(self, inpt):
-        transform = snt.Linear(2 * self._n_params)
+        transform = Linear(2 * self._n_params)
         params = transform(inpt)
         loc, scale = tf.split(params, 2, len(params.get_shape()) - 1)
         distrib = self._create_distrib(loc, scale + self._scale_offset)
@@ -5,13 +5,20 @@ import numpy as np
 import tensorflow as tf
 from tensorflow.python.util import nest
 
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from matplotlib.patches import Rectangle
+from detection import where_to_boxes
+
+
+def _pyplot():
+    # imported on first use: matplotlib takes a large part of the start-up time and the model only needs
+    # `gradient_summaries` from this module
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
 
 
 def rect(bbox, c=None, facecolor='none', label=None, ax=None):
+    from matplotlib.patches import Rectangle
     r = Rectangle((bbox[1], bbox[0]), bbox[3], bbox[2],
                   edgecolor=c, facecolor=facecolor, label=label)
 
@@ -21,11 +28,9 @@ def rect(bbox, c=None, facecolor='none', label=None, ax=None):
 
 
 def rect_stn(ax, width, height, w, c=None):
-    sx, tx, sy, ty = w
-    x = width * (1. - sx + tx) / 2
-    y = height * (1. - sy + ty) / 2
-    bbox = [y - .5, x - .5, height * sy, width * sx]
-    rect(bbox, c, ax=ax)
+    y, x, h, w = where_to_boxes(w, (height, width))
+    # imshow puts pixel centres at integer coordinates
+    rect([y - .5, x - .5, h, w], c, ax=ax)
 
 
 def make_fig(air, sess, checkpoint_dir=None, global_step=None, n_samples=10):
@@ -38,6 +43,7 @@ def make_fig(air, sess, checkpoint_dir=None, global_step=None, n_samples=10):
     bs = min(n_samples, air.batch_size)
     scale = 1.5
     figsize = scale * np.asarray((bs, 2 * n_steps + 1))
+    plt = _pyplot()
     fig, axes = plt.subplots(2 * n_steps + 1, bs, figsize=figsize)
 
     for i, ax in enumerate(axes[0]):
@@ -100,9 +106,9 @@ def make_logger(air, sess, summary_writer, train_tensor, train_batches, test_ten
                                 data_dict=data_dict)
 
     def log(train_itr):
-        train_log(train_itr)
-        test_log(train_itr)
+        metrics = dict(train=train_log(train_itr), test=test_log(train_itr))
         print
+        return metrics
 
     return log
 
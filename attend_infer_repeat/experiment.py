@@ -35,7 +35,7 @@ run_name = 'new_data'
 
 logdir = osp.join(results_dir, run_name)
 checkpoint_name = osp.join(logdir, 'model.ckpt')
-axes = {'imgs': 0, 'labels': 0, 'nums': 1}
+axes = {'imgs': 0, 'labels': 0, 'nums': 0}
 
 
 # In[ ]:
@@ -0,0 +1,171 @@
+"""Export of a trained AIR model as a frozen, inference-only graph.
+
+Run from `attend_infer_repeat`:
+
+    python export.py --checkpoint ../results/multi_mnist/model.ckpt-300000 --output air.pb
+
+The exported graph contains only the inference path: no loss, optimiser slots, baseline or summaries. Variables
+are folded into constants, so the `.pb` file is self-contained. `load_inference_fn` turns it into a callable.
+
+Beyond pruning to the outputs and folding variables, the only optimisation is the removal of Identity nodes
+outside of the `dynamic_rnn` loop. `optimize_for_inference_lib` isn't used: it removes Identity nodes inside of
+while loops too, which breaks their frames, and the model has no batch norms for it to fold.
+"""
+import sys
+import json
+import argparse
+
+import numpy as np
+import tensorflow as tf
+
+from mnist_model import AIRonMNIST, multi_mnist_kwargs
+
+
+INPUT_NAME = 'obs'
+OUTPUT_NAMES = ('what', 'where', 'presence', 'presence_prob')
+
+
+def build_inference_graph(batch_size, img_size=(50, 50), max_steps=3, deterministic=True, **model_kwargs):
+    """Builds AIR without any training ops.
+
+    Outputs are batch-major: `what` is [batch_size, max_steps, n_appearance], `where` is
+    [batch_size, max_steps, 4], and `presence` and the probability of presence at every step `presence_prob` are
+    [batch_size, max_steps]. With `batch_size=None` the graph takes batches of any size.
+
+    :return: (input placeholder, dict of output name -> tensor)
+    """
+    obs = tf.placeholder(tf.float32, (batch_size,) + tuple(img_size), name=INPUT_NAME)
+    air = AIRonMNIST(obs, None, max_steps=max_steps, deterministic=deterministic, **model_kwargs)
+
+    outputs = {
+        'what': tf.transpose(air.what, (1, 0, 2)),
+        'where': tf.transpose(air.where, (1, 0, 2)),
+        'presence': tf.transpose(air.presence[..., 0]),
+        'presence_prob': tf.transpose(air.presence_prob[..., 0])
+    }
+    outputs = {k: tf.identity(v, name=k) for k, v in outputs.iteritems()}
+    return obs, outputs
+
+
+def _remove_identities(graph_def, protected):
+    """Removes Identity nodes (e.g. reads of frozen variables) outside of control flow frames."""
+
+    def removable(node):
+        return node.op == 'Identity' and node.name not in protected and 'while/' not in node.name
+
+    replacements = {node.name: node.input[0] for node in graph_def.node if removable(node)}
+
+    def resolve(name):
+        control = name.startswith('^')
+        name = name.lstrip('^')
+        base, _, idx = name.partition(':')
+        while base in replacements:
+            name = replacements[base]
+            base, _, idx = name.partition(':')
+        return '^' + base if control else name
+
+    output = tf.GraphDef()
+    for node in graph_def.node:
+        if node.name in replacements:
+            continue
+        new_node = output.node.add()
+        new_node.CopyFrom(node)
+        del new_node.input[:]
+        new_node.input.extend(resolve(i) for i in node.input)
+    return output
+
+
+def freeze(sess, output_names):
+    """Folds variables into constants, drops everything not needed for `output_names` and removes identities."""
+    graph_def = sess.graph.as_graph_def()
+    for node in graph_def.node:
+        node.device = ''
+
+    graph_def = tf.graph_util.convert_variables_to_constants(sess, graph_def, list(output_names))
+    return _remove_identities(graph_def, set(output_names) | {INPUT_NAME})
+
+
+def export(checkpoint_path, output_path, batch_size=64, img_size=(50, 50), max_steps=3, **model_kwargs):
+    """Builds the inference graph, restores it from `checkpoint_path`, freezes it and writes it to `output_path`."""
+    graph = tf.Graph()
+    with graph.as_default():
+        build_inference_graph(batch_size, img_size, max_steps, **model_kwargs)
+        with tf.Session() as sess:
+            tf.train.Saver().restore(sess, checkpoint_path)
+            graph_def = freeze(sess, OUTPUT_NAMES)
+
+    with open(output_path, 'wb') as f:
+        f.write(graph_def.SerializeToString())
+
+    print 'Exported {} nodes to "{}"'.format(len(graph_def.node), output_path)
+    return graph_def
+
+
+class InferenceFunction(object):
+    """Callable wrapping an exported graph.
+
+    Takes a batch of images of shape [n, height, width] and returns a dict with arrays `what`, `where`, `presence`
+    and `presence_prob`, each with leading dimension n. Inputs are split and padded to the batch size the graph was
+    exported with; graphs exported with `batch_size=None` take all inputs at once, without padding.
+    """
+
+    def __init__(self, path, config=None):
+        graph_def = tf.GraphDef()
+        with open(path, 'rb') as f:
+            graph_def.ParseFromString(f.read())
+
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.import_graph_def(graph_def, name='')
+
+        self._obs = self.graph.get_tensor_by_name(INPUT_NAME + ':0')
+        self._outputs = {k: self.graph.get_tensor_by_name(k + ':0') for k in OUTPUT_NAMES}
+        self.batch_size = self._obs.get_shape().as_list()[0]
+        self.img_size = tuple(self._obs.get_shape().as_list()[1:])
+        self.sess = tf.Session(graph=self.graph, config=config)
+
+    def __call__(self, imgs):
+        imgs = np.asarray(imgs, dtype=np.float32)
+        n = imgs.shape[0]
+        batch_size = self.batch_size or n
+
+        results = {k: [] for k in OUTPUT_NAMES}
+        for start in xrange(0, n, batch_size):
+            batch = imgs[start:start + batch_size]
+            n_valid = batch.shape[0]
+            if n_valid < batch_size:
+                padding = np.zeros((batch_size - n_valid,) + batch.shape[1:], dtype=batch.dtype)
+                batch = np.concatenate((batch, padding), 0)
+
+            values = self.sess.run(self._outputs, {self._obs: batch})
+            for k, v in values.iteritems():
+                results[k].append(v[:n_valid])
+
+        return {k: np.concatenate(v, 0) for k, v in results.iteritems()}
+
+    def close(self):
+        self.sess.close()
+
+
+def load_inference_fn(path, config=None):
+    return InferenceFunction(path, config)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checkpoint', required=True)
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--batch_size', type=int, default=64, help='0 exports a graph for any batch size')
+    parser.add_argument('--img_size', type=int, nargs=2, default=[50, 50])
+    parser.add_argument('--max_steps', type=int, default=3)
+    parser.add_argument('--model_kwargs', default='{}',
+                        help='JSON dict overriding the hyperparameters in `mnist_model.multi_mnist_kwargs`')
+    args = parser.parse_args(argv)
+
+    model_kwargs = dict(multi_mnist_kwargs, **json.loads(args.model_kwargs))
+    export(args.checkpoint, args.output, args.batch_size or None, tuple(args.img_size), args.max_steps, **model_kwargs)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
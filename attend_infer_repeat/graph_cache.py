@@ -0,0 +1,121 @@
+"""Serialised graphs that are imported instead of rebuilt.
+
+Building AIR constructs every sonnet module, distribution and summary in Python; importing a serialised
+`MetaGraphDef` only parses a protobuf. `cached_graph` builds a graph once, writes it to a file and imports it in
+every later process:
+
+    def build():
+        obs = tf.placeholder(tf.float32, (64, 50, 50))
+        air = AIRonMNIST(obs, None, max_steps=3)
+        return dict(obs=obs, where=air.where), dict(max_steps=air.max_steps)
+
+    handle = cached_graph('air.meta', build)
+    handle.saver.restore(sess, checkpoint)
+    sess.run(handle.where, {handle.obs: imgs})
+
+Outputs can be nested tuples and lists of tensors and ops; python values are stored next to the graph as JSON.
+The imported graph has the same variables, so checkpoints of the original graph restore into it. The cache is
+keyed by the file name only: delete it when the model code or hyperparameters change.
+"""
+import os
+import json
+
+import tensorflow as tf
+from attrdict import AttrDict
+
+
+_COLLECTION = 'graph_cache/{}'
+
+
+def _structure(value, leaves):
+    """Replaces leaves of a nested structure with their index in `leaves`."""
+    if isinstance(value, (tuple, list)):
+        return [_structure(v, leaves) for v in value]
+    leaves.append(value)
+    return len(leaves) - 1
+
+
+def _pack(structure, leaves):
+    if isinstance(structure, list):
+        return tuple(_pack(s, leaves) for s in structure)
+    return leaves[structure]
+
+
+def _rename(path, tmp_path):
+    # written to temporary files and renamed, so that concurrent readers never see partial files
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        os.remove(tmp_path)
+
+
+def export_graph(path, outputs, constants=None, inputs=None, graph=None):
+    """Writes the graph with named handles to `outputs`.
+
+    :param outputs: dict of name -> (nested) tensor or op
+    :param constants: dict of name -> JSON-serialisable value, returned as is by `import_graph`
+    :param inputs: dict of name -> tensor that can be replaced on import, see `import_graph`. Outputs of
+        `tf.py_func` can't be serialised and have to be inputs.
+    """
+    graph = graph or tf.get_default_graph()
+    inputs = inputs or {}
+
+    input_tensors = set(inputs.itervalues())
+    for op in graph.get_operations():
+        if op.type == 'PyFunc' and not set(op.outputs) <= input_tensors:
+            raise ValueError('Op "{}" is a py_func, which can\'t be serialised; pass its outputs as `inputs` '
+                             'and map new tensors to them on import'.format(op.name))
+
+    meta = dict(outputs={}, constants=constants or {}, inputs={k: v.name for k, v in inputs.iteritems()})
+    with graph.as_default():
+        for name, value in outputs.iteritems():
+            leaves = []
+            meta['outputs'][name] = _structure(value, leaves)
+            for leaf in leaves:
+                graph.add_to_collection(_COLLECTION.format(name), leaf)
+
+        saver_def = None
+        if graph.get_collection(tf.GraphKeys.GLOBAL_VARIABLES):
+            saver_def = tf.train.Saver().as_saver_def()
+
+    tmp_path = '{}.tmp{}'.format(path, os.getpid())
+    with open(tmp_path + '.json', 'w') as f:
+        json.dump(meta, f)
+    _rename(path + '.json', tmp_path + '.json')
+
+    tf.train.export_meta_graph(tmp_path, graph_def=graph.as_graph_def(), saver_def=saver_def)
+    _rename(path, tmp_path)
+
+
+def import_graph(path, input_map=None):
+    """Imports a graph written by `export_graph` into the default graph.
+
+    :param input_map: dict of input name -> tensor replacing that input, e.g. a new data pipeline
+    :return: AttrDict with the outputs and constants, and `saver` for the variables of the graph (None if there
+        are none)
+    """
+    with open(path + '.json') as f:
+        meta = json.load(f)
+
+    input_map = {meta['inputs'][k]: v for k, v in (input_map or {}).iteritems()}
+    saver = tf.train.import_meta_graph(path, input_map=input_map)
+
+    graph = tf.get_default_graph()
+    handle = dict(meta['constants'])
+    for name, structure in meta['outputs'].iteritems():
+        handle[name] = _pack(structure, graph.get_collection(_COLLECTION.format(name)))
+    handle['saver'] = saver
+    return AttrDict(handle)
+
+
+def cached_graph(path, build_fn, input_map=None):
+    """Imports the graph at `path` or builds it with `build_fn` and writes it there first.
+
+    :param build_fn: callable building the graph in the default graph and returning (outputs, constants) or
+        (outputs, constants, inputs), see `export_graph`
+    :param input_map: passed to `import_graph`
+    """
+    if not os.path.exists(path):
+        with tf.Graph().as_default():
+            export_graph(path, *build_fn())
+    return import_graph(path, input_map)
@@ -0,0 +1,199 @@
+"""Content-addressed cache for inference results.
+
+Results are keyed by a hash of the image bytes, shape and dtype together with the identity of the model, so a
+cache can never return results of a different model. Entries live in an in-memory LRU and, optionally, in a
+directory of `.npy` files, which is bounded by evicting the least recently used entries as well.
+"""
+import os
+import glob
+import time
+import hashlib
+import tempfile
+import threading
+import collections
+
+import numpy as np
+
+
+def model_id(path, chunk_size=1 << 20):
+    """Identity of a model artifact (an exported `.pb` or a checkpoint file): sha1 of its contents."""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def image_key(img, model):
+    h = hashlib.sha1(model)
+    h.update('{}{}'.format(img.dtype.str, img.shape))
+    h.update(np.ascontiguousarray(img).data)
+    return h.hexdigest()
+
+
+class CachedInference(object):
+    """Wraps `infer_fn` with a result cache.
+
+    Images are looked up one by one; only the misses are passed to `infer_fn`, in a single call, and identical
+    images within one call are inferred once.
+
+    :param infer_fn: callable mapping an array of images to a dict of arrays with the same leading dimension,
+        e.g. `export.InferenceFunction` or `serving.DynamicBatcher`
+    :param model: string identifying the model, e.g. `model_id` of the exported graph
+    :param capacity: int, maximum number of images kept in memory
+    :param disk_dir: string or None; if given, every result is also written there and read back into memory on
+        in-memory misses
+    :param disk_capacity: int or None, maximum number of images kept in `disk_dir`; unbounded if None. Entries
+        written by other processes are only counted if they existed when the cache was created.
+    """
+
+    def __init__(self, infer_fn, model, capacity=10000, disk_dir=None, disk_capacity=None):
+        self._infer_fn = infer_fn
+        self.model = model
+        self.capacity = capacity
+        self.disk_dir = disk_dir
+        self.disk_capacity = disk_capacity
+
+        self._memory = collections.OrderedDict()
+        # keys of the entries in `disk_dir`, least recently used first
+        self._disk = collections.OrderedDict()
+        if disk_dir is not None:
+            if not os.path.exists(disk_dir):
+                os.makedirs(disk_dir)
+            index_paths = glob.glob(os.path.join(disk_dir, '*.names'))
+            for path in sorted(index_paths, key=os.path.getmtime):
+                self._disk[os.path.basename(path)[:-len('.names')]] = None
+
+        self._lock = threading.Lock()
+        self.reset_metrics()
+
+    def __call__(self, imgs, **kwargs):
+        """Returns the outputs of `infer_fn` for `imgs`; keyword arguments, e.g. the `timeout` of
+        `serving.DynamicBatcher`, are passed on to `infer_fn`."""
+        imgs = np.asarray(imgs, dtype=np.float32)
+        keys = [image_key(img, self.model) for img in imgs]
+        results = [self._lookup(k) for k in keys]
+
+        missing = collections.OrderedDict()
+        for i, (k, r) in enumerate(zip(keys, results)):
+            if r is None:
+                missing.setdefault(k, []).append(i)
+
+        if missing:
+            first = [idx[0] for idx in missing.itervalues()]
+            start = time.time()
+            outputs = self._infer_fn(imgs[first], **kwargs)
+            elapsed = time.time() - start
+
+            for j, (k, idx) in enumerate(missing.iteritems()):
+                result = {name: v[j].copy() for name, v in outputs.iteritems()}
+                self._store(k, result)
+                for i in idx:
+                    results[i] = result
+
+            with self._lock:
+                self._n_inferred += len(first)
+                self._inference_time += elapsed
+
+        with self._lock:
+            self._n_misses += len(missing)
+            self._n_hits += len(keys) - len(missing)
+
+        return {name: np.stack([r[name] for r in results]) for name in results[0]} if results else {}
+
+    def _disk_path(self, key, name):
+        return os.path.join(self.disk_dir, '{}.{}.npy'.format(key, name))
+
+    def _lookup(self, key):
+        with self._lock:
+            if key in self._memory:
+                result = self._memory.pop(key)
+                self._memory[key] = result
+                self._n_memory_hits += 1
+                return result
+
+        if self.disk_dir is None:
+            return None
+
+        index_path = os.path.join(self.disk_dir, key + '.names')
+        if not os.path.exists(index_path):
+            return None
+
+        try:
+            with open(index_path) as f:
+                names = f.read().split()
+            # read into memory: memory-mapped arrays kept in the LRU would hold a file descriptor each
+            result = {name: np.load(self._disk_path(key, name)) for name in names}
+            # the modification time orders entries for eviction in later processes
+            os.utime(index_path, None)
+        except (IOError, OSError):
+            # evicted by another process in the meantime
+            return None
+
+        self._remember(key, result)
+        with self._lock:
+            self._n_disk_hits += 1
+            self._disk.pop(key, None)
+            self._disk[key] = None
+        return result
+
+    def _remember(self, key, result):
+        with self._lock:
+            self._memory[key] = result
+            while len(self._memory) > self.capacity:
+                self._memory.popitem(last=False)
+
+    def _store(self, key, result):
+        self._remember(key, result)
+        if self.disk_dir is None:
+            return
+
+        for name, value in result.iteritems():
+            np.save(self._disk_path(key, name), value)
+
+        # the list of outputs is written last and atomically, so that readers never see partial entries
+        fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir)
+        with os.fdopen(fd, 'w') as f:
+            f.write(' '.join(sorted(result)))
+        os.rename(tmp_path, os.path.join(self.disk_dir, key + '.names'))
+
+        evicted = []
+        with self._lock:
+            self._disk.pop(key, None)
+            self._disk[key] = None
+            while self.disk_capacity is not None and len(self._disk) > self.disk_capacity:
+                evicted.append(self._disk.popitem(last=False)[0])
+
+        for k in evicted:
+            self._remove_from_disk(k)
+
+    def _remove_from_disk(self, key):
+        # the list of outputs goes first, so that readers never see partial entries
+        paths = [os.path.join(self.disk_dir, key + '.names')] + glob.glob(self._disk_path(key, '*'))
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def reset_metrics(self):
+        with self._lock:
+            self._n_hits = self._n_misses = self._n_memory_hits = self._n_disk_hits = self._n_inferred = 0
+            self._inference_time = 0.
+
+    def metrics(self):
+        """Hit rate and inference time saved by hits, estimated from the mean inference time per image."""
+        with self._lock:
+            n_lookups = max(self._n_hits + self._n_misses, 1)
+            time_per_img = self._inference_time / max(self._n_inferred, 1)
+            return dict(
+                hits=self._n_hits,
+                misses=self._n_misses,
+                memory_hits=self._n_memory_hits,
+                disk_hits=self._n_disk_hits,
+                hit_rate=self._n_hits / float(n_lookups),
+                size=len(self._memory),
+                disk_size=len(self._disk),
+                inference_time_s=self._inference_time,
+                saved_time_s=self._n_hits * time_per_img,
+            )
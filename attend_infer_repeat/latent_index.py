@@ -0,0 +1,191 @@
+"""Extraction of per-object latent codes and a nearest-neighbour index over them.
+
+Run from `attend_infer_repeat` with a graph written by `export.py`:
+
+    python latent_index.py --model air.pb --data mnist_validation.pickle --output latents.npz
+
+`LatentIndex` supports exact and approximate (inverted file, IVF) top-k search by example object.
+"""
+import sys
+import time
+import argparse
+
+import numpy as np
+
+
+def extract_latents(infer_fn, imgs, batch_size=1024, presence_threshold=.5):
+    """Runs AIR on `imgs` and collects codes of all present objects.
+
+    :param infer_fn: callable mapping images to batch-major `what`, `where` and `presence`,
+        e.g. `export.InferenceFunction`
+    :param imgs: np.array of shape [n_imgs, height, width]
+    :param batch_size: int, number of images passed to `infer_fn` at once
+    :return: dict with `what` [n_objects, n_appearance], `where` [n_objects, 4] and the index of the image
+        (`img_idx`) and the step (`step`) every object comes from
+    """
+    what, where, img_idx, step = [], [], [], []
+    for start in xrange(0, len(imgs), batch_size):
+        outputs = infer_fn(imgs[start:start + batch_size])
+        i, s = np.where(outputs['presence'] > presence_threshold)
+        what.append(outputs['what'][i, s])
+        where.append(outputs['where'][i, s])
+        img_idx.append(i + start)
+        step.append(s)
+
+    return dict(what=np.concatenate(what).astype(np.float32), where=np.concatenate(where).astype(np.float32),
+                img_idx=np.concatenate(img_idx).astype(np.int32), step=np.concatenate(step).astype(np.int32))
+
+
+def object_features(latents, features='what', where_weight=1.):
+    """Builds the vectors to index from extracted latents.
+
+    :param features: 'what', 'where' or 'both'
+    :param where_weight: float, scales `where` codes relative to `what` codes when `features` is 'both'
+    """
+    if features == 'what':
+        return latents['what']
+    if features == 'where':
+        return latents['where']
+    if features == 'both':
+        return np.concatenate((latents['what'], where_weight * latents['where']), 1)
+    raise ValueError('Unknown features: "{}"'.format(features))
+
+
+def _squared_distances(queries, vectors, norms):
+    return (queries ** 2).sum(1)[:, np.newaxis] - 2 * queries.dot(vectors.T) + norms[np.newaxis]
+
+
+def _top_k(distances, k):
+    k = min(k, distances.shape[1])
+    rows = np.arange(len(distances))[:, np.newaxis]
+    idx = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    order = np.argsort(distances[rows, idx], axis=1)
+    return idx[rows, order]
+
+
+def kmeans(vectors, n_clusters, n_iter=20, seed=0):
+    """Lloyd's algorithm; returns cluster centres of shape [n_clusters, n_dims]."""
+    if not 0 < n_clusters <= len(vectors):
+        raise ValueError('Can\'t build {} clusters from {} vectors'.format(n_clusters, len(vectors)))
+
+    rnd = np.random.RandomState(seed)
+    centres = vectors[rnd.choice(len(vectors), n_clusters, replace=False)].copy()
+
+    for _ in xrange(n_iter):
+        assignment = _squared_distances(vectors, centres, (centres ** 2).sum(1)).argmin(1)
+        counts = np.bincount(assignment, minlength=n_clusters).astype(np.float32)
+        sums = np.zeros_like(centres)
+        np.add.at(sums, assignment, vectors)
+
+        empty = counts == 0
+        centres[~empty] = sums[~empty] / counts[~empty, np.newaxis]
+        # re-seed empty clusters with random points
+        centres[empty] = vectors[rnd.choice(len(vectors), empty.sum())]
+
+    return centres
+
+
+class LatentIndex(object):
+    """Nearest-neighbour index over object codes under Euclidean distance.
+
+    Vectors are kept in one contiguous float32 array. Exact search is a single matrix product per batch of
+    queries. With `n_lists > 0` an inverted file is built as well: vectors are clustered with k-means, stored
+    contiguously cluster by cluster and approximate search only scans the `n_probe` clusters closest to a query.
+
+    :param vectors: np.array of shape [n_vectors, n_dims]
+    :param n_lists: int, number of k-means clusters of the inverted file; 0 disables approximate search
+    """
+
+    def __init__(self, vectors, n_lists=0, kmeans_iter=20, seed=0):
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.norms = (self.vectors ** 2).sum(1)
+        self.n_lists = n_lists
+
+        if n_lists > 0:
+            self.centres = kmeans(self.vectors, n_lists, kmeans_iter, seed)
+            assignment = _squared_distances(self.vectors, self.centres, (self.centres ** 2).sum(1)).argmin(1)
+
+            # vector ids sorted by cluster and where every cluster starts
+            self._list_ids = np.argsort(assignment, kind='mergesort').astype(np.int64)
+            self._list_offsets = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=n_lists))))
+            self._list_vectors = self.vectors[self._list_ids]
+            self._list_norms = self.norms[self._list_ids]
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def search(self, queries, k=10, n_probe=None):
+        """Finds `k` nearest neighbours of every query.
+
+        :param queries: np.array of shape [n_queries, n_dims]
+        :param n_probe: int or None; exact search if None, otherwise approximate search over `n_probe` clusters
+        :return: np.array of shape [n_queries, k] with indices of the neighbours, closest first; rows are padded
+            with -1 if fewer than `k` candidates were scanned
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if n_probe is None:
+            return _top_k(_squared_distances(queries, self.vectors, self.norms), k)
+
+        if self.n_lists == 0:
+            raise ValueError('Approximate search requires an index built with n_lists > 0')
+
+        centre_distances = _squared_distances(queries, self.centres, (self.centres ** 2).sum(1))
+        probes = _top_k(centre_distances, n_probe)
+
+        # queries grouped by the lists they probe, so that every list is scanned with one matrix product
+        probed = probes.ravel()
+        order = np.argsort(probed, kind='mergesort')
+        lists, group_starts = np.unique(probed[order], return_index=True)
+        query_groups = np.split(order // probes.shape[1], group_starts[1:])
+
+        # running top k of every query; unfilled entries are -1 at infinite distance
+        result = -np.ones((len(queries), k), dtype=np.int64)
+        best = np.full((len(queries), k), np.inf, dtype=np.float32)
+        for l, group in zip(lists, query_groups):
+            start, end = self._list_offsets[l], self._list_offsets[l + 1]
+            if start == end:
+                continue
+
+            list_ids = np.broadcast_to(self._list_ids[start:end], (len(group), end - start))
+            distances = _squared_distances(queries[group], self._list_vectors[start:end], self._list_norms[start:end])
+            distances = np.concatenate((best[group], distances), 1)
+            ids = np.concatenate((result[group], list_ids), 1)
+
+            nearest = _top_k(distances, k)
+            rows = np.arange(len(group))[:, np.newaxis]
+            best[group], result[group] = distances[rows, nearest], ids[rows, nearest]
+        return result
+
+    def query_object(self, idx, k=10, n_probe=None):
+        """Finds `k` nearest neighbours of the indexed object `idx`, excluding the object itself."""
+        neighbours = self.search(self.vectors[idx], k + 1, n_probe)[0]
+        return neighbours[neighbours != idx][:k]
+
+
+def recall_at_k(approximate, exact):
+    """Fraction of exact top-k neighbours found by approximate search, averaged over queries."""
+    hits = [len(np.intersect1d(a[a >= 0], e)) for a, e in zip(approximate, exact)]
+    return np.mean(hits) / float(exact.shape[1])
+
+
+def main(argv=None):
+    from data import load_data
+    from export import load_inference_fn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', required=True, help='graph exported with `export.py`')
+    parser.add_argument('--data', required=True, help='dataset pickle in the MNIST data folder')
+    parser.add_argument('--output', required=True, help='.npz file to write the latent codes to')
+    args = parser.parse_args(argv)
+
+    imgs = load_data(args.data)['imgs']
+    start = time.time()
+    latents = extract_latents(load_inference_fn(args.model), imgs)
+    print 'Extracted {} objects from {} images in {:.2f}s'.format(len(latents['what']), len(imgs),
+                                                                 time.time() - start)
+    np.savez(args.output, **latents)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,7 +2,21 @@ import tensorflow as tf
 import sonnet as snt
 
 from model import AIRModel
-from modules import BaselineMLP, Encoder, Decoder, StochasticTransformParam, StepsPredictor
+from neural import StackedLSTM
+from modules import BaselineMLP, Encoder, Decoder, ConvEncoder, ConvDecoder, StochasticTransformParam, StepsPredictor
+
+
+# hyperparameters of the model trained by `scripts/multi_mnist.py`, needed to rebuild it from a checkpoint
+multi_mnist_kwargs = dict(
+    inpt_encoder_hidden=[256] * 2,
+    glimpse_encoder_hidden=[256] * 2,
+    glimpse_decoder_hidden=[256] * 2,
+    transform_estimator_hidden=[256] * 2,
+    steps_pred_hidden=[128, 64],
+    baseline_hidden=[256, 128],
+    transform_var_bias=-3.,
+    step_bias=1.
+)
 
 
 class AIRonMNIST(AIRModel):
@@ -16,9 +30,24 @@ class AIRonMNIST(AIRModel):
                  baseline_hidden=[256, 128]*1,
                  transform_var_bias=-2.,
                  step_bias=0.,
+                 conv_modules=False,
                  *args, **kwargs):
+        """AIR for multi-MNIST.
+
+        :param conv_modules: boolean, uses convolutional encoders and decoder (and a convolutional image encoder in
+            the baseline) instead of MLPs on flattened images if True; their number of parameters does not depend
+            on the image size
+        """
+        n_models = kwargs.get('n_models')
+        if n_models is not None and conv_modules:
+            raise ValueError('Stacked models (n_models) are only supported with MLP modules')
 
-        self.baseline = BaselineMLP(baseline_hidden)
+        if conv_modules:
+            encoder, decoder = ConvEncoder, ConvDecoder
+            self.baseline = BaselineMLP(baseline_hidden, img_encoder=(lambda: ConvEncoder(inpt_encoder_hidden)))
+        else:
+            encoder, decoder = Encoder, Decoder
+            self.baseline = BaselineMLP(baseline_hidden)
 
         def _make_transform_estimator(x):
             est = StochasticTransformParam(transform_estimator_hidden, x, scale_bias=transform_var_bias)
@@ -30,10 +59,10 @@ class AIRonMNIST(AIRModel):
             nums=nums,
             glimpse_size=glimpse_size,
             n_appearance=50,
-            transition=snt.LSTM(256),
-            input_encoder=(lambda: Encoder(inpt_encoder_hidden)),
-            glimpse_encoder=(lambda: Encoder(glimpse_encoder_hidden)),
-            glimpse_decoder=(lambda x: Decoder(glimpse_decoder_hidden, x)),
+            transition=snt.LSTM(256) if n_models is None else StackedLSTM(256, n_models),
+            input_encoder=(lambda: encoder(inpt_encoder_hidden)),
+            glimpse_encoder=(lambda: encoder(glimpse_encoder_hidden)),
+            glimpse_decoder=(lambda x: decoder(glimpse_decoder_hidden, x)),
             transform_estimator=_make_transform_estimator,
             steps_predictor=(lambda: StepsPredictor(steps_pred_hidden, step_bias)),
             output_std=.3,
@@ -1,10 +1,14 @@
+import sonnet as snt
 import tensorflow as tf
+from tensorflow.python.util import nest
 from tensorflow.contrib.distributions import Normal
 from tensorflow.contrib.distributions.python.ops.kullback_leibler import kl as _kl
 
-from cell import AIRCell
-from ops import Loss
+from cell import AIRCell, ParallelAIRCell
+from ops import Loss, apply_if_finite
 from prior import geometric_prior, NumStepsDistribution, tabular_kl
+from precision import as_policy
+from neural import batch_dim, stacked_models
 from evaluation import gradient_summaries
 
 
@@ -13,11 +17,72 @@ class AIRModel(object):
                  n_appearance, transition, input_encoder, glimpse_encoder, glimpse_decoder, transform_estimator,
                  steps_predictor,
                  output_std=1., discrete_steps=True,
-                 step_bias=0., explore_eps=None, debug=False):
+                 step_bias=0., explore_eps=None, checkpoint_every=None, swap_memory=False, precision=None,
+                 input_pyramid_level=None, learned_input_pooling=False, deterministic=False, sequence_mode=False,
+                 n_models=None, presence_estimator='reinforce', compact_absent=False, core='sequential', debug=False):
+        """Activation memory of the unroll grows linearly with `max_steps`. Two options trade compute for memory:
+
+        `checkpoint_every=k` splits the unroll into segments of k steps. Only the states at segment boundaries
+        (and the per-step outputs, which the loss needs anyway) are kept after the forward pass; activations
+        inside a segment are recomputed from its boundary state during the backward pass. With T steps,
+        per-step activations A and boundary state S, activation memory drops from T * A to roughly
+        T / k * S + k * A (smallest for k ~ sqrt(T * S / A)) at the cost of one extra forward pass of the
+        unroll, i.e. about a third more compute per training step. Noise for the stochastic nodes is drawn
+        up front, so that the recomputed segments see exactly the same samples as the forward pass.
+
+        `swap_memory=True` lets the while loop move activations kept for the backward pass from device to host
+        memory. It only has an effect when the model runs on a GPU; on CPU the activations already live in
+        host memory.
+
+        `precision` is a `PrecisionPolicy` or a dtype for the MLPs, glimpse encoder and decoder and the
+        resampler; see `precision.PrecisionPolicy`.
+
+        `input_pyramid_level` and `learned_input_pooling` let the input encoder, which only informs `where` and
+        presence, work on a downsampled image; see `AIRCell`.
+
+        `nums` holds the number of objects per example, [batch_size] of any numeric type, or the legacy expanded
+        format [max_steps, batch_size, 1] with ones at the first `n` steps. Counts are expanded in-graph into the
+        ground-truth presence mask `nums`. It can be None when the number of objects is unknown, e.g. at inference
+        time; `deterministic=True` uses posterior means and thresholded presence instead of samples.
+
+        `sequence_mode=True` adds inputs for warm-starting inference from the previous frame of a sequence; see
+        `sequence.SequenceInference`. They are `tf.placeholder_with_default`s, so the model behaves as usual unless
+        they are fed: `warm_what`, `warm_where` and `warm_hidden` override the learned initial state,
+        `where_proposals` and `proposal_mask` ([max_steps, batch_size, 4] and [max_steps, batch_size, 1]) replace
+        the mean of `where` at masked steps and `step_limit` ([batch_size]) caps the number of steps per example.
+        The unroll only runs for the largest `step_limit` in the batch; outputs of skipped steps are zero.
+
+        `n_models=M` trains M independent models with stacked parameters in one graph (see `neural.stacked_models`).
+        `obs` and `nums` then hold M minibatches folded into one batch, model-major, and `per_model_metrics` holds
+        metrics of every model after `train_step`. The transition has to be built for M models as well, e.g.
+        `neural.StackedLSTM`; `stacked.split_checkpoint` writes separate checkpoints for every model.
+
+        `presence_estimator` chooses how the gradient w.r.t. the discrete number of steps is estimated. 'reinforce'
+        samples presence and uses the score function with a baseline. 'marginal' executes all `max_steps` steps
+        without sampling presence; the canvases after 0, ..., `max_steps` steps share the unroll and the
+        reconstruction loss is their average weighted by `num_steps_distrib.prob()`. The KL terms of every step
+        are weighted by the probability that the step is executed (`presence_weight`). The loss is then an exact
+        expectation over the number of steps and needs no REINFORCE; it costs `max_steps + 1` reconstruction
+        likelihoods and always running every step. `presence` becomes the thresholded probability of executing a
+        step. It only affects training: deterministic models sample nothing either way.
+
+        `compact_absent=True` runs the glimpse encoder and decoder only on examples whose object at the current step
+        is present, see `AIRCell`. It saves compute when many examples stop early, but is incompatible with stacked
+        models, which need equally sized minibatches for every model.
+
+        `core='parallel'` replaces the recurrent `AIRCell` with `ParallelAIRCell`, which infers all `max_steps`
+        objects in one pass from a shared image encoding, so that latency doesn't grow with `max_steps`. Losses and
+        outputs are the same; it supports neither `checkpoint_every`, `sequence_mode` nor `n_models`.
+        """
 
         self.obs = obs
-        self.nums = nums
         self.max_steps = max_steps
+        self.nums = nums
+        self.gt_num_steps = None
+        if nums is not None and nums.get_shape().ndims == 1:
+            self.gt_num_steps = tf.to_float(nums)
+            mask = tf.sequence_mask(tf.to_int32(nums), max_steps)
+            self.nums = tf.expand_dims(tf.to_float(tf.transpose(mask)), -1)
         self.glimpse_size = glimpse_size
 
         self.n_appearance = n_appearance
@@ -26,11 +91,43 @@ class AIRModel(object):
         self.discrete_steps = discrete_steps
         self.step_bias = step_bias
         self.explore_eps = explore_eps
+        self.checkpoint_every = checkpoint_every
+        self.swap_memory = swap_memory
+        self.precision = as_policy(precision)
+        self.input_pyramid_level = input_pyramid_level
+        self.learned_input_pooling = learned_input_pooling
+        self.deterministic = deterministic
+        self.sequence_mode = sequence_mode
+        self.n_models = n_models
+        self.presence_estimator = presence_estimator
+        self.compact_absent = compact_absent
+        self.core = core
         self.debug = debug
 
-        with tf.variable_scope(self.__class__.__name__):
+        if sequence_mode and checkpoint_every is not None:
+            raise ValueError('sequence_mode is not supported together with checkpoint_every')
+        if core not in _CORES:
+            raise ValueError('Unknown core "{}"'.format(core))
+        if core == 'parallel' and (checkpoint_every is not None or sequence_mode or n_models is not None):
+            raise ValueError('The parallel core supports neither checkpoint_every, sequence_mode nor n_models')
+        if compact_absent and n_models is not None:
+            raise ValueError('compact_absent is not supported together with n_models')
+        if learned_input_pooling and n_models is not None:
+            # the pooling convolution isn't stacked and would be shared by all models
+            raise ValueError('learned_input_pooling is not supported together with n_models')
+        if presence_estimator not in ('reinforce', 'marginal'):
+            raise ValueError('Unknown presence_estimator "{}"'.format(presence_estimator))
+
+        self.marginalise_presence = presence_estimator == 'marginal' and not deterministic
+        if self.marginalise_presence and (sequence_mode or not discrete_steps):
+            raise ValueError('presence_estimator="marginal" requires discrete_steps and no sequence_mode')
+
+        custom_getter = self.precision.custom_getter if self.precision.reduced else None
+        with stacked_models(n_models), tf.variable_scope(self.__class__.__name__, custom_getter=custom_getter):
             shape = self.obs.get_shape().as_list()
+            # None if the batch size is only known at run time; `_batch_dim` is a tensor then
             self.batch_size = shape[0]
+            self._batch_dim = batch_dim(self.obs)
             self.img_size = shape[1:]
             self._build(transition, input_encoder, glimpse_encoder, glimpse_decoder, transform_estimator, steps_predictor)
 
@@ -38,34 +135,190 @@ class AIRModel(object):
         if self.explore_eps is not None:
             self.explore_eps = tf.get_variable('explore_eps', initializer=self.explore_eps, trainable=False)
 
-        self.cell = AIRCell(self.img_size, self.glimpse_size, self.n_appearance, transition,
-                      input_encoder, glimpse_encoder, glimpse_decoder, transform_estimator, steps_predictor,
+        core_args = [self.img_size, self.glimpse_size, self.n_appearance]
+        if self.core == 'parallel':
+            core_args.append(self.max_steps)
+
+        self.cell = _CORES[self.core](*core_args + [transition,
+                      input_encoder, glimpse_encoder, glimpse_decoder, transform_estimator, steps_predictor],
                       canvas_init=None,
                       discrete_steps=self.discrete_steps,
                       explore_eps=self.explore_eps,
+                      external_noise=self.checkpoint_every is not None,
+                      precision=self.precision,
+                      input_pyramid_level=self.input_pyramid_level,
+                      learned_input_pooling=self.learned_input_pooling,
+                      deterministic=self.deterministic,
+                      where_proposals=self.sequence_mode,
+                      marginalise_presence=self.marginalise_presence,
+                      compact_absent=self.compact_absent,
                       debug=self.debug)
 
         initial_state = self.cell.initial_state(self.obs)
 
-        dummy_sequence = tf.zeros((self.max_steps, self.batch_size, 1), name='dummy_sequence')
-        outputs, state = tf.nn.dynamic_rnn(self.cell, dummy_sequence, initial_state=initial_state, time_major=True)
+        if not isinstance(self.cell, snt.RNNCore):
+            outputs = self.cell(self.obs)
+        elif self.sequence_mode:
+            outputs, self.final_state = self._sequence_unroll(initial_state)
+        elif self.checkpoint_every is None:
+            dummy_sequence = tf.zeros((self.max_steps, self._batch_dim, 1), name='dummy_sequence')
+            outputs, state = tf.nn.dynamic_rnn(self.cell, dummy_sequence, initial_state=initial_state,
+                                               time_major=True, swap_memory=self.swap_memory)
+        else:
+            outputs = self._checkpointed_unroll(initial_state)
+
         for name, output in zip(self.cell.output_names, outputs):
             setattr(self, name, output)
         # canvas, glimpse, what, what_loc, what_scale, where, where_loc, where_scale, presence_prob, presence = outputs
 
-        self.glimpse = tf.reshape(self.presence * tf.nn.sigmoid(self.glimpse),
-                                  (self.max_steps, self.batch_size,) + tuple(self.glimpse_size))
-        self.canvas = tf.reshape(self.canvas, (self.max_steps, self.batch_size,) + tuple(self.img_size))
-        self.final_canvas = self.canvas[-1]
+        self.presence_weight = self.presence
+        if self.marginalise_presence:
+            # probability of executing step t, i.e. of more than t steps
+            self.presence_weight = tf.cumprod(self.presence_prob, 0)
+            self.presence = tf.to_float(tf.greater(self.presence_weight, .5))
 
-        self.output_distrib = Normal(self.final_canvas, self.output_std)
+        self.glimpse = tf.reshape(self.presence * tf.nn.sigmoid(self.glimpse),
+                                  (self.max_steps, -1) + tuple(self.glimpse_size))
+        self.canvas = tf.reshape(self.canvas, (self.max_steps, -1) + tuple(self.img_size))
 
-        posterior_step_probs = tf.transpose(tf.squeeze(self.presence_prob))
+        # explicit axes instead of squeezing, which would also drop a batch dimension of size one
+        posterior_step_probs = tf.transpose(self.presence_prob[..., 0])
         self.num_steps_distrib = NumStepsDistribution(posterior_step_probs)
 
-        self.num_step_per_sample = tf.to_float(tf.squeeze(tf.reduce_sum(self.presence, 0)))
+        self.num_step_per_sample = tf.to_float(tf.reduce_sum(self.presence[..., 0], 0))
         self.num_step = tf.reduce_mean(self.num_step_per_sample)
-        self.gt_num_steps = tf.squeeze(tf.reduce_sum(self.nums, 0))
+
+        if self.sequence_mode:
+            # the last steps might have been skipped
+            self.final_canvas = tf.reshape(self.final_state[1], (-1,) + tuple(self.img_size))
+        elif self.marginalise_presence:
+            # canvas after k = 0, ..., max_steps steps: [max_steps + 1, batch_size, height, width]
+            initial_canvas = tf.reshape(initial_state[1], (1, -1) + tuple(self.img_size))
+            self.truncated_canvas = tf.concat((initial_canvas, self.canvas), 0)
+            idx = tf.stack((tf.to_int32(self.num_step_per_sample), tf.range(self._batch_dim)), 1)
+            self.final_canvas = tf.gather_nd(self.truncated_canvas, idx)
+        else:
+            self.final_canvas = self.canvas[-1]
+
+        self.output_distrib = Normal(self.final_canvas, self.output_std)
+        if self.nums is not None and self.gt_num_steps is None:
+            self.gt_num_steps = tf.reduce_sum(self.nums[..., 0], 0)
+
+    def _sequence_unroll(self, initial_state):
+        """Unrolls the cell with warm-start inputs; see `sequence_mode` in the constructor."""
+        img, canvas, what, where, hidden, presence = initial_state
+        with tf.variable_scope('warm_start'):
+            self.warm_what = tf.placeholder_with_default(what, what.get_shape(), name='what')
+            self.warm_where = tf.placeholder_with_default(where, where.get_shape(), name='where')
+            self.warm_hidden = _map_nested(lambda h: tf.placeholder_with_default(h, h.get_shape()), hidden)
+
+            shape, static_shape = (self.max_steps, self._batch_dim), (self.max_steps, self.batch_size)
+            self.where_proposals = tf.placeholder_with_default(tf.zeros(shape + (4,)), static_shape + (4,),
+                                                               name='where_proposals')
+            self.proposal_mask = tf.placeholder_with_default(tf.zeros(shape + (1,)), static_shape + (1,),
+                                                             name='proposal_mask')
+            self.step_limit = tf.placeholder_with_default(tf.fill(shape[1:], self.max_steps), static_shape[1:],
+                                                          name='step_limit')
+
+        initial_state = [img, canvas, self.warm_what, self.warm_where, self.warm_hidden, presence]
+        n_steps = tf.reduce_max(self.step_limit)
+        inpt = tf.concat((self.where_proposals, self.proposal_mask), -1)[:n_steps]
+        outputs, state = tf.nn.dynamic_rnn(self.cell, inpt, sequence_length=self.step_limit,
+                                           initial_state=initial_state, time_major=True,
+                                           swap_memory=self.swap_memory)
+
+        padded = []
+        for o, size in zip(outputs, self.cell.output_size):
+            o = tf.pad(o, [[0, self.max_steps - n_steps], [0, 0], [0, 0]])
+            o.set_shape((self.max_steps, self.batch_size, size))
+            padded.append(o)
+        return padded, state
+
+    def _checkpointed_unroll(self, initial_state):
+        """Unrolls the cell in segments of `checkpoint_every` steps whose activations are not kept for backprop.
+
+        Gradients are not propagated through the returned outputs; `_checkpointed_gradients` recomputes every
+        segment from its boundary state instead.
+        """
+        with tf.variable_scope('noise'):
+            n_gaussian = self.cell.noise_size - 1
+            gaussian = tf.random_normal((self.max_steps, self._batch_dim, n_gaussian))
+            uniform = tf.random_uniform((self.max_steps, self._batch_dim, 1))
+            noise = tf.concat((gaussian, uniform), -1)
+
+        self._segments = []
+        outputs, state = [], initial_state
+        for start in xrange(0, self.max_steps, self.checkpoint_every):
+            segment_noise = noise[start:start + self.checkpoint_every]
+            segment_state = _map_nested(tf.stop_gradient, state)
+            segment_outputs, final_state = tf.nn.dynamic_rnn(self.cell, segment_noise,
+                                                             initial_state=segment_state, time_major=True,
+                                                             swap_memory=self.swap_memory)
+
+            segment_outputs = [tf.stop_gradient(o) for o in segment_outputs]
+            # the first segment is recomputed from the initial state to propagate gradients into its variables
+            recompute_state = state if start == 0 else segment_state
+            self._segments.append((segment_noise, recompute_state, segment_outputs))
+            outputs.append(segment_outputs)
+            state = final_state
+
+        return [tf.concat(o, 0) for o in zip(*outputs)]
+
+    def _checkpointed_gradients(self, loss, var_list):
+        """Computes gradients of `loss` w.r.t. `var_list` by recomputing the unroll segment by segment."""
+
+        n_vars = len(var_list)
+        segment_outputs = [o for segment in self._segments for o in segment[2]]
+        grads = tf.gradients(loss, var_list + segment_outputs)
+        var_grads, output_grads = grads[:n_vars], grads[n_vars:]
+
+        state_grads = None
+        for i in reversed(xrange(len(self._segments))):
+            noise, state, outputs = self._segments[i]
+            output_grads, segment_grads = output_grads[:-len(outputs)], output_grads[-len(outputs):]
+            segment_grads = list(segment_grads)
+            if state_grads is not None:
+                segment_grads += state_grads
+
+            triggers = [g for g in segment_grads if g is not None]
+            if not triggers:
+                state_grads = None
+                continue
+
+            # don't start recomputing before gradients w.r.t. this segment are available
+            with tf.control_dependencies(triggers):
+                noise = tf.identity(noise)
+                state = _map_nested(tf.identity, state)
+
+            recomputed, final_state = tf.nn.dynamic_rnn(self.cell, noise, initial_state=state, time_major=True,
+                                                        swap_memory=self.swap_memory)
+
+            ys = list(recomputed)
+            if state_grads is not None:
+                ys += nest.flatten(final_state)
+            ys, grad_ys = zip(*[(y, g) for y, g in zip(ys, segment_grads) if g is not None])
+
+            xs = nest.flatten(state) if i > 0 else []
+            grads = tf.gradients(ys, xs + var_list, grad_ys=grad_ys)
+            state_grads, grads = grads[:len(xs)], grads[len(xs):]
+            var_grads = [_add_grads(g1, g2) for g1, g2 in zip(var_grads, grads)]
+
+        return var_grads
+
+    def _compute_gradients(self, opt, loss, var_list):
+        loss_scale = self.precision.loss_scale
+        if loss_scale != 1.:
+            loss *= loss_scale
+
+        if self.checkpoint_every is None:
+            gvs = opt.compute_gradients(loss, var_list=var_list)
+        else:
+            grads = self._checkpointed_gradients(loss, var_list)
+            gvs = zip(grads, var_list)
+
+        if loss_scale != 1.:
+            gvs = [(g / loss_scale if g is not None else None, v) for g, v in gvs]
+        return gvs
 
     def _prior_loss(self, appearance_prior, where_scale_prior, where_shift_prior,
                     num_steps_prior, global_step):
@@ -90,9 +343,9 @@ class AIRModel(object):
                 else:
                     num_steps_prior_value = num_steps_prior.init
 
-                prior = geometric_prior(num_steps_prior_value, 3)
+                prior = geometric_prior(num_steps_prior_value, self.max_steps)
                 steps_kl = tabular_kl(self.num_steps_distrib.prob(), prior)
-                num_steps_prior_loss_per_sample = tf.squeeze(tf.reduce_sum(steps_kl, 1))
+                num_steps_prior_loss_per_sample = tf.reduce_sum(steps_kl, 1)
 
                 self.num_steps_prior_loss = tf.reduce_mean(num_steps_prior_loss_per_sample)
                 tf.summary.scalar('num_steps_prior', self.num_steps_prior_loss)
@@ -103,8 +356,8 @@ class AIRModel(object):
                 posterior = Normal(self.what_loc, self.what_scale)
 
                 what_kl = _kl(posterior, prior)
-                what_kl = tf.reduce_sum(what_kl, -1, keep_dims=True) * self.presence
-                appearance_prior_loss_per_sample = tf.squeeze(tf.reduce_sum(what_kl, 0))
+                what_kl = tf.reduce_sum(what_kl, -1, keep_dims=True) * self.presence_weight
+                appearance_prior_loss_per_sample = tf.reduce_sum(what_kl[..., 0], 0)
 
                 #         n_samples_with_encoding = tf.reduce_sum(tf.to_float(tf.greater(num_step_per_sample, 0.)))
                 #         div = tf.maximum(n_samples_with_encoding, 1.)
@@ -133,8 +386,8 @@ class AIRModel(object):
                 shift_prior = Normal(shift_mean, where_shift_prior.scale)
 
                 shift_kl = _kl(shift_distrib, shift_prior)
-                where_kl = tf.reduce_sum(scale_kl + shift_kl, -1, keep_dims=True) * self.presence
-                where_kl_per_sample = tf.reduce_sum(tf.squeeze(where_kl), 0)
+                where_kl = tf.reduce_sum(scale_kl + shift_kl, -1, keep_dims=True) * self.presence_weight
+                where_kl_per_sample = tf.reduce_sum(where_kl[..., 0], 0)
                 self.where_kl = tf.reduce_mean(where_kl_per_sample)
                 tf.summary.scalar('where_prior', self.where_kl)
                 prior_loss.add(self.where_kl, where_kl_per_sample)
@@ -171,14 +424,29 @@ class AIRModel(object):
             tf.summary.scalar('baseline_loss', self.baseline_loss)
 
             baseline_opt = make_opt(10 * self.learning_rate)
-            baseline_train_step = baseline_opt.minimize(self.baseline_loss, var_list=baseline_vars)
+            baseline_opt_loss = self.baseline_loss * (self.n_models or 1)
+            if self.guard_numerics:
+                gvs = baseline_opt.compute_gradients(baseline_opt_loss, var_list=baseline_vars)
+                baseline_train_step, _, _ = apply_if_finite(baseline_opt, gvs, [baseline_opt_loss])
+            else:
+                baseline_train_step = baseline_opt.minimize(baseline_opt_loss, var_list=baseline_vars)
 
         return self.reinforce_loss, baseline_vars, baseline_train_step
 
     def train_step(self, learning_rate, l2_weight=0., appearance_prior=None, where_scale_prior=None,
                    where_shift_prior=None,
                    num_steps_prior=None, use_prior=True,
-                   use_reinforce=True, baseline=None):
+                   use_reinforce=True, baseline=None, guard_numerics=False):
+        """Builds the training ops.
+
+        With `guard_numerics=True`, updates with a non-finite loss or gradient norm are skipped in-graph: the
+        global step advances, but no variable or optimizer slot changes, and `skipped_steps` counts these steps.
+        Fetch `n_skipped_steps` with the train step to get the counter after that step.
+        See `training.NumericsWatchdog` for rolling back runs that keep failing. The check covers all stacked
+        models at once, so it is not supported with `n_models > 1`: one diverging model would skip every update.
+        """
+        if guard_numerics and (self.n_models or 1) > 1:
+            raise ValueError('guard_numerics is not supported together with n_models > 1')
 
         self.l2_weight = l2_weight
         self.appearance_prior = appearance_prior
@@ -186,9 +454,11 @@ class AIRModel(object):
         self.where_shift_prior = where_shift_prior
         self.num_steps_prior = num_steps_prior
         self.use_prior = use_prior
-        self.use_reinforce = use_reinforce
+        # the marginal estimator needs no score function
+        self.use_reinforce = use_reinforce and not self.marginalise_presence
+        self.guard_numerics = guard_numerics
 
-        with tf.variable_scope('loss'):
+        with stacked_models(self.n_models), tf.variable_scope('loss'):
             global_step = tf.train.get_or_create_global_step()
             loss = Loss()
             self._train_step = []
@@ -196,8 +466,14 @@ class AIRModel(object):
             make_opt = lambda lr: tf.train.RMSPropOptimizer(lr, momentum=.9, centered=True)
 
             # Reconstruction Loss
-            rec_loss_per_sample = -self.output_distrib.log_prob(self.obs)
-            self.rec_loss_per_sample = tf.reduce_sum(rec_loss_per_sample, axis=(1, 2))
+            if self.marginalise_presence:
+                truncated_distrib = Normal(self.truncated_canvas, self.output_std)
+                rec_loss_per_truncation = -tf.reduce_sum(truncated_distrib.log_prob(self.obs), axis=(2, 3))
+                steps_prob = tf.transpose(self.num_steps_distrib.prob())
+                self.rec_loss_per_sample = tf.reduce_sum(steps_prob * rec_loss_per_truncation, 0)
+            else:
+                rec_loss_per_sample = -self.output_distrib.log_prob(self.obs)
+                self.rec_loss_per_sample = tf.reduce_sum(rec_loss_per_sample, axis=(1, 2))
             self.rec_loss = tf.reduce_mean(self.rec_loss_per_sample)
             tf.summary.scalar('rec', self.rec_loss)
             loss.add(self.rec_loss, self.rec_loss_per_sample)
@@ -212,30 +488,70 @@ class AIRModel(object):
             # REINFORCE
             opt_loss = loss.value
             baseline_vars = []
-            if use_reinforce:
+            if self.use_reinforce:
                 reinforce_loss, baseline_vars, baseline_train_step = self._reinforce(loss, make_opt, baseline)
                 if baseline_train_step is not None:
                     self._train_step.append(baseline_train_step)
 
                 opt_loss += reinforce_loss
 
+            if self.n_models is not None:
+                # averaging over the folded batch scales the loss of every model by 1 / n_models
+                opt_loss *= self.n_models
+
             model_vars = list(set(tf.trainable_variables()) - set(baseline_vars))
             # L2 reg
             if l2_weight > 0.:
                 # don't penalise biases
-                weights = [w for w in model_vars if len(w.get_shape()) == 2]
+                weights = [w for w in model_vars if len(w.get_shape()) == 2 + int(self.n_models is not None)]
                 self.l2_loss = l2_weight * sum(map(tf.nn.l2_loss, weights))
                 opt_loss += self.l2_loss
                 tf.summary.scalar('l2', self.l2_loss)
 
             opt = make_opt(self.learning_rate)
-            gvs = opt.compute_gradients(opt_loss, var_list=model_vars)
-            true_train_step = opt.apply_gradients(gvs, global_step=global_step)
+            gvs = self._compute_gradients(opt, opt_loss, model_vars)
+            if guard_numerics:
+                self.skipped_steps = tf.Variable(0, name='skipped_steps', trainable=False)
+                tf.summary.scalar('skipped_steps', self.skipped_steps)
+                checks = [self.rec_loss, opt_loss]
+                true_train_step, self.grad_norm, self.n_skipped_steps = apply_if_finite(
+                    opt, gvs, checks, global_step, self.skipped_steps)
+            else:
+                true_train_step = opt.apply_gradients(gvs, global_step=global_step)
             self._train_step.append(true_train_step)
 
             # Metrics
             gradient_summaries(gvs)
-            self.num_step_accuracy = tf.reduce_mean(tf.to_float(tf.equal(self.gt_num_steps, self.num_step_per_sample)))
+            if self.nums is not None:
+                self.num_step_accuracy = tf.reduce_mean(tf.to_float(tf.equal(self.gt_num_steps,
+                                                                             self.num_step_per_sample)))
 
             self.loss = loss
+            if self.n_models is not None:
+                self.per_model_metrics = self._per_model_metrics()
             return self._train_step, global_step
+
+    def _per_model_metrics(self):
+        """Metrics of every stacked model, each of shape [n_models]."""
+        per_model = lambda x: tf.reduce_mean(tf.reshape(x, (self.n_models, -1)), 1)
+
+        metrics = dict(loss=per_model(self.loss.per_sample), rec_loss=per_model(self.rec_loss_per_sample),
+                       num_step=per_model(self.num_step_per_sample))
+        if self.nums is not None:
+            metrics['num_step_acc'] = per_model(tf.to_float(tf.equal(self.gt_num_steps, self.num_step_per_sample)))
+        return metrics
+
+
+_CORES = dict(sequential=AIRCell, parallel=ParallelAIRCell)
+
+
+def _map_nested(func, structure):
+    return nest.pack_sequence_as(structure, [func(t) for t in nest.flatten(structure)])
+
+
+def _add_grads(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return a + b
@@ -2,7 +2,7 @@ import numpy as np
 import tensorflow as tf
 import sonnet as snt
 
-from neural import MLP
+from neural import MLP, default_activation
 
 
 class TransformParam(snt.AbstractModule):
@@ -72,6 +72,80 @@ class Decoder(snt.AbstractModule):
         return seq(inpt)
 
 
+class ConvEncoder(snt.AbstractModule):
+    """Convolutional counterpart of `Encoder`.
+
+    Strided convolutions are followed by average pooling to a fixed `output_grid`, so that the number of
+    parameters does not depend on the image size and the computational cost grows linearly with the number
+    of pixels.
+    """
+
+    def __init__(self, n_hidden, n_channels=(16, 32, 32), kernel_shape=3, stride=2, output_grid=(4, 4)):
+        super(ConvEncoder, self).__init__(self.__class__.__name__)
+        self._n_hidden = n_hidden
+        self._n_channels = n_channels
+        self._kernel_shape = kernel_shape
+        self._stride = stride
+        self._output_grid = output_grid
+
+    def _build(self, inpt):
+        if len(inpt.get_shape()) == 3:
+            inpt = inpt[..., tf.newaxis]
+
+        features = inpt
+        for n_channels in self._n_channels:
+            conv = snt.Conv2D(n_channels, self._kernel_shape, stride=self._stride)
+            features = default_activation(conv(features))
+
+        height, width = features.get_shape().as_list()[1:3]
+        pool_size = [1, max(height // self._output_grid[0], 1), max(width // self._output_grid[1], 1), 1]
+        features = tf.nn.avg_pool(features, pool_size, pool_size, 'VALID')
+        features = tf.image.resize_bilinear(features, self._output_grid)
+
+        flat = snt.BatchFlatten()
+        mlp = MLP(self._n_hidden)
+        seq = snt.Sequential([flat, mlp])
+        return seq(features)
+
+
+class ConvDecoder(snt.AbstractModule):
+    """Convolutional counterpart of `Decoder`.
+
+    An MLP maps the input to a coarse feature map, which is upsampled by strided transposed convolutions
+    to `output_size`.
+    """
+
+    def __init__(self, n_hidden, output_size, n_channels=(32, 16), kernel_shape=3, stride=2):
+        super(ConvDecoder, self).__init__(self.__class__.__name__)
+        self._n_hidden = n_hidden
+        self._output_size = output_size
+        self._n_channels = n_channels
+        self._kernel_shape = kernel_shape
+        self._stride = stride
+
+    def _build(self, inpt):
+        n_upsample = len(self._n_channels)
+        upsample = self._stride ** n_upsample
+        shape = [int(np.ceil(float(s) / upsample)) for s in self._output_size]
+
+        mlp = MLP(self._n_hidden, n_out=int(np.prod(shape)) * self._n_channels[0])
+        features = mlp(inpt)
+        features = snt.BatchReshape(shape + [self._n_channels[0]])(features)
+
+        n_outputs = list(self._n_channels[1:]) + [1]
+        for i, n_channels in enumerate(n_outputs):
+            shape = [s * self._stride for s in shape]
+            deconv = snt.Conv2DTranspose(n_channels, shape, self._kernel_shape, stride=self._stride)
+            features = deconv(features)
+            if i < len(n_outputs) - 1:
+                features = default_activation(features)
+
+        height, width = self._output_size
+        features = features[:, :height, :width]
+        reshape = snt.BatchReshape(self._output_size)
+        return reshape(features)
+
+
 class SpatialTransformer(snt.AbstractModule):
 
     def __init__(self, img_size, crop_size, constraints=None, inverse=False):
@@ -86,7 +160,9 @@ class SpatialTransformer(snt.AbstractModule):
         if len(img.get_shape()) == 3:
             img = img[..., tf.newaxis]
 
-        grid_coords = self._warper(transform_params)
+        # the grid is computed in float32 and only resampling runs in the dtype of the image
+        grid_coords = self._warper(tf.to_float(transform_params))
+        grid_coords = tf.cast(grid_coords, img.dtype)
         return snt.resampler(img, grid_coords)
 
 
@@ -105,15 +181,26 @@ class StepsPredictor(snt.AbstractModule):
 
 class BaselineMLP(snt.AbstractModule):
 
-    def __init__(self, n_hidden):
+    def __init__(self, n_hidden, img_encoder=None):
+        """Predicts the per-sample loss; used as a baseline for REINFORCE.
+
+        :param n_hidden: int or a list of ints, number of hidden units
+        :param img_encoder: callable returning a module that encodes the image; the image is flattened if None
+        """
         super(BaselineMLP, self).__init__(self.__class__.__name__)
         self._n_hidden = n_hidden
 
+        with self._enter_variable_scope():
+            self._img_encoder = img_encoder() if img_encoder is not None else None
+
     def _build(self, img, what, where, presence_prob):
 
-        batch_size = int(img.get_shape()[0])
-        parts = [tf.reshape(tf.transpose(i, (1, 0, 2)), (batch_size, -1)) for i in (what, where, presence_prob)]
-        img_flat = tf.reshape(img, (batch_size, -1))
+        flatten = snt.BatchFlatten()
+        parts = [flatten(tf.transpose(i, (1, 0, 2))) for i in (what, where, presence_prob)]
+        if self._img_encoder is None:
+            img_flat = flatten(img)
+        else:
+            img_flat = self._img_encoder(img)
         baseline_inpts = [img_flat] + parts
         baseline_inpts = tf.concat(baseline_inpts, -1)
         mlp = MLP(self._n_hidden, n_out=1)
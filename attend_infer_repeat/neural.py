@@ -1,4 +1,5 @@
 import math
+import contextlib
 import tensorflow as tf
 from tensorflow.python.util import nest
 import sonnet as snt
@@ -39,6 +40,160 @@ default_activation = tf.nn.elu
 default_init = dict()
 
 
+_STACKED_MODELS = '_stacked_models'
+
+
+@contextlib.contextmanager
+def stacked_models(n_models):
+    """Builds parameters of `n_models` independent models stacked along a leading axis.
+
+    Inside this context `Linear` (and with it `Affine` and `MLP`) and `stacked_tile` expect batches that are
+    `n_models` model-major minibatches folded into one, i.e. rows [m * batch_size, (m + 1) * batch_size) belong to
+    model m, and use batched matrix products with parameters of shape [n_models, ...]. `n_models=None` is a no-op.
+
+    The number of models is kept in a collection of the default graph, so it only affects modules built in that
+    graph.
+    """
+    graph = tf.get_default_graph()
+    stack = graph.get_collection_ref(_STACKED_MODELS)
+    stack.append(n_models)
+    try:
+        yield
+    finally:
+        stack.pop()
+        if not stack:
+            # keeps the graph serialisable as a meta graph
+            graph.clear_collection(_STACKED_MODELS)
+
+
+def n_stacked_models():
+    """Number of stacked models of the innermost `stacked_models` context of the default graph, or None."""
+    stack = tf.get_collection(_STACKED_MODELS)
+    return stack[-1] if stack else None
+
+
+def batch_dim(tensor):
+    """Size of the leading axis of `tensor`: a python int if it is known statically, a scalar tensor otherwise.
+
+    Shapes built from it are static whenever the batch size is, so graphs for a fixed batch size don't change.
+    """
+    size = tensor.get_shape()[0].value
+    return size if size is not None else tf.shape(tensor)[0]
+
+
+def stacked_shape(shape):
+    """Prepends the number of stacked models to the shape of a parameter."""
+    n_models = n_stacked_models()
+    if n_models is None:
+        return list(shape)
+    return [n_models] + list(shape)
+
+
+def stacked_tile(param, batch_size):
+    """Tiles a parameter of shape `stacked_shape([1, n])` to the (folded) batch."""
+    n_models = n_stacked_models()
+    if n_models is None:
+        return tf.tile(param, (batch_size, 1))
+
+    tiled = tf.tile(param, (1, batch_size // n_models, 1))
+    return tf.reshape(tiled, (batch_size, -1))
+
+
+def stacked_matmul(inpt, w):
+    """Multiplies every model's part of a folded batch [n_models * n, k] with its weights [n_models, k, m]."""
+    n_models, input_size, output_size = w.get_shape().as_list()
+    inpt = tf.reshape(inpt, (n_models, -1, input_size))
+    return tf.reshape(tf.matmul(inpt, w), (-1, output_size))
+
+
+def stacked_add_bias(inpt, b):
+    """Adds every model's bias [n_models, m] to its part of a folded batch [n_models * n, m]."""
+    n_models, output_size = b.get_shape().as_list()
+    outputs = tf.reshape(inpt, (n_models, -1, output_size)) + b[:, tf.newaxis]
+    return tf.reshape(outputs, (-1, output_size))
+
+
+class Linear(snt.Linear):
+    """`snt.Linear` that creates stacked parameters inside `stacked_models`; identical to it otherwise."""
+
+    def __init__(self, output_size, *args, **kwargs):
+        super(Linear, self).__init__(output_size, *args, **kwargs)
+        self._n_models = n_stacked_models()
+
+    def _build(self, inputs):
+        if self._n_models is None:
+            return super(Linear, self)._build(inputs)
+
+        input_shape = tuple(inputs.get_shape().as_list())
+        self._input_shape = input_shape
+        input_size = input_shape[1]
+
+        if 'w' not in self._initializers:
+            self._initializers['w'] = create_linear_initializer(input_size)
+        if 'b' not in self._initializers and self._use_bias:
+            self._initializers['b'] = tf.zeros_initializer()
+
+        self._w = tf.get_variable('w', shape=(self._n_models, input_size, self._output_size), dtype=inputs.dtype,
+                                  initializer=self._initializers['w'])
+        outputs = stacked_matmul(inputs, self._w)
+
+        if self._use_bias:
+            self._b = tf.get_variable('b', shape=(self._n_models, self._output_size), dtype=inputs.dtype,
+                                      initializer=self._initializers['b'])
+            outputs = stacked_add_bias(outputs, self._b)
+
+        return outputs
+
+
+class StackedLSTM(snt.RNNCore):
+    """`n_models` independent LSTMs with the same equations and initialisation as `snt.LSTM`."""
+
+    def __init__(self, hidden_size, n_models, forget_bias=1., name='lstm'):
+        super(StackedLSTM, self).__init__(name=name)
+        self._hidden_size = hidden_size
+        self._n_models = n_models
+        self._forget_bias = forget_bias
+
+    @property
+    def state_size(self):
+        return tf.TensorShape([self._hidden_size]), tf.TensorShape([self._hidden_size])
+
+    @property
+    def output_size(self):
+        return tf.TensorShape([self._hidden_size])
+
+    def initial_state(self, batch_size, dtype=tf.float32, trainable=False, **kwargs):
+        if not trainable:
+            return super(StackedLSTM, self).initial_state(batch_size, dtype, **kwargs)
+
+        with self._enter_variable_scope():
+            state = []
+            for name in ('initial_hidden', 'initial_cell'):
+                param = tf.get_variable(name, shape=(self._n_models, 1, self._hidden_size), dtype=dtype,
+                                        initializer=tf.zeros_initializer())
+                tiled = tf.tile(param, (1, batch_size // self._n_models, 1))
+                state.append(tf.reshape(tiled, (batch_size, self._hidden_size)))
+        return tuple(state)
+
+    def _build(self, inputs, prev_state):
+        prev_hidden, prev_cell = prev_state
+        inputs = tf.concat((inputs, prev_hidden), 1)
+        input_size = inputs.get_shape().as_list()[1]
+
+        w_gates = tf.get_variable('w_gates', shape=(self._n_models, input_size, 4 * self._hidden_size),
+                                  dtype=inputs.dtype,
+                                  initializer=tf.truncated_normal_initializer(stddev=1. / math.sqrt(input_size)))
+        b_gates = tf.get_variable('b_gates', shape=(self._n_models, 4 * self._hidden_size), dtype=inputs.dtype,
+                                  initializer=tf.zeros_initializer())
+
+        gates = stacked_add_bias(stacked_matmul(inputs, w_gates), b_gates)
+        i, j, f, o = tf.split(gates, 4, 1)
+
+        cell = tf.sigmoid(f + self._forget_bias) * prev_cell + tf.sigmoid(i) * tf.tanh(j)
+        hidden = tf.tanh(cell) * tf.sigmoid(o)
+        return hidden, (hidden, cell)
+
+
 def activation_based_init(func):
     init = tf.uniform_unit_scaling_initializer()
     if func == tf.nn.relu:
@@ -51,7 +206,7 @@ def activation_based_init(func):
     return init
 
 
-class Affine(snt.Linear):
+class Affine(Linear):
     def __init__(self, n_output, transfer=default_activation, initializers=None, transfer_based_init=False):
 
         if initializers is None:
@@ -80,11 +235,11 @@ def MLP(n_hiddens, hidden_transfer=default_activation, n_out=None, transfer=None
 
     layers = []
     for n_hidden, hidden_transfer in zip(n_hiddens, transfers):
-        layers.append(snt.Linear(n_hidden))
+        layers.append(Linear(n_hidden))
         layers.append(hidden_transfer)
 
     if n_out is not None:
-        layers.append(snt.Linear(n_out))
+        layers.append(Linear(n_out))
 
     if transfer is not None:
         layers.append(transfer)
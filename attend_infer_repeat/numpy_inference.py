@@ -0,0 +1,285 @@
+"""Inference with a trained AIR model in NumPy only, for machines without TensorFlow and Sonnet.
+
+Convert a checkpoint once, where TensorFlow is installed; run from `attend_infer_repeat`:
+
+    python numpy_inference.py --checkpoint ../results/multi_mnist/model.ckpt-300000 --output air.npz
+
+The `.npz` file holds the weights of `AIRCell` and the hyperparameters needed to run it. Loading it needs NumPy:
+
+    infer = load_inference_fn('air.npz')
+    outputs = infer(imgs)
+
+`NumpyInferenceFunction` computes the same outputs as the deterministic graph of `export.build_inference_graph`:
+means of `what` and `where`, presence thresholded at .5 and its probability. It supports the MLP modules and
+`snt.LSTM` transition of `AIRonMNIST`; convolutional modules, stacked models, input pyramids and the parallel core
+are not supported.
+"""
+import sys
+import json
+import argparse
+
+import numpy as np
+
+
+_META_KEY = '__meta__'
+OUTPUT_NAMES = ('what', 'where', 'presence', 'presence_prob')
+
+
+def elu(x):
+    return np.where(x > 0., x, np.expm1(np.minimum(x, 0.)))
+
+
+def sigmoid(x):
+    return .5 * (1. + np.tanh(.5 * x))
+
+
+def mlp(x, layers, linear_output=False):
+    """Applies `layers` [(w, b), ...] like `neural.MLP`, with elu after every layer but the last if
+    `linear_output`."""
+    for i, (w, b) in enumerate(layers):
+        x = np.dot(x, w) + b
+        if not linear_output or i < len(layers) - 1:
+            x = elu(x)
+    return x
+
+
+def lstm(x, state, w, b, forget_bias=1.):
+    """One step of `snt.LSTM`; `state` is (hidden, cell)."""
+    hidden, cell = state
+    gates = np.dot(np.concatenate((x, hidden), 1), w) + b
+    i, j, f, o = np.split(gates, 4, 1)
+    cell = sigmoid(f + forget_bias) * cell + sigmoid(i) * np.tanh(j)
+    hidden = np.tanh(cell) * sigmoid(o)
+    return hidden, (hidden, cell)
+
+
+def affine_grid(output_size):
+    """Coordinates of the pixels of an image of `output_size` in [-1, 1], as the (x, y) pair of flat arrays used by
+    `snt.AffineGridWarper`."""
+    height, width = output_size
+    x, y = np.meshgrid(np.linspace(-1, 1, width, dtype=np.float32), np.linspace(-1, 1, height, dtype=np.float32))
+    return x.reshape(-1), y.reshape(-1)
+
+
+def resample(imgs, x, y):
+    """Bilinear sampling like `snt.resampler`: pixels outside the image count as zero.
+
+    :param imgs: [n, height, width]
+    :param x: [n, m] column coordinates in pixels
+    :param y: [n, m] row coordinates in pixels
+    :return: [n, m]
+    """
+    n, height, width = imgs.shape
+    flat = imgs.reshape(n, -1)
+    rows = np.arange(n)[:, np.newaxis]
+    x0, y0 = np.floor(x), np.floor(y)
+
+    output = np.zeros(x.shape, dtype=imgs.dtype)
+    for xc in (x0, x0 + 1):
+        for yc in (y0, y0 + 1):
+            valid = (xc >= 0) & (xc < width) & (yc >= 0) & (yc < height)
+            idx = np.where(valid, yc * width + xc, 0).astype(np.int64)
+            weight = (1. - np.abs(x - xc)) * (1. - np.abs(y - yc))
+            output += np.where(valid, weight * flat[rows, idx], 0.)
+    return output
+
+
+def crop(imgs, where, crop_size):
+    """Glimpses [n, crop_height, crop_width] at `where` [n, 4] = (sx, tx, sy, ty) with the no-shear transform of
+    `modules.SpatialTransformer`."""
+    height, width = imgs.shape[1:]
+    u, v = affine_grid(crop_size)
+    sx, tx, sy, ty = np.split(where, 4, 1)
+    x = (sx * u + tx + 1.) * (width - 1) / 2.
+    y = (sy * v + ty + 1.) * (height - 1) / 2.
+    return resample(imgs, x, y).reshape((-1,) + tuple(crop_size))
+
+
+def paste(glimpses, where, img_size):
+    """Inverse of `crop`: glimpses [n, crop_height, crop_width] placed on an empty canvas of `img_size`."""
+    crop_height, crop_width = glimpses.shape[1:]
+    u, v = affine_grid(img_size)
+    sx, tx, sy, ty = np.split(where, 4, 1)
+    x = ((u - tx) / sx + 1.) * (crop_width - 1) / 2.
+    y = ((v - ty) / sy + 1.) * (crop_height - 1) / 2.
+    return resample(glimpses, x, y).reshape((-1,) + tuple(img_size))
+
+
+class NumpyInferenceFunction(object):
+    """Callable with the interface of `export.InferenceFunction`, running `AIRCell` in NumPy.
+
+    Every step is computed for the whole batch at once; images are processed in chunks of `batch_size`, which
+    bounds memory use.
+
+    :param arrays: dict of name -> array, as written by `convert`
+    :param meta: dict of hyperparameters, as written by `convert`
+    """
+
+    def __init__(self, arrays, meta, batch_size=64):
+        self.batch_size = batch_size
+        self.img_size = tuple(meta['img_size'])
+        self.crop_size = tuple(meta['crop_size'])
+        self.max_steps = meta['max_steps']
+        self.step_bias = meta['step_bias']
+        self.max_crop_size = meta['max_crop_size']
+
+        # contiguous float32 arrays, so that every matrix product runs on one block of memory
+        arrays = {k: np.ascontiguousarray(v, dtype=np.float32) for k, v in arrays.iteritems()}
+        self.layers = {name: [(arrays['{}/{}/w'.format(name, i)], arrays['{}/{}/b'.format(name, i)])
+                              for i in xrange(n)] for name, n in meta['layers'].iteritems()}
+        self.lstm_w, self.lstm_b = arrays['lstm/w'], arrays['lstm/b']
+        self.initial_state = {k: arrays['initial_state/' + k] for k in ('hidden', 'cell', 'what', 'where')}
+
+    @classmethod
+    def load(cls, path, batch_size=64):
+        data = np.load(path)
+        meta = json.loads(str(data[_META_KEY]))
+        return cls({k: data[k] for k in data.files if k != _META_KEY}, meta, batch_size)
+
+    def __call__(self, imgs):
+        return self.run(imgs)
+
+    def run(self, imgs, canvas=False):
+        """Returns a dict with `what` [n, max_steps, n_appearance], `where` [n, max_steps, 4], `presence` and
+        `presence_prob` [n, max_steps], and the reconstruction `canvas` [n, height, width] if `canvas` is True."""
+        imgs = np.asarray(imgs, dtype=np.float32)
+        n = imgs.shape[0]
+        batch_size = self.batch_size or n
+
+        results = []
+        for start in xrange(0, n, batch_size):
+            results.append(self._run_batch(imgs[start:start + batch_size], canvas))
+        return {k: np.concatenate([r[k] for r in results], 0) for k in results[0]}
+
+    def _run_batch(self, imgs, with_canvas):
+        n = imgs.shape[0]
+        tile = lambda x: np.tile(x, (n, 1))
+        state = tuple(tile(self.initial_state[k]) for k in ('hidden', 'cell'))
+        what, where = (tile(self.initial_state[k]) for k in ('what', 'where'))
+        presence = np.ones((n, 1), dtype=np.float32)
+        canvas = np.zeros((n,) + self.img_size, dtype=np.float32)
+
+        # the image doesn't change between steps, so it's encoded only once
+        inpt_encoding = mlp(imgs.reshape(n, -1), self.layers['input_encoder'])
+
+        outputs = {k: [] for k in OUTPUT_NAMES}
+        for _ in xrange(self.max_steps):
+            rnn_inpt = np.concatenate((inpt_encoding, what, where, presence), 1)
+            rnn_inpt = mlp(rnn_inpt, self.layers['rnn_projection'], linear_output=True)
+            hidden, state = lstm(rnn_inpt, state, self.lstm_w, self.lstm_b)
+
+            where_param = mlp(hidden, self.layers['transform_estimator'], linear_output=True)
+            sx, tx, sy, ty = np.split(where_param[:, :4], 4, 1)
+            sx, sy = (self.max_crop_size * sigmoid(s) for s in (sx, sy))
+            where = np.concatenate((sx, np.tanh(tx), sy, np.tanh(ty)), 1)
+
+            presence_logit = mlp(hidden, self.layers['steps_predictor'], linear_output=True) + self.step_bias
+            presence_prob = sigmoid(presence_logit)
+            presence = presence * (presence_prob > .5)
+
+            glimpse = crop(imgs, where, self.crop_size)
+            what_param = mlp(mlp(glimpse.reshape(n, -1), self.layers['glimpse_encoder']), self.layers['what'],
+                             linear_output=True)
+            what = what_param[:, :what_param.shape[1] // 2]
+
+            if with_canvas:
+                decoded = mlp(np.concatenate((what, where), 1), self.layers['glimpse_decoder'], linear_output=True)
+                decoded = decoded.reshape((n,) + self.crop_size)
+                canvas += presence[..., np.newaxis] * paste(decoded, where, self.img_size)
+
+            for k, v in zip(OUTPUT_NAMES, (what, where, presence[:, 0], presence_prob[:, 0])):
+                outputs[k].append(v)
+
+        outputs = {k: np.stack(v, 1) for k, v in outputs.iteritems()}
+        if with_canvas:
+            outputs['canvas'] = canvas
+        return outputs
+
+
+def load_inference_fn(path, batch_size=64):
+    return NumpyInferenceFunction.load(path, batch_size)
+
+
+def _linear_layers(module, sess):
+    """Weights and biases of the linear layers of a connected sonnet module, in the order they are applied."""
+    variables = {v.op.name: v for v in module.get_variables()}
+    scopes = sorted({name.rsplit('/', 1)[0] for name in variables if name.endswith('/w')},
+                    key=lambda s: int(s.rsplit('_', 1)[1]) if s[-1].isdigit() else 0)
+    return sess.run([(variables[s + '/w'], variables[s + '/b']) for s in scopes])
+
+
+def convert(checkpoint_path, output_path, img_size=(50, 50), max_steps=3, **model_kwargs):
+    """Reads the weights of `AIRonMNIST` from a checkpoint and writes them with its hyperparameters to
+    `output_path`; needs TensorFlow."""
+    import sonnet as snt
+    import tensorflow as tf
+    from cell import AIRCell
+    from mnist_model import AIRonMNIST
+    from modules import Encoder, Decoder
+
+    with tf.Graph().as_default():
+        obs = tf.placeholder(tf.float32, (2,) + tuple(img_size))
+        air = AIRonMNIST(obs, None, max_steps=max_steps, deterministic=True, **model_kwargs)
+        cell = air.cell
+        if not isinstance(cell, AIRCell) or not isinstance(cell._transition, snt.LSTM):
+            raise ValueError('Only the sequential core with an `snt.LSTM` transition is supported')
+        if cell._input_pooling_factor is not None:
+            raise ValueError('input_pyramid_level is not supported')
+        if not all(isinstance(m, t) for m, t in ((cell._input_encoder, Encoder), (cell._glimpse_encoder, Encoder),
+                                                 (cell._glimpse_decoder, Decoder))):
+            raise ValueError('Only MLP modules are supported')
+
+        with tf.variable_scope(air.__class__.__name__, reuse=True):
+            _, _, what, where, hidden_state, _ = cell.initial_state(obs[:1])
+
+        with tf.Session() as sess:
+            tf.train.Saver().restore(sess, checkpoint_path)
+
+            modules = dict(input_encoder=cell._input_encoder, rnn_projection=cell._rnn_projection,
+                           transform_estimator=cell._transform_estimator, steps_predictor=cell._steps_predictor,
+                           glimpse_encoder=cell._glimpse_encoder, what=cell._what_distrib,
+                           glimpse_decoder=cell._glimpse_decoder)
+
+            arrays, layers = {}, {}
+            for name, module in modules.iteritems():
+                module_layers = _linear_layers(module, sess)
+                layers[name] = len(module_layers)
+                for i, (w, b) in enumerate(module_layers):
+                    arrays['{}/{}/w'.format(name, i)] = w
+                    arrays['{}/{}/b'.format(name, i)] = b
+
+            lstm_vars = {v.op.name.rsplit('/', 1)[1]: v for v in cell._transition.get_variables()}
+            arrays['lstm/w'], arrays['lstm/b'] = sess.run([lstm_vars['w_gates'], lstm_vars['b_gates']])
+
+            initial_state = sess.run(dict(hidden=hidden_state[0], cell=hidden_state[1], what=what, where=where))
+            for k, v in initial_state.iteritems():
+                arrays['initial_state/' + k] = v
+
+    meta = dict(img_size=list(img_size), crop_size=list(cell._crop_size), max_steps=max_steps,
+                step_bias=float(cell._steps_predictor._steps_bias),
+                max_crop_size=float(cell._transform_estimator._max_crop_size), layers=layers)
+    arrays[_META_KEY] = np.asarray(json.dumps(meta))
+    with open(output_path, 'wb') as f:
+        np.savez(f, **arrays)
+
+
+def main(argv=None):
+    from mnist_model import multi_mnist_kwargs
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checkpoint', required=True)
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--img_size', type=int, nargs=2, default=[50, 50])
+    parser.add_argument('--max_steps', type=int, default=3)
+    parser.add_argument('--model_kwargs', default='{}',
+                        help='JSON dict overriding the hyperparameters in `mnist_model.multi_mnist_kwargs`')
+    args = parser.parse_args(argv)
+
+    model_kwargs = dict(multi_mnist_kwargs, **json.loads(args.model_kwargs))
+    convert(args.checkpoint, args.output, tuple(args.img_size), args.max_steps, **model_kwargs)
+    print 'Wrote "{}"'.format(args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
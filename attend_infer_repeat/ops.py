@@ -40,17 +40,43 @@ class Loss(object):
         return self._get_value('_per_sample')
 
 
-# def check_numerics():
-#
-# for k, v in o.iteritems():
+def apply_if_finite(opt, gvs, checks, global_step=None, skipped_steps=None):
+    """Applies gradients only if the scalars in `checks` and the global norm of the gradients are all finite.
 
-#         if np.isnan(v).any():
-#             print 'found NaN in {} in iter {}'.format(k, train_itr)
-#             break
+    Non-finite values in any gradient make the global norm non-finite, so one reduction guards all of them. On a
+    skipped step, `global_step` and the counter variable `skipped_steps` are incremented instead.
 
-#         if np.isinf(v).any():
-#             print 'found Inf in {} in iter {}'.format(k, train_itr)
-#             break
+    :return: (boolean tensor, True if the update was applied; global norm of the gradients; value of
+        `skipped_steps` after the update or None). Fetch the latter rather than `skipped_steps`, whose read isn't
+        ordered with respect to the update when run in the same `sess.run`.
+    """
+    grads = [g for g, _ in gvs if g is not None]
+    grad_norm = tf.global_norm(grads)
+    finite = tf.reduce_all(tf.is_finite(tf.stack([tf.to_float(c) for c in checks] + [grad_norm])))
+
+    # optimizer slots can't be created inside of a conditional; there's no public API for creating them alone, see
+    # `NumericsGuardTest.test_slots_created_outside_cond`
+    with tf.control_dependencies(None):
+        opt._create_slots([v for g, v in gvs if g is not None])
+
+    def outputs(applied, updates):
+        with tf.control_dependencies(updates):
+            if skipped_steps is None:
+                return tf.constant(applied)
+            return tf.constant(applied), skipped_steps.read_value()
+
+    def apply():
+        return outputs(True, [opt.apply_gradients(gvs, global_step=global_step)])
+
+    def skip():
+        counters = [c for c in (global_step, skipped_steps) if c is not None]
+        return outputs(False, [tf.assign_add(c, 1) for c in counters])
+
+    result = tf.cond(finite, apply, skip)
+    if skipped_steps is None:
+        return result, grad_norm, None
+    applied, n_skipped = result
+    return applied, grad_norm, n_skipped
 
 
 def epsilon_greedy(events, eps):
@@ -0,0 +1,199 @@
+"""Multi-seed training with early culling of bad initialisations (successive halving).
+
+Run from `attend_infer_repeat`:
+
+    python population.py --n_seeds 8 --rungs 10000 30000 90000 --keep 0.5
+
+Launches `scripts/multi_mnist.py` once per seed as parallel processes that memory-map one copy of the data. At
+every rung (a training iteration at which the runs are evaluated) runs are ranked by test `num_step_acc`, then by
+test loss, and all but the best `keep` fraction of the runs still alive are killed. Runs that crash or produce
+non-finite metrics drop out as soon as that is noticed. A summary is written to `<results>/<name>/population.json`.
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import subprocess
+import multiprocessing
+
+import numpy as np
+
+
+def read_metrics(path):
+    """Returns JSON lines written by `scripts/multi_mnist.py --metrics_file`, keyed by iteration."""
+    if not os.path.exists(path):
+        return {}
+
+    metrics = {}
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:  # partially written line
+                continue
+            metrics[entry['itr']] = entry
+    return metrics
+
+
+def score(entry):
+    """Sort key of a run at a rung: higher is better; non-finite metrics rank last."""
+    acc, loss = entry['test']['num_step_acc'], entry['test']['loss']
+    if not (np.isfinite(acc) and np.isfinite(loss)):
+        return -np.inf, -np.inf
+    return acc, -loss
+
+
+def select_survivors(entries, keep):
+    """Returns seeds of the best `keep` fraction (at least one) of runs, given a dict seed -> metrics entry."""
+    n_keep = max(int(math.ceil(len(entries) * keep)), 1)
+    ranked = sorted(entries, key=lambda seed: score(entries[seed]), reverse=True)
+    return [seed for seed in ranked[:n_keep] if np.isfinite(score(entries[seed])[0])]
+
+
+class Run(object):
+
+    def __init__(self, seed, logdir, args):
+        self.seed = seed
+        self.logdir = logdir
+        self.metrics_file = os.path.join(logdir, 'metrics.jsonl')
+        if not os.path.exists(logdir):
+            os.makedirs(logdir)
+
+        self.start = time.time()
+        self.end = None
+        self.culled_at = None
+        self._log = open(os.path.join(logdir, 'stdout.log'), 'a')
+        self.process = subprocess.Popen(args, stdout=self._log, stderr=subprocess.STDOUT)
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def kill(self, rung=None):
+        if self.alive:
+            self.process.terminate()
+            self.process.wait()
+        self.culled_at = rung
+        self.finish()
+
+    def finish(self):
+        if self.end is None:
+            self.end = time.time()
+            self._log.close()
+
+    @property
+    def wall_time(self):
+        return (self.end or time.time()) - self.start
+
+    def summary(self):
+        metrics = read_metrics(self.metrics_file)
+        last = metrics[max(metrics)] if metrics else None
+        return dict(seed=self.seed, logdir=self.logdir, culled_at=self.culled_at, wall_time=self.wall_time,
+                    return_code=self.process.returncode, last_itr=last and last['itr'],
+                    last_test=last and last['test'])
+
+
+def run_population(name, seeds, rungs, keep, max_train_iter, n_threads=0, results_dir='../results', poll_every=30.,
+                   extra_args=()):
+    """Trains one run per seed with successive halving at `rungs` and returns the summary.
+
+    `results_dir` has to match the one in `scripts/multi_mnist.py`; `extra_args` are passed on to it.
+    """
+    from data import load_data
+
+    # convert the data once, before the runs start to memory-map it
+    for partition in ('train', 'validation'):
+        load_data('mnist_{}.pickle'.format(partition), mmap=True)
+
+    runs = {}
+    for seed in seeds:
+        run_name = os.path.join(name, 'seed_{}'.format(seed))
+        args = [sys.executable, 'scripts/multi_mnist.py', '--run_name', run_name, '--seed', str(seed),
+                '--max_train_iter', str(max_train_iter), '--mmap_data', '--n_threads', str(n_threads),
+                '--metrics_file', os.path.join(results_dir, run_name, 'metrics.jsonl')] + list(extra_args)
+        runs[seed] = Run(seed, os.path.join(results_dir, run_name), args)
+    print 'Launched {} runs'.format(len(runs))
+
+    pending = sorted(rungs)
+    try:
+        while any(r.alive for r in runs.itervalues()):
+            time.sleep(poll_every)
+            metrics = {seed: read_metrics(r.metrics_file) for seed, r in runs.iteritems()}
+
+            for seed, r in runs.iteritems():
+                if not r.alive and r.culled_at is None and r.end is None:
+                    r.finish()
+                    print 'Run {} exited with code {}'.format(seed, r.process.returncode)
+
+                entries = metrics[seed]
+                if r.alive and entries and not np.isfinite(score(entries[max(entries)])[0]):
+                    print 'Run {} has non-finite metrics, culling'.format(seed)
+                    r.kill(max(entries))
+
+            while pending:
+                rung = pending[0]
+                # runs that exited before the rung without being culled take no part in the ranking
+                candidates = [s for s, r in runs.iteritems()
+                              if r.culled_at is None and (r.alive or rung in metrics[s])]
+                if not all(rung in metrics[s] for s in candidates):
+                    break
+
+                pending.pop(0)
+                survivors = select_survivors({s: metrics[s][rung] for s in candidates}, keep)
+                for s in candidates:
+                    if s not in survivors:
+                        runs[s].kill(rung)
+                print 'Rung {}: kept seeds {}, culled {}'.format(rung, survivors,
+                                                                 sorted(set(candidates) - set(survivors)))
+    finally:
+        for r in runs.itervalues():
+            if r.alive:
+                r.kill()
+
+    summaries = [r.summary() for r in runs.itervalues()]
+    finished = [s for s in summaries if s['culled_at'] is None and s['last_test'] is not None]
+    best = max(finished, key=lambda s: score(dict(test=s['last_test']))) if finished else None
+
+    iterations = sum(s['last_itr'] or 0 for s in summaries)
+    summary = dict(runs=summaries, best=best, rungs=sorted(rungs), keep=keep,
+                   total_wall_time=sum(s['wall_time'] for s in summaries),
+                   train_iterations=iterations, full_train_iterations=len(seeds) * max_train_iter)
+
+    path = os.path.join(results_dir, name, 'population.json')
+    with open(path, 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    print 'Trained for {} iterations in total, {:.1%} of training all seeds to completion'.format(
+        iterations, iterations / float(summary['full_train_iterations']))
+    if best is not None:
+        print 'Best run: seed {} in "{}"'.format(best['seed'], best['logdir'])
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--name', default='population')
+    parser.add_argument('--n_seeds', type=int, default=8)
+    parser.add_argument('--first_seed', type=int, default=0)
+    parser.add_argument('--rungs', type=int, nargs='+', default=[10000, 30000, 90000],
+                        help='training iterations at which runs are ranked; must be multiples of the evaluation '
+                             'interval of `scripts/multi_mnist.py` (10000)')
+    parser.add_argument('--keep', type=float, default=.5, help='fraction of runs kept at every rung')
+    parser.add_argument('--max_train_iter', type=int, default=300000)
+    parser.add_argument('--n_threads', type=int, default=None,
+                        help='TensorFlow threads per run; defaults to the number of CPUs divided by `n_seeds`')
+    args, extra_args = parser.parse_known_args(argv)
+
+    n_threads = args.n_threads
+    if n_threads is None:
+        n_threads = max(multiprocessing.cpu_count() // args.n_seeds, 1)
+
+    seeds = range(args.first_seed, args.first_seed + args.n_seeds)
+    run_population(args.name, seeds, args.rungs, args.keep, args.max_train_iter, n_threads, extra_args=extra_args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,58 @@
+import tensorflow as tf
+from tensorflow.python.util import nest
+
+
+class PrecisionPolicy(object):
+    """Numerical precision used by the expensive parts of the model.
+
+    MLPs, glimpse encoder and decoder and the resampler compute in `compute_dtype`, while variables are stored
+    in float32 (master weights) and cast on use. Distributions, the transition and the prior terms always work
+    in float32. The training loss is multiplied by `loss_scale` before differentiation and the gradients are
+    divided by it afterwards, which keeps small float16 gradients from underflowing.
+
+    Note that CPU kernels for bfloat16 arithmetic are missing from many Tensorflow versions; float16 is the
+    portable choice.
+    """
+
+    def __init__(self, compute_dtype=tf.float32, loss_scale=1.):
+        self.compute_dtype = tf.as_dtype(compute_dtype)
+        self.loss_scale = loss_scale
+
+    @property
+    def reduced(self):
+        return self.compute_dtype != tf.float32
+
+    def cast(self, tensors):
+        """Casts floating point `tensors` (possibly nested) to the compute dtype."""
+        return _cast_floating(tensors, self.compute_dtype)
+
+    def uncast(self, tensors):
+        """Casts floating point `tensors` (possibly nested) back to float32."""
+        return _cast_floating(tensors, tf.float32)
+
+    def apply(self, module, *inputs):
+        """Runs `module` in the compute dtype and returns float32 outputs."""
+        return self.uncast(module(*self.cast(inputs)))
+
+    def custom_getter(self, getter, name, shape=None, dtype=None, trainable=True, *args, **kwargs):
+        """Variable getter that stores trainable variables in float32 and casts them to the requested dtype."""
+        storage_dtype = tf.float32 if trainable else dtype
+        variable = getter(name, shape, storage_dtype, trainable=trainable, *args, **kwargs)
+        if trainable and dtype is not None and tf.as_dtype(dtype) != tf.float32:
+            variable = tf.cast(variable, dtype)
+        return variable
+
+
+def as_policy(precision):
+    """Creates a `PrecisionPolicy` from None, a dtype or a dtype name; passes policies through."""
+    if isinstance(precision, PrecisionPolicy):
+        return precision
+    if precision is None:
+        return PrecisionPolicy()
+    return PrecisionPolicy(precision)
+
+
+def _cast_floating(tensors, dtype):
+    flat = nest.flatten(tensors)
+    flat = [tf.cast(t, dtype) if t.dtype.is_floating else t for t in flat]
+    return nest.pack_sequence_as(tensors, flat)
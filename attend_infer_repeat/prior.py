@@ -36,14 +36,22 @@ def geometric_prior(success_prob, n_steps):
 
 
 def presence_prob_table(presence_prob):
+    """Computes the distribution over the number of steps from per-step presence probabilities.
+
+    The last axis of `presence_prob` indexes steps; the output has one more entry along that axis,
+    where entry k is the probability of executing exactly k steps.
+    """
     presence_prob = tf.cast(presence_prob, tf.float64)
-    inv = 1. - presence_prob
-    prob0 = inv[..., 0]
-    prob1 = inv[..., 1] * presence_prob[..., 0]
-    prob2 = inv[..., 2] * presence_prob[..., 1] * presence_prob[..., 0]
-    prob3 = tf.reduce_prod(presence_prob, tf.rank(presence_prob) - 1)
+    axis = len(presence_prob.get_shape()) - 1
+
+    # probability of executing at least k steps for k = 0, ..., n_steps
+    at_least = tf.cumprod(presence_prob, axis)
+    ones = tf.ones_like(at_least[..., :1])
+    at_least = tf.concat((ones, at_least), axis)
 
-    modified_prob = tf.stack((prob0, prob1, prob2, prob3), len(prob0.get_shape()))
+    # probability of stopping right after k steps
+    stop = tf.concat((1. - presence_prob, ones), axis)
+    modified_prob = at_least * stop
 
     modified_prob /= tf.reduce_sum(modified_prob, -1, keep_dims=True)
     return tf.cast(modified_prob, tf.float32)
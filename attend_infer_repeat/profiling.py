@@ -0,0 +1,214 @@
+import time
+import resource
+import multiprocessing
+import collections
+import os.path as osp
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.python.client import timeline
+from attrdict import AttrDict
+
+
+def time_callable(func, n_iter=10, n_warmup=2):
+    """Returns wall-clock times (in seconds) of `n_iter` calls of `func` after `n_warmup` untimed calls."""
+    for _ in xrange(n_warmup):
+        func()
+
+    times = np.zeros(n_iter)
+    for i in xrange(n_iter):
+        start = time.time()
+        func()
+        times[i] = time.time() - start
+    return times
+
+
+def time_fetches(sess, fetches, n_iter=10, n_warmup=2, feed_dict=None):
+    """Returns wall-clock times (in seconds) of `n_iter` runs of `fetches` after `n_warmup` untimed runs.
+
+    :param sess: tf.Session
+    :param fetches: anything accepted by `sess.run`
+    :param n_iter: int, number of timed runs
+    :param n_warmup: int, number of runs before timing starts
+    :param feed_dict: dict
+    :return: np.array of shape [n_iter]
+    """
+    return time_callable(lambda: sess.run(fetches, feed_dict), n_iter, n_warmup)
+
+
+def traced_run(sess, fetches, feed_dict=None):
+    """Runs `fetches` with full tracing.
+
+    :return: (results, tf.RunMetadata)
+    """
+    run_options = tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE)
+    run_metadata = tf.RunMetadata()
+    results = sess.run(fetches, feed_dict, options=run_options, run_metadata=run_metadata)
+    return results, run_metadata
+
+
+def module_scope(node_name, op_type=None):
+    """Attributes an op to the module scope it belongs to.
+
+    Ops inside the unroll are attributed to a sub-module of the cell (e.g. `AIRCell/SpatialTransformer`), loss ops
+    to `prior_loss` or a sub-scope of `loss` (e.g. `loss/RMSProp`) and input ops to `input`. Gradient ops are
+    attributed to the scope of the op they differentiate with a ` (grad)` suffix.
+    """
+    if op_type == 'PyFunc':
+        return 'input'
+
+    parts = node_name.split('/')
+    suffix = ''
+    if 'gradients' in parts:
+        parts = parts[parts.index('gradients') + 1:]
+        suffix = ' (grad)'
+
+    if 'AIRCell' in parts:
+        idx = parts.index('AIRCell')
+        scope = '/'.join(parts[idx:idx + 2])
+    elif 'prior_loss' in parts:
+        scope = 'prior_loss'
+    elif 'loss' in parts:
+        idx = parts.index('loss')
+        scope = '/'.join(parts[idx:idx + 2])
+    else:
+        scope = '/'.join(parts[:2])
+
+    return scope + suffix
+
+
+def summarise_run_metadata(run_metadata):
+    """Aggregates compute time and memory of every traced op by `module_scope`.
+
+    :return: list of (scope, dict(time_ms, mbytes, n_ops)) sorted by decreasing time
+    """
+    summary = collections.defaultdict(lambda: dict(time_ms=0., mbytes=0., n_ops=0))
+    for device in run_metadata.step_stats.dev_stats:
+        for node in device.node_stats:
+            op_type = None
+            if '=' in node.timeline_label:
+                op_type = node.timeline_label.split('=')[1].strip().split('(')[0]
+
+            entry = summary[module_scope(node.node_name, op_type)]
+            entry['time_ms'] += node.all_end_rel_micros / 1e3
+            entry['mbytes'] += sum(o.tensor_description.allocation_description.allocated_bytes
+                                   for o in node.output) / 2. ** 20
+            entry['n_ops'] += 1
+
+    return sorted(summary.items(), key=lambda x: -x[1]['time_ms'])
+
+
+def format_summary(summary):
+    total_time = sum(entry['time_ms'] for _, entry in summary)
+    lines = ['{:<48} {:>10} {:>7} {:>14} {:>7}'.format('scope', 'time [ms]', '%', 'output [MB]', 'n ops')]
+    for scope, entry in summary:
+        lines.append('{:<48} {:>10.3f} {:>7.2f} {:>14.3f} {:>7}'.format(
+            scope, entry['time_ms'], 100. * entry['time_ms'] / max(total_time, 1e-8), entry['mbytes'],
+            entry['n_ops']))
+    return '\n'.join(lines)
+
+
+def profile_step(sess, fetches, logdir, step, feed_dict=None):
+    """Runs `fetches` with full tracing and writes a Chrome trace and a per-module summary table to `logdir`.
+
+    The trace can be viewed at chrome://tracing.
+
+    :return: results of `sess.run(fetches)`
+    """
+    results, run_metadata = traced_run(sess, fetches, feed_dict)
+
+    trace = timeline.Timeline(run_metadata.step_stats).generate_chrome_trace_format(show_memory=True)
+    with open(osp.join(logdir, 'timeline_{}.json'.format(step)), 'w') as f:
+        f.write(trace)
+
+    summary = format_summary(summarise_run_metadata(run_metadata))
+    with open(osp.join(logdir, 'profile_{}.txt'.format(step)), 'w') as f:
+        f.write(summary)
+
+    print 'Profile of step {}:'.format(step)
+    print summary
+    return results
+
+
+def peak_rss_mb():
+    """Peak resident set size of the current process in MB."""
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+def run_in_subprocess(func, *args, **kwargs):
+    """Runs `func` in a fresh process and returns its result.
+
+    Peak memory is a per-process high watermark, so every configuration that is measured for memory
+    should be run in its own process.
+    """
+    queue = multiprocessing.Queue()
+
+    def target():
+        try:
+            queue.put((True, func(*args, **kwargs)))
+        except Exception as e:
+            queue.put((False, '{}: {}'.format(type(e).__name__, e)))
+
+    process = multiprocessing.Process(target=target)
+    process.start()
+    success, result = queue.get()
+    process.join()
+
+    if not success:
+        raise RuntimeError('Subprocess failed with {}'.format(result))
+    return result
+
+
+def num_trainable_params(scope=None):
+    """Number of scalars in trainable variables, optionally restricted to `scope`."""
+    variables = tf.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES, scope=scope)
+    return int(sum(np.prod(v.get_shape().as_list()) for v in variables))
+
+
+def default_priors():
+    """Priors and their annealing schedule as used in `scripts/multi_mnist.py`."""
+    return dict(
+        appearance_prior=AttrDict(loc=0., scale=1.),
+        where_scale_prior=AttrDict(loc=.5, scale=1.),
+        where_shift_prior=AttrDict(scale=1.),
+        num_steps_prior=AttrDict(anneal='exp', init=1. - 1e-7, final=1e-5, steps_div=1e4, steps=1e5)
+    )
+
+
+def build_benchmark_air(batch_size, img_size=(50, 50), max_steps=3, train=True, learning_rate=1e-4, **kwargs):
+    """Builds `AIRonMNIST` on random inputs generated in-graph, so that timings exclude the input pipeline.
+
+    :return: (air, train_step) where train_step is None if `train` is False
+    """
+    from mnist_model import AIRonMNIST
+
+    obs = tf.random_uniform((batch_size,) + tuple(img_size), name='obs')
+    nums = tf.zeros((max_steps, batch_size, 1), name='nums')
+    air = AIRonMNIST(obs, nums, max_steps=max_steps, **kwargs)
+
+    train_step = None
+    if train:
+        train_step, _ = air.train_step(learning_rate, **default_priors())
+    return air, train_step
+
+
+def benchmark_train_step(batch_size, n_iter=10, **kwargs):
+    """Measures step time and peak memory of a training step; best run through `run_in_subprocess`."""
+    tf.reset_default_graph()
+    air, train_step = build_benchmark_air(batch_size, **kwargs)
+
+    sess = tf.Session()
+    sess.run(tf.global_variables_initializer())
+    rss_before = peak_rss_mb()
+    times = time_fetches(sess, train_step, n_iter)
+    rss_after = peak_rss_mb()
+    sess.close()
+
+    return dict(
+        n_params=num_trainable_params(),
+        step_time=float(np.median(times)),
+        peak_rss_mb=rss_after,
+        step_rss_mb=max(rss_after - rss_before, 0.),
+        samples_per_sec=batch_size / float(np.median(times))
+    )
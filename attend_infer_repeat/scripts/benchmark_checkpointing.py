@@ -0,0 +1,32 @@
+# coding: utf-8
+"""Memory vs step time of recomputing the AIR unroll (`checkpoint_every`) and of `swap_memory`.
+
+Every configuration runs in a separate process, so that peak memory is not shared between them.
+"""
+
+from profiling import benchmark_train_step, run_in_subprocess
+
+
+batch_size = 64
+max_steps = [3, 6, 12]
+n_iter = 10
+
+
+def configs(n_steps):
+    yield dict(checkpoint_every=None, swap_memory=False)
+    yield dict(checkpoint_every=None, swap_memory=True)
+    k = 1
+    while k < n_steps:
+        yield dict(checkpoint_every=k, swap_memory=False)
+        k *= 2
+
+
+print '{:>9} {:>16} {:>11} {:>14} {:>14} {:>12}'.format(
+    'max_steps', 'checkpoint_every', 'swap_memory', 'step time [s]', 'peak RSS [MB]', 'step RSS [MB]')
+
+for n_steps in max_steps:
+    for config in configs(n_steps):
+        result = run_in_subprocess(benchmark_train_step, batch_size, n_iter=n_iter, max_steps=n_steps, **config)
+        print '{:>9} {:>16} {:>11} {:>14.4f} {:>14.1f} {:>12.1f}'.format(
+            n_steps, str(config['checkpoint_every']), str(config['swap_memory']),
+            result['step_time'], result['peak_rss_mb'], result['step_rss_mb'])
@@ -0,0 +1,59 @@
+# coding: utf-8
+"""Training step time with and without compaction of absent objects (`compact_absent`) for different scene densities.
+
+Usage (from `attend_infer_repeat`): python scripts/benchmark_compaction.py [<checkpoint>]
+Scenes are synthesised with at most 0, 1, 2 or 3 digits (`data.online.SceneSynthesiser`); `present` is the
+measured fraction of executed steps. With a checkpoint of a trained model, presence follows the scenes.
+Without one, the model is randomly initialised and the steps predictor bias is set per density instead, so
+that roughly the same fraction of steps is executed.
+"""
+
+import sys
+
+import numpy as np
+import tensorflow as tf
+
+from data.online import SceneSynthesiser
+from mnist_model import AIRonMNIST, multi_mnist_kwargs
+from profiling import default_priors, time_fetches, run_in_subprocess
+
+
+batch_size = 64
+max_steps = 3
+n_iter = 20
+max_objects = [0, 1, 2, 3]
+checkpoint = sys.argv[1] if len(sys.argv) > 1 else None
+
+
+def step_time(compact_absent, n_objects, imgs):
+    tf.reset_default_graph()
+    kwargs = dict(multi_mnist_kwargs)
+    if checkpoint is None:
+        # expected fraction of executed steps ~ n_objects / (2 * max_steps) for uniform counts in [0, n_objects]
+        fraction = np.clip(n_objects / (2. * max_steps), .05, .95)
+        kwargs['step_bias'] = float(np.log(fraction / (1. - fraction)))
+
+    air = AIRonMNIST(tf.constant(imgs), None, max_steps=max_steps, compact_absent=compact_absent, **kwargs)
+    train_step, _ = air.train_step(1e-4, **default_priors())
+
+    sess = tf.Session()
+    sess.run(tf.global_variables_initializer())
+    if checkpoint is not None:
+        model_vars = tf.get_collection(tf.GraphKeys.GLOBAL_VARIABLES, scope='AIRonMNIST')
+        tf.train.Saver(model_vars).restore(sess, checkpoint)
+
+    present = sess.run(tf.reduce_mean(air.presence))
+    times = time_fetches(sess, train_step, n_iter)
+    sess.close()
+    return float(np.median(times)), float(present)
+
+
+print '{:>12} {:>10} {:>14} {:>16} {:>10}'.format('max objects', 'present', 'full [s]', 'compacted [s]', 'speedup')
+for n in max_objects:
+    synthesiser = SceneSynthesiser.from_mnist('validation', n_objects=n)
+    batch = {k: np.zeros(shape, dtype) for k, (shape, dtype) in synthesiser.batch_arrays(batch_size).iteritems()}
+    synthesiser.fill(**batch)
+
+    full, present = run_in_subprocess(step_time, False, n, batch['imgs'])
+    compacted, _ = run_in_subprocess(step_time, True, n, batch['imgs'])
+    print '{:>12} {:>10.2f} {:>14.4f} {:>16.4f} {:>10.2f}'.format(n, present, full, compacted, full / compacted)
@@ -0,0 +1,24 @@
+# coding: utf-8
+"""Parameter count, step time and memory against image size for the MLP and the convolutional modules."""
+
+from profiling import benchmark_train_step, run_in_subprocess
+
+
+batch_size = 32
+img_sizes = [50, 100, 200]
+n_iter = 10
+
+print '{:>8} {:>10} {:>12} {:>14} {:>14}'.format('modules', 'img size', 'n params', 'step time [s]', 'peak RSS [MB]')
+
+for conv_modules in (False, True):
+    name = 'conv' if conv_modules else 'mlp'
+    for size in img_sizes:
+        try:
+            result = run_in_subprocess(benchmark_train_step, batch_size, n_iter=n_iter, img_size=(size, size),
+                                       conv_modules=conv_modules)
+        except RuntimeError as e:
+            print '{:>8} {:>10} failed: {}'.format(name, size, e)
+            continue
+
+        print '{:>8} {:>10} {:>12} {:>14.4f} {:>14.1f}'.format(
+            name, size, result['n_params'], result['step_time'], result['peak_rss_mb'])
@@ -0,0 +1,66 @@
+# coding: utf-8
+"""Cold-start time and per-batch latency of an exported graph against the full training graph.
+
+Usage (from `attend_infer_repeat`): python scripts/benchmark_export.py <checkpoint> [<exported .pb>]
+The graph is exported to a temporary file if no `.pb` is given.
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+
+from export import export, load_inference_fn
+from mnist_model import AIRonMNIST, multi_mnist_kwargs
+from profiling import run_in_subprocess, time_callable, default_priors
+
+
+batch_size = 64
+img_size = (50, 50)
+n_iter = 50
+
+
+def training_graph(checkpoint_path):
+    start = time.time()
+    obs = tf.placeholder(tf.float32, (batch_size,) + img_size)
+    nums = tf.placeholder(tf.float32, (3, batch_size, 1))
+    air = AIRonMNIST(obs, nums, max_steps=3, explore_eps=0., **multi_mnist_kwargs)
+    air.train_step(1e-4, **default_priors())
+    tf.summary.merge_all()
+
+    sess = tf.Session()
+    tf.train.Saver().restore(sess, checkpoint_path)
+    imgs = np.random.rand(batch_size, *img_size)
+    fetches = [air.what, air.where, air.presence]
+    sess.run(fetches, {obs: imgs})
+    cold_start = time.time() - start
+
+    times = time_callable(lambda: sess.run(fetches, {obs: imgs}), n_iter)
+    return dict(cold_start=cold_start, latency=float(np.median(times)))
+
+
+def exported_graph(path):
+    start = time.time()
+    infer = load_inference_fn(path)
+    imgs = np.random.rand(batch_size, *img_size)
+    infer(imgs)
+    cold_start = time.time() - start
+
+    times = time_callable(lambda: infer(imgs), n_iter)
+    return dict(cold_start=cold_start, latency=float(np.median(times)))
+
+
+checkpoint_path = sys.argv[1]
+if len(sys.argv) > 2:
+    pb_path = sys.argv[2]
+else:
+    pb_path = os.path.join(tempfile.mkdtemp(), 'air.pb')
+    run_in_subprocess(export, checkpoint_path, pb_path, batch_size, img_size, **multi_mnist_kwargs)
+
+print '{:>10} {:>16} {:>20}'.format('graph', 'cold start [s]', 'batch latency [ms]')
+for name, func, arg in (('training', training_graph, checkpoint_path), ('exported', exported_graph, pb_path)):
+    result = run_in_subprocess(func, arg)
+    print '{:>10} {:>16.3f} {:>20.3f}'.format(name, result['cold_start'], 1e3 * result['latency'])
@@ -0,0 +1,47 @@
+# coding: utf-8
+"""Recall against latency of approximate search in `LatentIndex`.
+
+Usage (from `attend_infer_repeat`): python scripts/benchmark_latent_index.py [<latents .npz>]
+Latents are written by `latent_index.py`; random codes of the same size as multi-MNIST `what` codes are used if
+no file is given. Queries are indexed objects, searched for by example.
+"""
+
+import sys
+
+import numpy as np
+
+from latent_index import LatentIndex, object_features, recall_at_k
+from profiling import time_callable
+
+
+k = 10
+n_queries = 1000
+n_lists = [16, 64, 256]
+n_probes = [1, 2, 4, 8, 16, 32]
+n_iter = 5
+
+if len(sys.argv) > 1:
+    vectors = object_features(np.load(sys.argv[1]))
+else:
+    vectors = np.random.randn(100000, 50).astype(np.float32)
+
+queries = vectors[np.random.choice(len(vectors), n_queries, replace=False)]
+print 'Indexing {} vectors of size {}, {} queries, k = {}'.format(vectors.shape[0], vectors.shape[1], n_queries, k)
+
+exact_index = LatentIndex(vectors)
+exact = exact_index.search(queries, k)
+exact_time = np.median(time_callable(lambda: exact_index.search(queries, k), n_iter))
+
+print '{:>8} {:>8} {:>12} {:>14}'.format('lists', 'probes', 'recall@{}'.format(k), 'ms / query')
+print '{:>8} {:>8} {:>12.3f} {:>14.4f}'.format('exact', '-', 1., 1e3 * exact_time / n_queries)
+
+for n in n_lists:
+    index = LatentIndex(vectors, n_lists=n)
+    for n_probe in n_probes:
+        if n_probe > n:
+            continue
+
+        approximate = index.search(queries, k, n_probe)
+        search_time = np.median(time_callable(lambda: index.search(queries, k, n_probe), n_iter))
+        print '{:>8} {:>8} {:>12.3f} {:>14.4f}'.format(n, n_probe, recall_at_k(approximate, exact),
+                                                         1e3 * search_time / n_queries)
@@ -0,0 +1,24 @@
+# coding: utf-8
+"""Training throughput at several canvas sizes when the input encoder sees a downsampled image."""
+
+from profiling import benchmark_train_step, run_in_subprocess
+
+
+batch_size = 32
+img_sizes = [50, 100, 200]
+n_iter = 10
+
+configs = [
+    ('full resolution', dict()),
+    ('avg, level 1', dict(input_pyramid_level=1)),
+    ('avg, level 2', dict(input_pyramid_level=2)),
+    ('learned, level 2', dict(input_pyramid_level=2, learned_input_pooling=True)),
+]
+
+print '{:>18} {:>10} {:>14} {:>12} {:>14}'.format('input', 'img size', 'step time [s]', 'samples/sec', 'peak RSS [MB]')
+
+for size in img_sizes:
+    for name, config in configs:
+        result = run_in_subprocess(benchmark_train_step, batch_size, n_iter=n_iter, img_size=(size, size), **config)
+        print '{:>18} {:>10} {:>14.4f} {:>12.1f} {:>14.1f}'.format(
+            name, size, result['step_time'], result['samples_per_sec'], result['peak_rss_mb'])
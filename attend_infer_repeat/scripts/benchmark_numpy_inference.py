@@ -0,0 +1,89 @@
+# coding: utf-8
+"""Start-up time and throughput of NumPy inference (`numpy_inference.py`) against the exported TensorFlow graph.
+
+Usage (from `attend_infer_repeat`): python scripts/benchmark_numpy_inference.py [<checkpoint>]
+Without a checkpoint, a randomly initialised model is saved and used instead. Start-up covers imports, loading the
+model and inference on the first image, each in a fresh interpreter. Graphs are exported for every batch size,
+so that TensorFlow doesn't pay for padding.
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+
+import numpy as np
+import tensorflow as tf
+
+from export import export
+from mnist_model import AIRonMNIST, multi_mnist_kwargs
+from numpy_inference import convert
+from profiling import time_callable, run_in_subprocess
+
+
+img_size = (50, 50)
+batch_sizes = [1, 64]
+n_iter = 20
+
+_measure_startup = """
+import time, json
+import numpy as np
+start = time.time()
+from {module} import load_inference_fn
+infer = load_inference_fn({path!r})
+infer(np.zeros((1,) + {img_size!r}, dtype=np.float32))
+print json.dumps(dict(time=time.time() - start))
+"""
+
+
+def random_checkpoint(path):
+    obs = tf.placeholder(tf.float32, (2,) + img_size)
+    AIRonMNIST(obs, None, **multi_mnist_kwargs)
+    with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        return tf.train.Saver().save(sess, path)
+
+
+def startup(module, path):
+    code = _measure_startup.format(module=module, path=path, img_size=img_size)
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=os.getcwd(), stderr=open(os.devnull, 'w'))
+    return json.loads(output.strip().splitlines()[-1])['time']
+
+
+def throughput(module, path, batch_size):
+    load_inference_fn = __import__(module).load_inference_fn
+    infer = load_inference_fn(path)
+    imgs = np.random.rand(batch_size, *img_size).astype(np.float32)
+    times = time_callable(lambda: infer(imgs), n_iter)
+    return batch_size / float(np.median(times))
+
+
+tmp_dir = tempfile.mkdtemp()
+try:
+    if len(sys.argv) > 1:
+        checkpoint_path = sys.argv[1]
+    else:
+        checkpoint_path = run_in_subprocess(random_checkpoint, os.path.join(tmp_dir, 'model.ckpt'))
+
+    models = {('numpy_inference', None): os.path.join(tmp_dir, 'air.npz')}
+    run_in_subprocess(convert, checkpoint_path, models['numpy_inference', None], img_size, **multi_mnist_kwargs)
+    for batch_size in batch_sizes:
+        path = os.path.join(tmp_dir, 'air_{}.pb'.format(batch_size))
+        run_in_subprocess(export, checkpoint_path, path, batch_size, img_size, **multi_mnist_kwargs)
+        models['export', batch_size] = path
+
+    print '{:>8} {:>14}'.format('engine', 'start-up [s]')
+    for name, module, path in (('tf', 'export', models['export', 1]),
+                               ('numpy', 'numpy_inference', models['numpy_inference', None])):
+        print '{:>8} {:>14.2f}'.format(name, startup(module, path))
+
+    print
+    print '{:>12} {:>16} {:>16}'.format('batch size', 'tf [img/s]', 'numpy [img/s]')
+    for batch_size in batch_sizes:
+        tf_throughput = run_in_subprocess(throughput, 'export', models['export', batch_size], batch_size)
+        np_throughput = run_in_subprocess(throughput, 'numpy_inference', models['numpy_inference', None], batch_size)
+        print '{:>12} {:>16.1f} {:>16.1f}'.format(batch_size, tf_throughput, np_throughput)
+finally:
+    shutil.rmtree(tmp_dir)
@@ -0,0 +1,37 @@
+# coding: utf-8
+"""Throughput of online scene synthesis (`data.online`) against the number of worker processes.
+
+Usage (from `attend_infer_repeat`): python scripts/benchmark_online_data.py
+The consumer reads batches as fast as it can; `fresh` is the fraction of reads that got a new batch rather than
+the previous one again. Batches the consumer didn't get to are overwritten, but count as produced. The first row is `create_mnist` writing the pickled dataset, one image at a time.
+"""
+
+import time
+
+import numpy as np
+
+from data.data import create_mnist
+from data.online import OnlineScenes, SceneSynthesiser
+
+
+batch_size = 64
+n_workers = [1, 2, 4, 8]
+duration = 10.
+
+start = time.time()
+create_mnist('train', n_samples=2000)
+print '\ncreate_mnist: {:.0f} samples/sec'.format(2000 / (time.time() - start))
+
+synthesiser = SceneSynthesiser.from_mnist('train')
+print '{:>8} {:>22} {:>10}'.format('workers', 'produced samples/sec', 'fresh')
+for n in n_workers:
+    with OnlineScenes(synthesiser, batch_size, n_workers=n) as scenes:
+        scenes.next_batch()
+        written = scenes.metrics()['written']
+        start = time.time()
+        while time.time() - start < duration:
+            scenes.next_batch()
+        metrics = scenes.metrics()
+
+    throughput = (metrics['written'] - written) * batch_size / duration
+    print '{:>8} {:>22.0f} {:>10.2f}'.format(n, throughput, 1. - metrics['reused_fraction'])
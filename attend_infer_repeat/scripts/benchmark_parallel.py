@@ -0,0 +1,42 @@
+# coding: utf-8
+"""Inference latency of the sequential and the parallel core (`AIRModel(..., core=...)`) against `max_steps`.
+
+Usage (from `attend_infer_repeat`): python scripts/benchmark_parallel.py
+Models are randomly initialised; latency doesn't depend on the weights, since every step or slot is computed
+whether the object is present or not.
+"""
+
+import numpy as np
+import tensorflow as tf
+
+from export import build_inference_graph
+from mnist_model import multi_mnist_kwargs
+from profiling import time_fetches, run_in_subprocess
+
+
+img_size = (50, 50)
+n_iter = 50
+batch_sizes = [1, 64]
+max_steps = [1, 2, 3, 5, 8]
+cores = ['sequential', 'parallel']
+
+
+def latency(core, batch_size, n_steps):
+    tf.reset_default_graph()
+    obs, outputs = build_inference_graph(batch_size, img_size, max_steps=n_steps, core=core, **multi_mnist_kwargs)
+
+    sess = tf.Session()
+    sess.run(tf.global_variables_initializer())
+    imgs = np.random.rand(batch_size, *img_size)
+    times = time_fetches(sess, outputs, n_iter, feed_dict={obs: imgs})
+    sess.close()
+    return float(np.median(times))
+
+
+print '{:>12} {:>10} {:>16} {:>16} {:>10}'.format('batch size', 'max steps', 'sequential [ms]', 'parallel [ms]',
+                                                  'speedup')
+for batch_size in batch_sizes:
+    for n_steps in max_steps:
+        sequential, parallel = [run_in_subprocess(latency, core, batch_size, n_steps) for core in cores]
+        print '{:>12} {:>10} {:>16.2f} {:>16.2f} {:>10.2f}'.format(batch_size, n_steps, 1e3 * sequential,
+                                                                   1e3 * parallel, sequential / parallel)
@@ -0,0 +1,75 @@
+# coding: utf-8
+"""Throughput and memory against accuracy of reduced-precision policies on multi-MNIST.
+
+Throughput and memory are measured on random inputs, each policy in a separate process. Accuracy is measured
+by training every policy for `n_train_iter` iterations on multi-MNIST and evaluating on the validation set;
+set `n_train_iter = 0` to skip that part.
+"""
+
+import numpy as np
+import tensorflow as tf
+
+from data import load_data, tensors_from_data
+from mnist_model import AIRonMNIST
+from precision import PrecisionPolicy
+from profiling import benchmark_train_step, run_in_subprocess, default_priors
+
+
+learning_rate = 1e-4
+batch_size = 64
+n_iter = 20
+n_train_iter = 10000
+axes = {'imgs': 0, 'labels': 0, 'nums': 0}
+
+policies = [
+    ('float32', dict(compute_dtype='float32', loss_scale=1.)),
+    ('float16', dict(compute_dtype='float16', loss_scale=128.)),
+    ('bfloat16', dict(compute_dtype='bfloat16', loss_scale=1.)),
+]
+
+
+def train_and_evaluate(policy):
+    tf.reset_default_graph()
+    train_data = load_data('mnist_train.pickle')
+    valid_data = load_data('mnist_validation.pickle')
+    train_tensors = tensors_from_data(train_data, batch_size, axes, shuffle=True)
+    valid_tensors = tensors_from_data(valid_data, batch_size, axes, shuffle=False)
+
+    air = AIRonMNIST(train_tensors['imgs'], train_tensors['nums'], max_steps=3, step_bias=1.,
+                     transform_var_bias=-3., precision=PrecisionPolicy(**policy))
+    train_step, global_step = air.train_step(learning_rate, **default_priors())
+
+    sess = tf.Session()
+    sess.run(tf.global_variables_initializer())
+    for _ in xrange(n_train_iter):
+        sess.run(train_step)
+
+    n_batches = valid_data['imgs'].shape[0] // batch_size
+    exprs = [air.num_step_accuracy, air.rec_loss]
+    results = np.zeros(len(exprs))
+    for _ in xrange(n_batches):
+        imgs, nums = sess.run([valid_tensors['imgs'], valid_tensors['nums']])
+        results += sess.run(exprs, {train_tensors['imgs']: imgs, train_tensors['nums']: nums})
+
+    results /= n_batches
+    return dict(num_step_acc=results[0], rec_loss=results[1])
+
+
+print '{:>9} {:>14} {:>14} {:>14} {:>13} {:>10}'.format(
+    'policy', 'step time [s]', 'samples/sec', 'peak RSS [MB]', 'num_step_acc', 'rec_loss')
+
+for name, policy in policies:
+    try:
+        result = run_in_subprocess(benchmark_train_step, batch_size, n_iter=n_iter,
+                                   precision=PrecisionPolicy(**policy))
+    except RuntimeError as e:
+        print '{:>9} not supported: {}'.format(name, e)
+        continue
+
+    acc = dict(num_step_acc=float('nan'), rec_loss=float('nan'))
+    if n_train_iter > 0:
+        acc = run_in_subprocess(train_and_evaluate, policy)
+
+    print '{:>9} {:>14.4f} {:>14.1f} {:>14.1f} {:>13.4f} {:>10.2f}'.format(
+        name, result['step_time'], result['samples_per_sec'], result['peak_rss_mb'],
+        acc['num_step_acc'], acc['rec_loss'])
@@ -0,0 +1,55 @@
+# coding: utf-8
+"""Gradient noise and step time of the REINFORCE and the marginal presence estimators.
+
+Usage (from `attend_infer_repeat`): python scripts/benchmark_presence_estimator.py
+For a fixed batch of validation images, the gradient of the training objective w.r.t. the parameters of the
+steps predictor is evaluated `n_samples` times; its variance comes from sampling presence (REINFORCE only) and
+`what` and `where` (both). Noisy gradients need small learning rates and many steps, so the signal-to-noise
+ratio is a proxy for wall-clock time to a target `num_step_acc`; compare that directly by training with
+`scripts/multi_mnist.py --presence_estimator marginal --metrics_file ...`.
+"""
+
+import numpy as np
+import tensorflow as tf
+
+from data import load_data
+from mnist_model import AIRonMNIST, multi_mnist_kwargs
+from profiling import default_priors, time_fetches
+
+
+batch_size = 64
+n_samples = 50
+n_iter = 20
+estimators = ['reinforce', 'marginal']
+
+data = load_data('mnist_validation.pickle')
+imgs, nums = data['imgs'][:batch_size], data['nums'][:batch_size]
+
+
+def measure(estimator):
+    tf.reset_default_graph()
+    air = AIRonMNIST(tf.constant(imgs), tf.constant(nums), max_steps=3, presence_estimator=estimator,
+                     **multi_mnist_kwargs)
+    train_step, _ = air.train_step(1e-4, **default_priors())
+
+    objective = air.loss.value
+    if air.use_reinforce:
+        objective += air.reinforce_loss
+    presence_vars = [v for v in tf.trainable_variables() if 'StepsPredictor' in v.name]
+    grads = tf.concat([tf.reshape(g, [-1]) for g in tf.gradients(objective, presence_vars)], 0)
+
+    sess = tf.Session()
+    sess.run(tf.global_variables_initializer())
+    samples = np.stack([sess.run(grads) for _ in xrange(n_samples)])
+    step_time = np.median(time_fetches(sess, train_step, n_iter))
+    sess.close()
+
+    variance = samples.var(0).sum()
+    snr = np.sum(samples.mean(0) ** 2) / max(variance, 1e-12)
+    return variance, snr, step_time
+
+
+print '{:>10} {:>16} {:>10} {:>14}'.format('estimator', 'grad variance', 'SNR', 'step time [s]')
+for estimator in estimators:
+    variance, snr, step_time = measure(estimator)
+    print '{:>10} {:>16.4g} {:>10.4g} {:>14.4f}'.format(estimator, variance, snr, step_time)
@@ -0,0 +1,75 @@
+# coding: utf-8
+"""Throughput and accuracy of warm-started inference on moving multi-MNIST sequences.
+
+Usage (from `attend_infer_repeat`): python scripts/benchmark_sequence.py [<checkpoint>]
+Without a checkpoint the model is randomly initialised, which only makes the throughput numbers meaningful.
+Accuracy is the fraction of frames with the right number of objects; `where` error is the mean absolute
+difference to the `where` codes found by cold-start inference, over objects found by both.
+"""
+
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from data.data import create_moving_mnist
+from mnist_model import multi_mnist_kwargs
+from sequence import SequenceInference, build_sequence_graph
+
+
+batch_size = 64
+n_sequences = 256
+n_frames = 20
+max_steps = 3
+
+configs = [
+    ('cold start', dict(proposals=False, warm_state=False, extra_steps=None)),
+    ('proposals', dict(proposals=True, warm_state=False, extra_steps=None)),
+    ('proposals + state', dict(proposals=True, warm_state=True, extra_steps=None)),
+    ('proposals, n + 1 steps', dict(proposals=True, warm_state=False, extra_steps=1)),
+    ('all, n + 1 steps', dict(proposals=True, warm_state=True, extra_steps=1)),
+]
+
+data = create_moving_mnist(n_sequences=n_sequences, n_frames=n_frames, n_objects=(0, 2))
+imgs = data['imgs'].astype(np.float32) / 255.
+
+air = build_sequence_graph(batch_size, imgs.shape[2:], max_steps, **multi_mnist_kwargs)
+
+sess = tf.Session()
+if len(sys.argv) > 1:
+    air.saver.restore(sess, sys.argv[1])
+else:
+    sess.run(tf.global_variables_initializer())
+
+
+def run(config):
+    inference = SequenceInference(air, sess, **config)
+    results, n_steps, elapsed = [], 0, 0.
+    for start in xrange(0, n_sequences, batch_size):
+        sequences = imgs[start:start + batch_size]
+        begin = time.time()
+        results.append(inference.run_sequences(sequences))
+        elapsed += time.time() - begin
+        n_steps += inference.n_steps_run
+
+    # [n_sequences, n_frames, ...]
+    stack = lambda k: np.concatenate([np.stack([r[k].swapaxes(0, 1) for r in rs], 1) for rs in results])
+    return dict(where=stack('where'), presence=stack('presence')[..., 0] > .5, elapsed=elapsed,
+                steps_per_frame=float(n_steps) / (n_frames * len(results)))
+
+
+# the first run includes graph warm-up
+run(configs[0][1])
+reference = None
+print '{:>24} {:>12} {:>16} {:>10} {:>12}'.format('mode', 'frames/sec', 'steps / frame', 'accuracy', 'where err')
+for name, config in configs:
+    result = run(config)
+    if reference is None:
+        reference = result
+
+    accuracy = np.mean(result['presence'].sum(-1) == data['nums'][:, np.newaxis])
+    both = result['presence'] & reference['presence']
+    where_err = np.abs(result['where'] - reference['where'])[both].mean() if both.any() else float('nan')
+    print '{:>24} {:>12.1f} {:>16.2f} {:>10.3f} {:>12.4f}'.format(
+        name, n_sequences * n_frames / result['elapsed'], result['steps_per_frame'], accuracy, where_err)
@@ -0,0 +1,75 @@
+# coding: utf-8
+"""Load generation against a local AIR server.
+
+Usage (from `attend_infer_repeat`): python scripts/benchmark_serving.py <exported .pb>
+Starts the server on localhost and, for every number of concurrent clients, sends requests of 1 to
+`max_images_per_request` images for `duration` seconds. Reports client-side throughput and latency together with
+the server metrics.
+"""
+
+import sys
+import json
+import time
+import threading
+import urllib2
+
+import numpy as np
+
+from export import load_inference_fn
+from serving import AIRServer, DynamicBatcher
+
+
+port = 8123
+n_clients = [1, 4, 16, 64]
+max_images_per_request = 4
+duration = 10.
+max_latency = .01
+
+url = 'http://localhost:{}'.format(port)
+
+
+def client(latencies, stop):
+    while not stop.is_set():
+        n = np.random.randint(1, max_images_per_request + 1)
+        body = json.dumps(dict(images=np.random.rand(n, 50, 50).round(3).tolist()))
+
+        start = time.time()
+        urllib2.urlopen(url + '/decompose', body).read()
+        latencies.append((time.time() - start, n))
+
+
+def run(n):
+    stop = threading.Event()
+    latencies = [[] for _ in xrange(n)]
+    threads = [threading.Thread(target=client, args=(l, stop)) for l in latencies]
+    for t in threads:
+        t.start()
+
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    latencies = [l for ls in latencies for l in ls]
+    times = np.asarray([l[0] for l in latencies]) * 1e3
+    n_images = sum(l[1] for l in latencies)
+    return len(latencies) / duration, n_images / duration, np.percentile(times, 50), np.percentile(times, 99)
+
+
+batcher = DynamicBatcher(load_inference_fn(sys.argv[1]), max_latency=max_latency)
+server = AIRServer(('localhost', port), batcher)
+server_thread = threading.Thread(target=server.serve_forever)
+server_thread.daemon = True
+server_thread.start()
+
+print '{:>8} {:>14} {:>12} {:>10} {:>10} {:>16} {:>16}'.format(
+    'clients', 'requests/sec', 'images/sec', 'p50 [ms]', 'p99 [ms]', 'mean batch size', 'server p99 [ms]')
+
+for n in n_clients:
+    batcher.reset_metrics()
+    requests_per_sec, images_per_sec, p50, p99 = run(n)
+    metrics = json.loads(urllib2.urlopen(url + '/metrics').read())
+    print '{:>8} {:>14.1f} {:>12.1f} {:>10.2f} {:>10.2f} {:>16.2f} {:>16.2f}'.format(
+        n, requests_per_sec, images_per_sec, p50, p99, metrics['mean_batch_size'], metrics['latency_p99_ms'])
+
+server.shutdown()
@@ -0,0 +1,44 @@
+# coding: utf-8
+"""Training throughput of M stacked models in one graph against M separate processes training at the same time."""
+
+import multiprocessing
+
+import numpy as np
+
+from mnist_model import multi_mnist_kwargs
+from profiling import benchmark_train_step, run_in_subprocess
+
+
+batch_size = 64
+n_models = [1, 2, 4, 8]
+n_iter = 20
+
+
+def _train_step_time(n):
+    return benchmark_train_step(batch_size, n_iter=n_iter, **multi_mnist_kwargs)['step_time']
+
+
+def separate_processes(n):
+    pool = multiprocessing.Pool(n, maxtasksperchild=1)
+    try:
+        step_times = pool.map(_train_step_time, range(n))
+    finally:
+        pool.close()
+        pool.join()
+    # every process trains one model on a batch per step
+    return n * batch_size / float(np.mean(step_times))
+
+
+def stacked(n):
+    kwargs = dict(multi_mnist_kwargs, n_models=n)
+    result = run_in_subprocess(benchmark_train_step, n * batch_size, n_iter=n_iter, **kwargs)
+    return result['samples_per_sec'], result['peak_rss_mb']
+
+
+print '{:>8} {:>24} {:>22} {:>10} {:>20}'.format('models', 'separate [samples/sec]', 'stacked [samples/sec]',
+                                                  'speedup', 'stacked RSS [MB]')
+for n in n_models:
+    separate = separate_processes(n)
+    stacked_throughput, rss = stacked(n)
+    print '{:>8} {:>24.1f} {:>22.1f} {:>10.2f} {:>20.1f}'.format(n, separate, stacked_throughput,
+                                                                 stacked_throughput / separate, rss)
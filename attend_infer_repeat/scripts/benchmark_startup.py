@@ -0,0 +1,79 @@
+# coding: utf-8
+"""Start-up cost of a training or inference job: module imports, graph construction and graph import.
+
+Usage (from `attend_infer_repeat`): python scripts/benchmark_startup.py
+Every measurement runs in a fresh interpreter, so that nothing is cached in `sys.modules` or the default graph.
+Graph construction builds `AIRonMNIST` with a training step; graph import reads the same graph exported with
+`graph_cache.export_graph` and is followed by a training step to check that the imported graph works.
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+
+
+modules = ['tensorflow', 'sonnet', 'data', 'evaluation', 'model', 'mnist_model']
+batch_size = 64
+
+_measure_import = """
+import sys, time, json
+start = time.time()
+import {module}
+print json.dumps(dict(time=time.time() - start, matplotlib='matplotlib' in sys.modules, scipy='scipy' in sys.modules))
+"""
+
+_measure_build = """
+import time, json
+start = time.time()
+import tensorflow as tf
+from graph_cache import export_graph
+from mnist_model import multi_mnist_kwargs
+from profiling import build_benchmark_air
+imported = time.time()
+air, train_step = build_benchmark_air({batch_size}, **multi_mnist_kwargs)
+built = time.time()
+export_graph({path!r}, dict(train_step=train_step))
+print json.dumps(dict(imports=imported - start, build=built - imported, export=time.time() - built))
+"""
+
+_measure_graph_import = """
+import time, json
+start = time.time()
+import tensorflow as tf
+from graph_cache import import_graph
+imported = time.time()
+handle = import_graph({path!r})
+graph_imported = time.time()
+sess = tf.Session()
+sess.run(tf.global_variables_initializer())
+sess.run(handle.train_step)
+print json.dumps(dict(imports=imported - start, graph_import=graph_imported - imported,
+                      first_step=time.time() - graph_imported))
+"""
+
+
+def run(code):
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=os.getcwd(), stderr=open(os.devnull, 'w'))
+    return json.loads(output.strip().splitlines()[-1])
+
+
+print '{:>14} {:>12} {:>12} {:>8}'.format('module', 'import [s]', 'matplotlib', 'scipy')
+for module in modules:
+    result = run(_measure_import.format(module=module))
+    print '{:>14} {:>12.2f} {:>12} {:>8}'.format(module, result['time'], result['matplotlib'], result['scipy'])
+
+tmp_dir = tempfile.mkdtemp()
+try:
+    path = os.path.join(tmp_dir, 'air_train.meta')
+    built = run(_measure_build.format(batch_size=batch_size, path=path))
+    imported = run(_measure_graph_import.format(path=path))
+finally:
+    shutil.rmtree(tmp_dir)
+
+print
+print 'Build:  imports {imports:.2f}s, graph construction {build:.2f}s (export {export:.2f}s)'.format(**built)
+print 'Import: imports {imports:.2f}s, graph import {graph_import:.2f}s, ' \
+      'first training step {first_step:.2f}s'.format(**imported)
@@ -1,30 +1,71 @@
 
 # coding: utf-8
 
+import json
 from os import path as osp
 import numpy as np
 import tensorflow as tf
 import sonnet as snt
 from attrdict import AttrDict
 
+from batch_finder import load_batch_config
 from evaluation import make_fig, make_logger
+from profiling import profile_step
+from training import NumericsWatchdog
 
 from data import load_data, tensors_from_data
+from data.online import OnlineScenes, SceneSynthesiser
 from mnist_model import AIRonMNIST
 
 
+# In[ ]:
+
+flags = tf.flags
+flags.DEFINE_string('profile_steps', '', 'Comma-separated training steps at which per-op run metadata is captured; '
+                    'a Chrome trace and a summary table per module scope are written to the log directory.')
+flags.DEFINE_string('run_name', 'multi_mnist', 'Name of the log directory in `results_dir`.')
+flags.DEFINE_integer('seed', None, 'Seed for numpy and TensorFlow; random if not given.')
+flags.DEFINE_integer('max_train_iter', int(300 * 1e3), 'Number of training iterations.')
+flags.DEFINE_string('metrics_file', '', 'If given, train and test metrics are appended to this file as JSON lines '
+                    'whenever they are evaluated.')
+flags.DEFINE_boolean('mmap_data', False, 'Memory-maps the datasets from `.npy` files instead of loading them into '
+                     'memory, so that runs in parallel share one copy.')
+flags.DEFINE_integer('n_threads', 0, 'Number of threads for TensorFlow ops; 0 lets TensorFlow decide.')
+flags.DEFINE_integer('n_models', 0, 'If > 0, trains this many independent models with stacked parameters in one '
+                     'graph; checkpoints can be split per model with `stacked.py`.')
+flags.DEFINE_boolean('guard_numerics', True, 'Skips updates with a non-finite loss or gradient norm and rolls back '
+                     'to the last good checkpoint with a reduced learning rate after `max_skipped_steps` in a row. '
+                     'Disabled with `n_models` > 1, where one diverging model would skip the updates of all models.')
+flags.DEFINE_integer('max_skipped_steps', 10, 'Number of consecutive skipped steps that triggers a rollback.')
+flags.DEFINE_string('presence_estimator', 'reinforce', 'Gradient estimator for the number of steps: "reinforce" '
+                    'or "marginal", which sums over all numbers of steps exactly; see `AIRModel`.')
+flags.DEFINE_string('core', 'sequential', 'Inference core: "sequential" infers one object after the other, '
+                    '"parallel" all `max_steps` objects at once; see `AIRModel`.')
+flags.DEFINE_string('batch_config', '', 'Report written by `batch_finder.py`; its recommended batch size and '
+                    '`max_steps` replace the defaults.')
+flags.DEFINE_integer('online_data', 0, 'If > 0, trains on fresh scenes synthesised by this many worker processes '
+                     'instead of `mnist_train.pickle`.')
+F = flags.FLAGS
+
+
 # In[ ]:
 
 learning_rate = 1e-4
 batch_size = 64
 n_steps = 3
+if F.batch_config:
+    if F.n_models:
+        # the batch finder measures a single model, not the folded batch of `n_models` models
+        raise ValueError('--batch_config is not supported together with --n_models')
+    batch_size, n_steps = load_batch_config(F.batch_config)
 
 results_dir = '../results'
-run_name = 'multi_mnist'
+run_name = F.run_name
 
 logdir = osp.join(results_dir, run_name)
 checkpoint_name = osp.join(logdir, 'model.ckpt')
-axes = {'imgs': 0, 'labels': 0, 'nums': 1}
+axes = {'imgs': 0, 'labels': 0, 'nums': 0}
+profile_steps = set(int(s) for s in F.profile_steps.split(',') if s)
 
 
 # In[ ]:
@@ -55,15 +96,30 @@ l2_weight = 0.
 
 # In[ ]:
 
-valid_data = load_data('mnist_validation.pickle')
-train_data = load_data('mnist_train.pickle')
+valid_data = load_data('mnist_validation.pickle', mmap=F.mmap_data)
+if not F.online_data:
+    train_data = load_data('mnist_train.pickle', mmap=F.mmap_data)
 
 
 # In[ ]:
 
+n_models = F.n_models or None
+# the check is global to all stacked models
+guard_numerics = F.guard_numerics and (n_models or 1) == 1
+
 tf.reset_default_graph()
-train_tensors = tensors_from_data(train_data, batch_size, axes, shuffle=True)
-valid_tensors = tensors_from_data(valid_data, batch_size, axes, shuffle=False)
+if F.seed is not None:
+    np.random.seed(F.seed)
+    tf.set_random_seed(F.seed)
+
+# stacked models get a minibatch each, folded into one batch
+if F.online_data:
+    online_scenes = OnlineScenes(SceneSynthesiser.from_mnist('train'), batch_size * (n_models or 1),
+                                 n_workers=F.online_data, seed=F.seed).start()
+    train_tensors = online_scenes.tensors()
+else:
+    train_tensors = tensors_from_data(train_data, batch_size * (n_models or 1), axes, shuffle=True)
+valid_tensors = tensors_from_data(valid_data, batch_size * (n_models or 1), axes, shuffle=False)
 x, valid_x = train_tensors['imgs'], valid_tensors['imgs']
 y, valid_y = train_tensors['nums'], valid_tensors['nums']
     
@@ -81,19 +137,24 @@ air = AIRonMNIST(x, y,
                 steps_pred_hidden=[128, 64],
                 baseline_hidden=[256, 128],
                 transform_var_bias=transform_var_bias,
-                step_bias=step_bias)
+                step_bias=step_bias,
+                n_models=n_models,
+                presence_estimator=F.presence_estimator,
+                core=F.core)
 
 
 # In[ ]:
 
 train_step, global_step = air.train_step(learning_rate, l2_weight, appearance_prior, where_scale_prior,
-                            where_shift_prior, num_steps_prior)
+                            where_shift_prior, num_steps_prior, guard_numerics=guard_numerics)
 
 
 # In[ ]:
 
 config = tf.ConfigProto()
 config.gpu_options.allow_growth = True
+if F.n_threads > 0:
+    config.intra_op_parallelism_threads = config.inter_op_parallelism_threads = F.n_threads
     
 sess = tf.Session(config=config)
 sess.run(tf.global_variables_initializer())
@@ -104,33 +165,83 @@ all_summaries = tf.summary.merge_all()
 
 summary_writer = tf.summary.FileWriter(logdir, sess.graph)
 saver = tf.train.Saver(max_to_keep=100)
+watchdog = None
+if guard_numerics:
+    watchdog = NumericsWatchdog(air, sess, saver, max_consecutive=F.max_skipped_steps)
 
 # In[ ]:
 
-train_batches = train_data['imgs'].shape[0]
 valid_batches = valid_data['imgs'].shape[0]
+# online data is endless, train metrics are evaluated on as many samples as test metrics
+train_batches = valid_batches if F.online_data else train_data['imgs'].shape[0]
 log = make_logger(air, sess, summary_writer, train_tensors, train_batches, valid_tensors, valid_batches)
 
 
+def per_model_metrics():
+    """Test metrics of every stacked model."""
+    n_batches = valid_batches // air.batch_size
+    metrics = {k: 0. for k in air.per_model_metrics}
+    for _ in xrange(n_batches):
+        imgs, nums = sess.run([valid_x, valid_y])
+        values = sess.run(air.per_model_metrics, {x: imgs, y: nums})
+        for k, v in values.iteritems():
+            metrics[k] += v / n_batches
+    return metrics
+
+
+def log_metrics(train_itr):
+    metrics = log(train_itr)
+    if n_models is not None:
+        per_model = per_model_metrics()
+        print 'Per-model test num_step_acc: {}'.format(np.round(per_model['num_step_acc'], 4))
+        metrics['per_model'] = {k: v.tolist() for k, v in per_model.iteritems()}
+
+    if F.metrics_file:
+        metrics = {name: {k: l[k] if name == 'per_model' else float(l[k]) for k in l}
+                   for name, l in metrics.iteritems()}
+        with open(F.metrics_file, 'a') as f:
+            f.write(json.dumps(dict(itr=int(train_itr), **metrics)) + '\n')
+
+
 # In[ ]:
 
 train_itr = sess.run(global_step)
 print 'Starting training at iter = {}'.format(train_itr)
 
 if train_itr == 0:
-    log(0)
+    log_metrics(0)
+
+fetches = [global_step, train_step]
+if watchdog is not None:
+    fetches.append(air.n_skipped_steps)
+    # something to roll back to
+    watchdog.save(checkpoint_name, train_itr)
 
-while train_itr <= 300 * 1e3:
+while train_itr <= F.max_train_iter:
         
-    train_itr, _ = sess.run([global_step, train_step])
+    if train_itr in profile_steps:
+        values = profile_step(sess, fetches, logdir, train_itr)
+    else:
+        values = sess.run(fetches)
+    train_itr = values[0]
+
+    if watchdog is not None and watchdog.after_step(values[-1]):
+        train_itr = sess.run(global_step)
+        continue
     
     if train_itr % 1000 == 0:
         summaries = sess.run(all_summaries)
         summary_writer.add_summary(summaries, train_itr)
         
     if train_itr % 10000 == 0:
-        log(train_itr)
+        log_metrics(train_itr)
+        if F.online_data:
+            print 'Online data: {}'.format(online_scenes.metrics())
         
     if train_itr % 10000 == 0:
-        saver.save(sess, checkpoint_name, global_step=train_itr)
+        if watchdog is not None:
+            watchdog.save(checkpoint_name, train_itr)
+            print 'Skipped {} non-finite steps so far'.format(watchdog.n_skipped)
+        else:
+            saver.save(sess, checkpoint_name, global_step=train_itr)
         make_fig(air, sess, logdir, train_itr)    
@@ -0,0 +1,115 @@
+"""Frame-by-frame inference on image sequences, warm-started from the previous frame.
+
+Objects barely move between consecutive frames of a video, so the posterior of one frame is a good starting point
+for the next. `SequenceInference` runs an `AIRModel` built with `sequence_mode=True` on a batch of sequences one
+frame at a time and:
+
+ * proposes the `where` codes of objects found in the previous frame at the same steps,
+ * optionally starts the RNN from the final state of the previous frame instead of the learned initial state,
+ * runs only as many steps as there were objects in the previous frame plus `extra_steps`, which lets a new
+   object enter while skipping steps that would find nothing if the object set is unchanged.
+
+`build_sequence_graph` builds the model for it, and can import a serialised copy instead in inference workers.
+"""
+import numpy as np
+import tensorflow as tf
+from tensorflow.python.util import nest
+from attrdict import AttrDict
+
+from graph_cache import cached_graph
+
+
+_SEQUENCE_OUTPUTS = ('obs', 'what', 'where', 'presence', 'final_state', 'where_proposals', 'proposal_mask',
+                     'warm_what', 'warm_where', 'warm_hidden', 'step_limit')
+
+
+def build_sequence_graph(batch_size, img_size=(50, 50), max_steps=3, cache_path=None, **model_kwargs):
+    """Builds a deterministic `AIRonMNIST` in sequence mode, or imports it from `cache_path` if that exists.
+
+    :param cache_path: string or None; if given, the graph is built once and written there, see `graph_cache`
+    :return: AttrDict with the tensors `SequenceInference` uses, `max_steps` and a `saver` for the variables
+    """
+    def build():
+        from mnist_model import AIRonMNIST
+
+        obs = tf.placeholder(tf.float32, (batch_size,) + tuple(img_size), name='obs')
+        air = AIRonMNIST(obs, None, max_steps=max_steps, deterministic=True, sequence_mode=True, **model_kwargs)
+        return {k: getattr(air, k) for k in _SEQUENCE_OUTPUTS}, dict(max_steps=max_steps)
+
+    if cache_path is not None:
+        return cached_graph(cache_path, build)
+
+    outputs, constants = build()
+    return AttrDict(outputs, saver=tf.train.Saver(), **constants)
+
+
+class SequenceInference(object):
+    """Stateful frame-by-frame inference.
+
+    :param air: `AIRModel` built with `sequence_mode=True`, typically with `deterministic=True`, or the result of
+        `build_sequence_graph`
+    :param sess: tf.Session with restored model variables
+    :param proposals: boolean, proposes `where` from the previous frame if True
+    :param warm_state: boolean, starts from the final RNN state of the previous frame if True
+    :param extra_steps: int or None; steps run on top of the number of objects in the previous frame, None runs
+        all `max_steps` steps
+    """
+
+    def __init__(self, air, sess, proposals=True, warm_state=True, extra_steps=1, presence_threshold=.5):
+        self.air = air
+        self.sess = sess
+        self.proposals = proposals
+        self.warm_state = warm_state
+        self.extra_steps = extra_steps
+        self.presence_threshold = presence_threshold
+
+        self._fetches = dict(what=air.what, where=air.where, presence=air.presence,
+                             final_state=air.final_state[2:5])
+        self.reset()
+
+    def reset(self):
+        """Forgets the previous frame, e.g. at the start of new sequences."""
+        self._previous = None
+        self.n_steps_run = 0
+
+    def _feed_dict(self, frames):
+        feed_dict = {self.air.obs: frames}
+        if self._previous is None:
+            return feed_dict
+
+        presence = np.greater(self._previous['presence'], self.presence_threshold).astype(np.float32)
+        if self.proposals:
+            feed_dict[self.air.where_proposals] = self._previous['where']
+            feed_dict[self.air.proposal_mask] = presence
+
+        if self.warm_state:
+            what, where, hidden = self._previous['final_state']
+            feed_dict[self.air.warm_what] = what
+            feed_dict[self.air.warm_where] = where
+            for placeholder, value in zip(nest.flatten(self.air.warm_hidden), nest.flatten(hidden)):
+                feed_dict[placeholder] = value
+
+        if self.extra_steps is not None:
+            n_objects = presence.sum((0, 2)).astype(np.int32)
+            feed_dict[self.air.step_limit] = np.minimum(n_objects + self.extra_steps, self.air.max_steps)
+
+        return feed_dict
+
+    def __call__(self, frames):
+        """Infers the next frame of every sequence in the batch.
+
+        :param frames: np.array of shape [batch_size, height, width]
+        :return: dict with time-major `what`, `where` and `presence`
+        """
+        feed_dict = self._feed_dict(frames)
+        step_limit = feed_dict.get(self.air.step_limit)
+        self.n_steps_run += self.air.max_steps if step_limit is None else step_limit.max()
+
+        self._previous = self.sess.run(self._fetches, feed_dict)
+        return {k: v for k, v in self._previous.iteritems() if k != 'final_state'}
+
+    def run_sequences(self, sequences):
+        """Runs inference on np.array of shape [batch_size, n_frames, height, width] and returns a list of
+        per-frame results."""
+        self.reset()
+        return [self(sequences[:, t]) for t in xrange(sequences.shape[1])]
@@ -0,0 +1,267 @@
+"""Local HTTP service returning AIR scene decompositions, with dynamic request batching.
+
+Run from `attend_infer_repeat` with a graph written by `export.py`:
+
+    python serving.py --model air.pb --port 8000
+
+POST /decompose with a JSON body {"images": [image, ...]}, where every image is a list of rows of pixel
+intensities in [0, 1], returns {"objects": [[object, ...], ...]} with one list of objects per image. Every object
+is a dict with its step, `where` code and `what` code. GET /metrics returns queue depth, request latency
+percentiles and batch statistics, and statistics of the result cache if `--cache_size` is set.
+"""
+import sys
+import json
+import time
+import argparse
+import threading
+import collections
+import Queue
+import SocketServer
+import BaseHTTPServer
+
+import numpy as np
+
+
+class _Request(object):
+
+    def __init__(self, imgs):
+        self.imgs = imgs
+        self.arrival = time.time()
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+
+    def set_result(self, result=None, error=None):
+        self.result, self.error = result, error
+        self._done.set()
+
+    def wait(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise RuntimeError('No result after {}s'.format(timeout))
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class DynamicBatcher(object):
+    """Coalesces requests into batches for `infer_fn`.
+
+    A batch is run as soon as it holds `max_batch_size` images or when the oldest request in it has waited for
+    `max_latency` seconds, whichever comes first. Requests are never split between batches; a request bigger than
+    `max_batch_size` runs on its own, split into calls of `infer_fn` with at most `max_batch_size` images.
+
+    :param infer_fn: callable mapping an array of images to a dict of arrays with the same leading dimension,
+        e.g. `export.InferenceFunction`, which also pads batches to the size the graph was compiled for
+    :param max_batch_size: int, defaults to `infer_fn.batch_size`
+    :param max_latency: float, in seconds
+    :param n_latencies: int, number of most recent request latencies used for percentiles
+    """
+
+    def __init__(self, infer_fn, max_batch_size=None, max_latency=.01, n_latencies=10000):
+        self._infer_fn = infer_fn
+        self.img_size = getattr(infer_fn, 'img_size', None)
+        self.max_batch_size = max_batch_size or infer_fn.batch_size
+        if self.max_batch_size is None:
+            raise ValueError('max_batch_size is required for models that take batches of any size')
+        self.max_latency = max_latency
+
+        self._queue = Queue.Queue()
+        self._pending = None
+        self._lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=n_latencies)
+        self._n_requests = 0
+        self._n_images = 0
+        self._n_batches = 0
+
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __call__(self, imgs, timeout=None):
+        """Blocks until `imgs` have been processed and returns the outputs of `infer_fn` for them; raises a
+        RuntimeError if that takes longer than `timeout` seconds."""
+        request = _Request(np.asarray(imgs, dtype=np.float32))
+        self._queue.put(request)
+        return request.wait(timeout)
+
+    def _next_batch(self):
+        requests = [self._pending or self._queue.get()]
+        self._pending = None
+        n_images = len(requests[0].imgs)
+        deadline = requests[0].arrival + self.max_latency
+
+        while n_images < self.max_batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except Queue.Empty:
+                break
+
+            if n_images + len(request.imgs) > self.max_batch_size:
+                self._pending = request
+                break
+
+            requests.append(request)
+            n_images += len(request.imgs)
+
+        return requests
+
+    def _run(self):
+        while True:
+            requests = self._next_batch()
+            try:
+                # raises for requests with different image sizes, which then fail together
+                imgs = np.concatenate([r.imgs for r in requests], 0)
+                chunks = [self._infer_fn(imgs[i:i + self.max_batch_size])
+                          for i in xrange(0, len(imgs), self.max_batch_size)]
+            except Exception as e:
+                for r in requests:
+                    r.set_result(error=e)
+                continue
+
+            if len(chunks) == 1:
+                outputs = chunks[0]
+            else:
+                outputs = {k: np.concatenate([c[k] for c in chunks], 0) for k in chunks[0]}
+
+            start = 0
+            now = time.time()
+            with self._lock:
+                for r in requests:
+                    end = start + len(r.imgs)
+                    r.set_result({k: v[start:end] for k, v in outputs.iteritems()})
+                    self._latencies.append(now - r.arrival)
+                    start = end
+
+                self._n_requests += len(requests)
+                self._n_images += len(imgs)
+                self._n_batches += len(chunks)
+
+    def reset_metrics(self):
+        with self._lock:
+            self._latencies.clear()
+            self._n_requests = self._n_images = self._n_batches = 0
+
+    def metrics(self):
+        with self._lock:
+            latencies = np.asarray(self._latencies) * 1e3
+            n_batches = max(self._n_batches, 1)
+            metrics = dict(
+                queue_depth=self._queue.qsize() + int(self._pending is not None),
+                n_requests=self._n_requests,
+                n_images=self._n_images,
+                n_batches=self._n_batches,
+                mean_batch_size=self._n_images / float(n_batches),
+            )
+
+        if len(latencies) > 0:
+            metrics['latency_p50_ms'] = float(np.percentile(latencies, 50))
+            metrics['latency_p99_ms'] = float(np.percentile(latencies, 99))
+        return metrics
+
+
+def objects_from_outputs(outputs, presence_threshold=.5):
+    """Turns batch-major `what`/`where`/`presence` arrays into a list of present objects for every image."""
+    objects = []
+    for what, where, presence in zip(outputs['what'], outputs['where'], outputs['presence']):
+        steps = np.where(presence > presence_threshold)[0]
+        objects.append([dict(step=int(s), where=where[s].tolist(), what=what[s].tolist()) for s in steps])
+    return objects
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        metrics = self.server.batcher.metrics()
+        if self.server.cache is not None:
+            metrics['cache'] = self.server.cache.metrics()
+        self._respond(metrics)
+
+    def do_POST(self):
+        if self.path != '/decompose':
+            self.send_error(404)
+            return
+
+        try:
+            length = int(self.headers.getheader('content-length'))
+            imgs = np.asarray(json.loads(self.rfile.read(length))['images'], dtype=np.float32)
+            if imgs.ndim != 3:
+                raise ValueError('Expected a list of 2D images but got an array of shape {}'.format(imgs.shape))
+            img_size = self.server.batcher.img_size
+            if img_size is not None and imgs.shape[1:] != tuple(img_size):
+                raise ValueError('Expected images of size {} but got {}'.format(tuple(img_size), imgs.shape[1:]))
+        except (KeyError, ValueError, TypeError) as e:
+            self.send_error(400, str(e))
+            return
+
+        try:
+            outputs = (self.server.cache or self.server.batcher)(imgs, timeout=self.server.request_timeout)
+        except Exception as e:
+            self.send_error(500, str(e))
+            return
+        self._respond(dict(objects=objects_from_outputs(outputs)))
+
+    def _respond(self, content):
+        body = json.dumps(content)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class AIRServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, batcher, cache=None, request_timeout=30.):
+        """`cache` is an optional `inference_cache.CachedInference` wrapping `batcher`; requests that take longer
+        than `request_timeout` seconds fail with status 500."""
+        BaseHTTPServer.HTTPServer.__init__(self, address, _Handler)
+        self.batcher = batcher
+        self.cache = cache
+        self.request_timeout = request_timeout
+
+
+def main(argv=None):
+    from inference_cache import CachedInference, model_id
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', required=True, help='graph exported with `export.py` or, served without '
+                                                       'TensorFlow, weights converted with `numpy_inference.py`')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max_batch_size', type=int, default=None)
+    parser.add_argument('--max_latency_ms', type=float, default=10.)
+    parser.add_argument('--request_timeout', type=float, default=30., help='seconds before a request fails')
+    parser.add_argument('--cache_size', type=int, default=0, help='number of images in the in-memory result cache')
+    parser.add_argument('--cache_dir', default=None, help='directory of the on-disk result cache')
+    parser.add_argument('--cache_disk_size', type=int, default=100000,
+                        help='number of images in the on-disk result cache; 0 is unbounded')
+    args = parser.parse_args(argv)
+
+    if args.model.endswith('.npz'):
+        from numpy_inference import load_inference_fn
+    else:
+        from export import load_inference_fn
+
+    batcher = DynamicBatcher(load_inference_fn(args.model), args.max_batch_size, args.max_latency_ms / 1e3)
+    cache = None
+    if args.cache_size > 0 or args.cache_dir is not None:
+        cache = CachedInference(batcher, model_id(args.model), args.cache_size, args.cache_dir,
+                                args.cache_disk_size or None)
+
+    server = AIRServer((args.host, args.port), batcher, cache, args.request_timeout)
+    print 'Serving on {}:{}'.format(args.host, args.port)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""Per-model checkpoints of stacked models trained with `AIRModel(n_models=M)`.
+
+Run from `attend_infer_repeat`:
+
+    python stacked.py --checkpoint ../results/stacked/model.ckpt-300000 --n_models 4 --output ../results/stacked/model
+
+writes `model_0-300000`, `model_1-300000`, ..., each restorable by the usual single `AIRonMNIST`, e.g. with
+`export.py`. Only trainable variables and the global step are written; optimiser state is not.
+"""
+import sys
+import json
+import argparse
+
+import tensorflow as tf
+
+
+def match_variables(stacked, single, n_models):
+    """Pairs variables of the stacked model with those of a single model.
+
+    Variables are matched by name and, where names differ (e.g. trainable initial states of the LSTM), by order
+    of creation. Every stacked variable must have the shape of its single counterpart with `n_models` prepended.
+    """
+    by_name = {v.op.name: v for v in stacked}
+    pairs, unmatched_single = [], []
+    for v in single:
+        if v.op.name in by_name:
+            pairs.append((by_name.pop(v.op.name), v))
+        else:
+            unmatched_single.append(v)
+
+    unmatched_stacked = [v for v in stacked if v.op.name in by_name]
+    if len(unmatched_stacked) != len(unmatched_single):
+        raise ValueError('Stacked and single models have different numbers of variables: {} vs {}'.format(
+            len(stacked), len(single)))
+    pairs += zip(unmatched_stacked, unmatched_single)
+
+    for s, v in pairs:
+        expected = [n_models] + v.get_shape().as_list()
+        if s.get_shape().as_list() != expected:
+            raise ValueError('Variable "{}" of shape {} does not stack "{}" of shape {}'.format(
+                s.op.name, s.get_shape(), v.op.name, v.get_shape()))
+    return pairs
+
+
+def split_checkpoint(checkpoint_path, build_model, n_models, output_prefix):
+    """Writes a checkpoint for every one of `n_models` stacked models.
+
+    :param build_model: callable building the model in the default graph given `n_models` (None for a single
+        model); has to create the same variables as the training script, e.g. by also building `train_step`
+    :return: list of paths of the written checkpoints
+    """
+    reader = tf.train.NewCheckpointReader(checkpoint_path)
+
+    with tf.Graph().as_default():
+        build_model(n_models)
+        stacked = tf.trainable_variables()
+
+    with tf.Graph().as_default():
+        build_model(None)
+        pairs = match_variables(stacked, tf.trainable_variables(), n_models)
+        global_step = tf.train.get_or_create_global_step()
+        step = int(reader.get_tensor(global_step.op.name)) if reader.has_tensor(global_step.op.name) else 0
+
+        placeholders = [tf.placeholder(v.dtype.base_dtype, v.get_shape()) for _, v in pairs]
+        assign = [tf.assign(v, p) for (_, v), p in zip(pairs, placeholders)]
+        assign.append(tf.assign(global_step, step))
+        saver = tf.train.Saver([v for _, v in pairs] + [global_step])
+
+        paths = []
+        with tf.Session() as sess:
+            values = [reader.get_tensor(s.op.name) for s, _ in pairs]
+            for m in xrange(n_models):
+                sess.run(assign, {p: value[m] for p, value in zip(placeholders, values)})
+                paths.append(saver.save(sess, '{}_{}'.format(output_prefix, m), global_step=step))
+    return paths
+
+
+def build_multi_mnist(n_models, max_steps=3, img_size=(50, 50), **model_kwargs):
+    """Builds `AIRonMNIST` with the hyperparameters and training ops of `scripts/multi_mnist.py`."""
+    from mnist_model import AIRonMNIST, multi_mnist_kwargs
+    from profiling import default_priors
+
+    batch_size = n_models or 1
+    obs = tf.placeholder(tf.float32, (batch_size,) + tuple(img_size))
+    nums = tf.placeholder(tf.float32, (max_steps, batch_size, 1))
+    air = AIRonMNIST(obs, nums, max_steps=max_steps, explore_eps=0., n_models=n_models,
+                     **dict(multi_mnist_kwargs, **model_kwargs))
+    air.train_step(1e-4, **default_priors())
+    return air
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checkpoint', required=True)
+    parser.add_argument('--n_models', type=int, required=True)
+    parser.add_argument('--output', required=True, help='prefix of the written checkpoints')
+    parser.add_argument('--model_kwargs', default='{}',
+                        help='JSON dict overriding the hyperparameters in `mnist_model.multi_mnist_kwargs`')
+    args = parser.parse_args(argv)
+
+    model_kwargs = json.loads(args.model_kwargs)
+    build = lambda n_models: build_multi_mnist(n_models, **model_kwargs)
+    for path in split_checkpoint(args.checkpoint, build, args.n_models, args.output):
+        print 'Wrote "{}"'.format(path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
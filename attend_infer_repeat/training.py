@@ -0,0 +1,83 @@
+"""Host-side helpers for long training runs."""
+import tensorflow as tf
+
+
+class NumericsWatchdog(object):
+    """Rolls training back to the last good checkpoint after repeated non-finite updates.
+
+    Works with a model built with `train_step(..., guard_numerics=True)`, which skips non-finite updates in-graph
+    and counts them in `skipped_steps`. Call `after_step` with `n_skipped_steps`, fetched with every training
+    step, and use `save` instead of `saver.save`. A checkpoint counts as good if no step was skipped since the
+    previous one. After `max_consecutive` skipped steps in a row, the last good checkpoint is restored and the learning
+    rate is multiplied by `lr_decay`.
+
+    :param air: `AIRModel` with training ops
+    :param saver: tf.train.Saver
+    :param max_rollbacks: int, a RuntimeError is raised when training keeps failing after this many rollbacks
+    """
+
+    def __init__(self, air, sess, saver, max_consecutive=10, lr_decay=.5, max_rollbacks=5):
+        self.air = air
+        self.sess = sess
+        self.saver = saver
+        self.max_consecutive = max_consecutive
+        self.lr_decay = lr_decay
+        self.max_rollbacks = max_rollbacks
+
+        self._learning_rate = tf.placeholder(tf.float32, ())
+        self._set_learning_rate = tf.assign(air.learning_rate, self._learning_rate)
+
+        self.last_good = None
+        self.n_skipped = 0
+        self.n_rollbacks = 0
+        self._consecutive = 0
+        self._skipped_counter = None
+        self._skipped_since_save = 0
+
+    def save(self, checkpoint_name, global_step):
+        """Saves a checkpoint and remembers it as good if no step was skipped since the last one."""
+        path = self.saver.save(self.sess, checkpoint_name, global_step=global_step)
+        if self._skipped_since_save == 0:
+            self.last_good = path
+        self._skipped_since_save = 0
+        return path
+
+    def after_step(self, skipped_counter):
+        """Takes the value of `air.n_skipped_steps` fetched with a step; returns True if training was rolled back."""
+        if self._skipped_counter is None or skipped_counter < self._skipped_counter:
+            # first call or the counter was restored from a checkpoint
+            self._skipped_counter = skipped_counter
+            return False
+
+        n_new = skipped_counter - self._skipped_counter
+        self._skipped_counter = skipped_counter
+        if n_new == 0:
+            self._consecutive = 0
+            return False
+
+        self.n_skipped += n_new
+        self._skipped_since_save += n_new
+        self._consecutive += n_new
+        if self._consecutive < self.max_consecutive:
+            return False
+
+        self.rollback()
+        return True
+
+    def rollback(self):
+        if self.last_good is None:
+            raise RuntimeError('Training diverged after {} skipped steps and there is no good checkpoint to roll '
+                               'back to'.format(self.n_skipped))
+        if self.n_rollbacks >= self.max_rollbacks:
+            raise RuntimeError('Training still diverges after {} rollbacks'.format(self.n_rollbacks))
+
+        learning_rate = self.sess.run(self.air.learning_rate) * self.lr_decay
+        self.saver.restore(self.sess, self.last_good)
+        self.sess.run(self._set_learning_rate, {self._learning_rate: learning_rate})
+
+        self.n_rollbacks += 1
+        self._consecutive = 0
+        self._skipped_since_save = 0
+        self._skipped_counter = None
+        print 'Rolled back to "{}" after {} consecutive skipped steps ({} skipped in total), ' \
+              'learning rate is now {:.3g}'.format(self.last_good, self.max_consecutive, self.n_skipped, learning_rate)
@@ -0,0 +1,41 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from attend_infer_repeat.batch_finder import recommend, load_batch_config
+
+
+def measurement(batch_size, peak_rss_mb, samples_per_sec):
+    return dict(batch_size=batch_size, peak_rss_mb=peak_rss_mb, samples_per_sec=samples_per_sec)
+
+
+class BatchFinderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.measurements = [measurement(16, 500., 800.), measurement(32, 700., 1200.),
+                             measurement(64, 1100., 1100.), measurement(128, 1900., 1500.)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_recommend(self):
+        self.assertEqual(recommend(self.measurements, 1500.)['batch_size'], 32)
+        self.assertEqual(recommend(self.measurements, 2000.)['batch_size'], 128)
+        self.assertIsNone(recommend(self.measurements, 400.))
+
+    def test_load_batch_config(self):
+        path = os.path.join(self.tmp_dir, 'batch_config.json')
+        report = dict(config=dict(max_steps=5), memory_budget_mb=1500., measurements=self.measurements,
+                      recommended=recommend(self.measurements, 1500.))
+        with open(path, 'w') as f:
+            json.dump(report, f)
+        self.assertEqual(load_batch_config(path), (32, 5))
+
+        report['recommended'] = None
+        with open(path, 'w') as f:
+            json.dump(report, f)
+        with self.assertRaises(ValueError):
+            load_batch_config(path)
@@ -0,0 +1,33 @@
+import unittest
+
+from attend_infer_repeat.benchmark import compare_results
+
+
+def result(name, median_ms, **params):
+    return dict(name=name, params=params, median_ms=median_ms)
+
+
+class CompareResultsTest(unittest.TestCase):
+
+    def test_status(self):
+        base = [result('a', 10., batch_size=16), result('b', 10.), result('c', 10.), result('d', 10.)]
+        new = [result('a', 10.5, batch_size=16), result('b', 12.), result('c', 8.)]
+
+        comparison = compare_results(base, new, tolerance=.1)
+        status = {c[0]: c[-1] for c in comparison}
+        self.assertEqual(status, dict(a='ok', b='regression', c='improvement', d='missing'))
+
+    def test_matches_params(self):
+        base = [result('a', 10., batch_size=16), result('a', 10., batch_size=64)]
+        new = [result('a', 20., batch_size=64), result('a', 10., batch_size=16)]
+
+        comparison = compare_results(base, new)
+        self.assertEqual([c[-1] for c in comparison], ['ok', 'regression'])
+
+    def test_skips_errors(self):
+        base = [dict(name='a', params={}, error='failed'), result('b', 10.)]
+        new = [result('b', 10.)]
+
+        comparison = compare_results(base, new)
+        self.assertEqual(len(comparison), 1)
+        self.assertEqual(comparison[0][0], 'b')
@@ -0,0 +1,48 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from attend_infer_repeat.continual import ContinualTrainer
+from attend_infer_repeat.data.stream import ReplayBuffer
+
+
+small_kwargs = dict(inpt_encoder_hidden=[16], glimpse_encoder_hidden=[16], glimpse_decoder_hidden=[16],
+                    transform_estimator_hidden=[16], steps_pred_hidden=[8], baseline_hidden=[8])
+
+
+class ContinualTrainerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.logdir = tempfile.mkdtemp()
+        self.buffer = ReplayBuffer(50, (30, 30))
+        self.buffer.add(np.random.rand(20, 30, 30))
+
+    def tearDown(self):
+        shutil.rmtree(self.logdir)
+
+    def trainer(self):
+        tf.reset_default_graph()
+        return ContinualTrainer(self.buffer, self.logdir, batch_size=4, checkpoint_interval=2, log_every=3,
+                                **small_kwargs)
+
+    def test_resumes_from_checkpoint(self):
+        trainer = self.trainer()
+        self.assertTrue(trainer.wait_for_data(10, timeout=1.))
+        trainer.run(3)
+        self.assertEqual(trainer.step, 3)
+        trainer.close()
+
+        with open(trainer.metrics_path) as f:
+            metrics = [json.loads(line) for line in f]
+        self.assertEqual(len(metrics), 1)
+        self.assertEqual(metrics[0]['seen'], 20)
+
+        trainer = self.trainer()
+        self.assertEqual(trainer.step, 3)
+        self.assertTrue(tf.train.latest_checkpoint(self.logdir).endswith('-3'))
+        trainer.close()
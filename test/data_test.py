@@ -0,0 +1,33 @@
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from attend_infer_repeat.data.data import compact_nums, tensors_from_data
+
+
+class CompactNumsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.counts = np.asarray([0, 2, 1, 2, 0])
+
+    def test_expanded_nums_are_compacted(self):
+        expanded = np.zeros((3, len(self.counts), 1), dtype=np.float32)
+        for i, n in enumerate(self.counts):
+            expanded[:n, i] = 1.
+
+        for nums in (expanded, self.counts):
+            compact = compact_nums(nums)
+            self.assertEqual(compact.dtype, np.uint8)
+            self.assertEqual(compact.tolist(), self.counts.tolist())
+
+    def test_counts_are_gathered_with_images(self):
+        tf.reset_default_graph()
+        data = dict(imgs=self.counts[:, np.newaxis, np.newaxis] * np.ones((1, 2, 2)),
+                    nums=compact_nums(self.counts))
+        tensors = tensors_from_data(data, 3, shuffle=True)
+        self.assertEqual(tensors['nums'].get_shape().as_list(), [3])
+
+        with tf.Session() as sess:
+            imgs, nums = sess.run([tensors['imgs'], tensors['nums']])
+        self.assertTrue(np.all(imgs[:, 0, 0] == nums))
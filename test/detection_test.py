@@ -0,0 +1,58 @@
+import numpy as np
+import unittest
+
+from attend_infer_repeat.detection import where_to_boxes, iou, match, average_precision, evaluate
+
+
+def boxes_to_where(boxes, img_size):
+    height, width = img_size
+    y, x, h, w = np.split(boxes, 4, -1)
+    sx, sy = w / width, h / height
+    return np.concatenate((sx, 2 * x / width - 1 + sx, sy, 2 * y / height - 1 + sy), -1)
+
+
+class DetectionTest(unittest.TestCase):
+
+    img_size = (50, 40)
+
+    def test_where_to_boxes(self):
+        self.assertTrue(np.allclose(where_to_boxes([1., 0., 1., 0.], self.img_size), [0., 0., 50., 40.]))
+
+        boxes = np.asarray([[10., 5., 20., 8.], [0., 30., 7., 10.]])
+        self.assertTrue(np.allclose(where_to_boxes(boxes_to_where(boxes, self.img_size), self.img_size), boxes))
+
+    def test_iou(self):
+        a = np.asarray([[0., 0., 10., 10.], [0., 0., 10., 10.]])
+        b = np.asarray([[0., 0., 10., 10.], [5., 0., 10., 10.], [20., 20., 5., 5.]])
+        self.assertTrue(np.allclose(iou(a, b), [[1., 1. / 3, 0.]] * 2))
+        self.assertEqual(iou(a[np.newaxis], b[np.newaxis]).shape, (1, 2, 3))
+
+    def test_match_maximises_total_iou(self):
+        ious = np.asarray([[[.9, .8], [.85, .1], [0., 0.]]])
+        valid = np.asarray([[True, True, True]])
+        self.assertEqual(match(ious, valid, np.asarray([[True, True]])).tolist(), [[1, 0, -1]])
+        self.assertEqual(match(ious, valid, np.asarray([[True, False]])).tolist(), [[0, -1, -1]])
+        self.assertEqual(match(ious, ~valid, np.asarray([[True, True]])).tolist(), [[-1, -1, -1]])
+
+    def test_average_precision(self):
+        scores = np.asarray([.9, .8, .7])
+        self.assertAlmostEqual(average_precision(scores, np.asarray([True, True, False]), 2), 1.)
+        self.assertAlmostEqual(average_precision(scores, np.asarray([False, True, True]), 2), 2. / 3)
+        self.assertAlmostEqual(average_precision(scores, np.asarray([True, False, False]), 2), .5)
+
+    def test_evaluate_perfect_detections(self):
+        gt = np.random.randint(20, size=(16, 2, 4)).astype(np.float32) + [0., 0., 10., 10.]
+        n_objects = np.random.randint(3, size=16)
+        presence = np.arange(3)[np.newaxis] < n_objects[:, np.newaxis]
+
+        # detections in reverse order with an extra step
+        where = np.zeros((16, 3, 4), dtype=np.float32)
+        where[:, :2] = boxes_to_where(gt[:, ::-1], self.img_size)
+        presence = presence[:, ::-1]
+        presence = np.concatenate((presence[:, 1:], presence[:, :1]), 1)
+
+        results = evaluate(where, presence, presence.astype(np.float32), gt, n_objects, self.img_size)
+        self.assertAlmostEqual(results['ap50'], 1.)
+        self.assertAlmostEqual(results['ap'], 1., places=5)
+        self.assertAlmostEqual(results['mean_iou'], 1., places=5)
+        self.assertEqual(results['count_accuracy'], 1.)
@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from attend_infer_repeat.export import build_inference_graph, export, load_inference_fn
+
+
+small_kwargs = dict(inpt_encoder_hidden=[16], glimpse_encoder_hidden=[16], glimpse_decoder_hidden=[16],
+                    transform_estimator_hidden=[16], steps_pred_hidden=[8], baseline_hidden=[8], step_bias=1.)
+
+
+class ExportTest(unittest.TestCase):
+    batch_size = 4
+    img_size = (30, 30)
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_round_trip(self):
+        # more images than the batch size, and not a multiple of it, so that the last batch is padded
+        imgs = np.random.RandomState(0).rand(7, *self.img_size).astype(np.float32)
+
+        graph = tf.Graph()
+        with graph.as_default():
+            obs, outputs = build_inference_graph(self.batch_size, self.img_size, 3, **small_kwargs)
+            with tf.Session() as sess:
+                sess.run(tf.global_variables_initializer())
+                checkpoint = tf.train.Saver().save(sess, os.path.join(self.tmp_dir, 'model.ckpt'))
+
+                padded = np.concatenate((imgs, np.zeros((1,) + self.img_size, dtype=np.float32)), 0)
+                batches = [sess.run(outputs, {obs: padded[i:i + self.batch_size]}) for i in (0, 4)]
+                expected = {k: np.concatenate([b[k] for b in batches], 0)[:7] for k in outputs}
+
+        path = os.path.join(self.tmp_dir, 'air.pb')
+        graph_def = export(checkpoint, path, self.batch_size, self.img_size, 3, **small_kwargs)
+        self.assertFalse([n.name for n in graph_def.node if n.op in ('Variable', 'VariableV2')])
+
+        infer = load_inference_fn(path)
+        self.assertEqual(infer.batch_size, self.batch_size)
+        self.assertEqual(infer.img_size, self.img_size)
+        result = infer(imgs)
+        infer.close()
+
+        self.assertEqual(sorted(result), sorted(expected))
+        # batch-major outputs
+        self.assertEqual(result['where'].shape, (7, 3, 4))
+        self.assertEqual(result['what'].shape[:2], (7, 3))
+        self.assertEqual(result['presence'].shape, (7, 3))
+        self.assertEqual(result['presence_prob'].shape, (7, 3))
+
+        for k, v in expected.iteritems():
+            self.assertTrue(np.allclose(result[k], v, atol=1e-5), k)
@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from attend_infer_repeat.graph_cache import export_graph, import_graph, cached_graph
+
+
+def build():
+    x = tf.placeholder(tf.float32, (2,), name='x')
+    w = tf.Variable(3., name='w')
+    y = w * x
+    return dict(x=x, y=y, nested=(y, (x + 1., tf.no_op()))), dict(scale=3), dict(x=x)
+
+
+class GraphCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        tf.reset_default_graph()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'graph.meta')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_roundtrip(self):
+        n_calls = []
+
+        def counted_build():
+            n_calls.append(1)
+            return build()
+
+        for _ in xrange(2):
+            with tf.Graph().as_default():
+                handle = cached_graph(self.path, counted_build)
+                self.assertEqual(handle.scale, 3)
+                with tf.Session() as sess:
+                    sess.run(tf.global_variables_initializer())
+                    y, (y_again, (x1, _)) = sess.run([handle.y, handle.nested], {handle.x: [1., 2.]})
+
+                self.assertTrue(np.allclose(y, [3., 6.]))
+                self.assertTrue(np.allclose(y_again, y))
+                self.assertTrue(np.allclose(x1, [2., 3.]))
+        self.assertEqual(len(n_calls), 1)
+
+    def test_input_map_and_restore(self):
+        with tf.Graph().as_default():
+            outputs, constants, inputs = build()
+            export_graph(self.path, outputs, constants, inputs)
+            with tf.Session() as sess:
+                sess.run(tf.global_variables_initializer())
+                checkpoint = tf.train.Saver().save(sess, os.path.join(self.tmp_dir, 'model.ckpt'))
+
+        with tf.Graph().as_default():
+            handle = import_graph(self.path, input_map=dict(x=tf.constant([1., -1.])))
+            with tf.Session() as sess:
+                handle.saver.restore(sess, checkpoint)
+                self.assertTrue(np.allclose(sess.run(handle.y), [3., -3.]))
+
+    def test_py_func_has_to_be_an_input(self):
+        data = tf.py_func(lambda: np.ones(2, dtype=np.float32), [], [tf.float32])[0]
+        with self.assertRaises(ValueError):
+            export_graph(self.path, dict(y=data * 2.))
+
+        export_graph(self.path, dict(y=data * 2.), inputs=dict(data=data))
+        self.assertTrue(os.path.exists(self.path))
@@ -0,0 +1,101 @@
+import os
+import glob
+import shutil
+import resource
+import tempfile
+import unittest
+
+import numpy as np
+
+from attend_infer_repeat.inference_cache import CachedInference
+
+
+class CountingInference(object):
+
+    def __init__(self):
+        self.n_imgs = []
+
+    def __call__(self, imgs):
+        self.n_imgs.append(len(imgs))
+        return dict(what=imgs.sum((1, 2))[:, np.newaxis], presence=np.ones((len(imgs), 3)))
+
+
+class CachedInferenceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.imgs = np.random.RandomState(0).rand(4, 5, 5).astype(np.float32)
+        self.disk_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.disk_dir)
+
+    def test_only_misses_are_inferred(self):
+        infer = CountingInference()
+        cached = CachedInference(infer, 'model', capacity=10)
+
+        cached(self.imgs[:3])
+        result = cached(self.imgs[[3, 0, 3, 1]])
+        self.assertEqual(infer.n_imgs, [3, 1])
+        self.assertTrue(np.allclose(result['what'], self.imgs[[3, 0, 3, 1]].sum((1, 2))[:, np.newaxis]))
+
+        metrics = cached.metrics()
+        self.assertEqual(metrics['misses'], 4)
+        self.assertEqual(metrics['hits'], 3)
+
+    def test_lru_eviction(self):
+        infer = CountingInference()
+        cached = CachedInference(infer, 'model', capacity=2)
+
+        cached(self.imgs[:3])
+        cached(self.imgs[:1])
+        self.assertEqual(infer.n_imgs, [3, 1])
+
+    def test_model_identity(self):
+        infer = CountingInference()
+        CachedInference(infer, 'a', disk_dir=self.disk_dir)(self.imgs)
+        CachedInference(infer, 'b', disk_dir=self.disk_dir)(self.imgs)
+        self.assertEqual(infer.n_imgs, [4, 4])
+
+    def test_disk_tier(self):
+        infer = CountingInference()
+        expected = CachedInference(infer, 'model', disk_dir=self.disk_dir)(self.imgs)
+
+        cached = CachedInference(infer, 'model', disk_dir=self.disk_dir)
+        result = cached(self.imgs)
+        self.assertEqual(infer.n_imgs, [4])
+        self.assertEqual(cached.metrics()['disk_hits'], 4)
+        for k, v in expected.iteritems():
+            self.assertTrue(np.array_equal(v, result[k]))
+
+    def test_disk_hits_release_file_descriptors(self):
+        imgs = np.random.RandomState(1).rand(200, 2, 2).astype(np.float32)
+        infer = CountingInference()
+        CachedInference(infer, 'model', disk_dir=self.disk_dir)(imgs)
+
+        # far fewer descriptors than disk hits, which all stay in memory below
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (len(os.listdir('/proc/self/fd')) + 32, hard))
+        try:
+            cached = CachedInference(infer, 'model', capacity=len(imgs), disk_dir=self.disk_dir)
+            for i in xrange(len(imgs)):
+                cached(imgs[i:i + 1])
+        finally:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+        self.assertEqual(infer.n_imgs, [200])
+        self.assertEqual(cached.metrics()['disk_hits'], 200)
+
+    def test_disk_capacity(self):
+        infer = CountingInference()
+        cached = CachedInference(infer, 'model', capacity=0, disk_dir=self.disk_dir, disk_capacity=2)
+        cached(self.imgs[:3])
+        cached(self.imgs[1:2])
+        cached(self.imgs[3:])
+        self.assertEqual(len(glob.glob(os.path.join(self.disk_dir, '*.names'))), 2)
+        self.assertEqual(cached.metrics()['disk_size'], 2)
+
+        # the first image was evicted, the second one was refreshed by its disk hit
+        cached = CachedInference(infer, 'model', capacity=0, disk_dir=self.disk_dir, disk_capacity=2)
+        cached(self.imgs[:2])
+        self.assertEqual(infer.n_imgs, [3, 1, 1])
+        self.assertEqual(cached.metrics()['disk_hits'], 1)
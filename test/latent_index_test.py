@@ -0,0 +1,73 @@
+import unittest
+
+import numpy as np
+
+from attend_infer_repeat.latent_index import LatentIndex, extract_latents, kmeans, recall_at_k
+
+
+class LatentIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        rnd = np.random.RandomState(0)
+        self.vectors = rnd.randn(500, 8).astype(np.float32)
+        self.queries = rnd.randn(20, 8).astype(np.float32)
+
+    def test_exact_search(self):
+        index = LatentIndex(self.vectors)
+        result = index.search(self.queries, k=5)
+
+        distances = ((self.queries[:, np.newaxis] - self.vectors[np.newaxis]) ** 2).sum(-1)
+        expected = np.argsort(distances, axis=1)[:, :5]
+        self.assertTrue(np.array_equal(result, expected))
+
+    def test_approximate_search_with_all_lists_is_exact(self):
+        index = LatentIndex(self.vectors, n_lists=10)
+        exact = index.search(self.queries, k=5)
+        approximate = index.search(self.queries, k=5, n_probe=10)
+        self.assertEqual(recall_at_k(approximate, exact), 1.)
+
+    def test_approximate_search_scans_probed_lists(self):
+        index = LatentIndex(self.vectors, n_lists=10)
+        result = index.search(self.queries, k=5, n_probe=3)
+
+        # brute force over the vectors of the probed lists of every query
+        centre_distances = ((self.queries[:, np.newaxis] - index.centres[np.newaxis]) ** 2).sum(-1)
+        assignment = (((self.vectors[:, np.newaxis] - index.centres[np.newaxis]) ** 2).sum(-1)).argmin(1)
+        for query, lists, neighbours in zip(self.queries, np.argsort(centre_distances, 1)[:, :3], result):
+            candidates = np.where(np.in1d(assignment, lists))[0]
+            distances = ((self.vectors[candidates] - query) ** 2).sum(-1)
+            self.assertEqual(list(neighbours), list(candidates[np.argsort(distances)[:5]]))
+
+    def test_approximate_search_pads_missing_neighbours(self):
+        index = LatentIndex(self.vectors[:20], n_lists=10)
+        result = index.search(self.queries, k=30, n_probe=2)
+        self.assertEqual(result.shape, (len(self.queries), 30))
+        for neighbours in result:
+            found = neighbours[neighbours >= 0]
+            self.assertTrue(0 < len(found) < 30)
+            self.assertTrue(np.all(neighbours[len(found):] == -1))
+
+    def test_too_many_lists(self):
+        with self.assertRaises(ValueError):
+            kmeans(self.vectors[:5], 10)
+
+    def test_query_object_excludes_itself(self):
+        index = LatentIndex(self.vectors, n_lists=10)
+        for n_probe in (None, 3):
+            neighbours = index.query_object(7, k=4, n_probe=n_probe)
+            self.assertEqual(len(neighbours), 4)
+            self.assertNotIn(7, neighbours)
+
+    def test_extract_latents(self):
+        presence = np.asarray([[1, 0, 0], [1, 1, 0], [0, 0, 0]], dtype=np.float32)
+
+        def infer_fn(imgs):
+            n = len(imgs)
+            what = np.arange(n * 3 * 2, dtype=np.float32).reshape(n, 3, 2)
+            return dict(what=what, where=np.zeros((n, 3, 4)), presence=presence[:n])
+
+        latents = extract_latents(infer_fn, np.zeros((3, 5, 5)), batch_size=3)
+        self.assertEqual(list(latents['img_idx']), [0, 1, 1])
+        self.assertEqual(list(latents['step']), [0, 0, 1])
+        self.assertEqual(latents['what'].shape, (3, 2))
+        self.assertEqual(latents['where'].shape, (3, 4))
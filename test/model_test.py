@@ -0,0 +1,301 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from attend_infer_repeat.mnist_model import AIRonMNIST
+from attend_infer_repeat.profiling import default_priors
+
+
+small_kwargs = dict(inpt_encoder_hidden=[16], glimpse_encoder_hidden=[16], glimpse_decoder_hidden=[16],
+                    transform_estimator_hidden=[16], steps_pred_hidden=[8], baseline_hidden=[8])
+
+
+class MarginalPresenceTest(unittest.TestCase):
+
+    def setUp(self):
+        tf.reset_default_graph()
+        self.batch_size, self.max_steps = 4, 3
+        obs = tf.constant(np.random.rand(self.batch_size, 30, 30).astype(np.float32))
+        nums = tf.constant(np.asarray([0, 1, 2, 1], dtype=np.uint8))
+        self.air = AIRonMNIST(obs, nums, max_steps=self.max_steps, presence_estimator='marginal', **small_kwargs)
+        self.train_step, _ = self.air.train_step(1e-4, **default_priors())
+
+        self.sess = tf.Session()
+        self.sess.run(tf.global_variables_initializer())
+
+    def tearDown(self):
+        self.sess.close()
+
+    def test_loss_is_expectation_over_truncations(self):
+        air = self.air
+        values = self.sess.run(dict(obs=air.obs, canvas=air.canvas, truncated=air.truncated_canvas,
+                                    steps_prob=air.num_steps_distrib.prob(), presence_prob=air.presence_prob,
+                                    presence_weight=air.presence_weight, rec=air.rec_loss_per_sample))
+
+        self.assertEqual(values['truncated'].shape, (self.max_steps + 1, self.batch_size, 30, 30))
+        self.assertTrue(np.allclose(values['truncated'][1:], values['canvas']))
+        self.assertTrue(np.allclose(values['presence_weight'], np.cumprod(values['presence_prob'], 0)))
+
+        residual = ((values['truncated'] - values['obs']) / air.output_std) ** 2
+        rec = .5 * residual.sum((2, 3)) + 30 * 30 * np.log(air.output_std * np.sqrt(2 * np.pi))
+        expected = (values['steps_prob'].T * rec).sum(0)
+        self.assertTrue(np.allclose(values['rec'], expected, rtol=1e-4))
+
+    def test_no_reinforce(self):
+        self.assertFalse(self.air.use_reinforce)
+        self.assertFalse(hasattr(self.air, 'reinforce_loss'))
+        self.sess.run(self.train_step)
+
+
+class CompactionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        # intensities from zero to one vary the presence logits between images
+        scale = np.linspace(0., 1., 16)[:, np.newaxis, np.newaxis]
+        self.imgs = (scale * np.random.RandomState(0).rand(16, 30, 30)).astype(np.float32)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def run_model(self, compact_absent, checkpoint=None):
+        tf.reset_default_graph()
+        tf.set_random_seed(0)
+        air = AIRonMNIST(tf.constant(self.imgs), None, max_steps=3, deterministic=True, compact_absent=compact_absent,
+                         step_bias=0., **small_kwargs)
+        with tf.Session() as sess:
+            saver = tf.train.Saver()
+            if checkpoint is None:
+                sess.run(tf.global_variables_initializer())
+                checkpoint = saver.save(sess, os.path.join(self.tmp_dir, 'model.ckpt'))
+            else:
+                saver.restore(sess, checkpoint)
+            return sess.run([air.canvas, air.what, air.presence]), checkpoint
+
+    def test_matches_full_batch(self):
+        (canvas, what, presence), checkpoint = self.run_model(True)
+        (full_canvas, full_what, full_presence), _ = self.run_model(False, checkpoint)
+
+        # otherwise the gather and scatter of present rows aren't tested
+        self.assertTrue(0. < presence.mean() < 1.)
+        self.assertTrue(np.all(presence == full_presence))
+        self.assertTrue(np.allclose(canvas, full_canvas, atol=1e-5))
+        self.assertTrue(np.allclose(what * presence, full_what * presence, atol=1e-5))
+        self.assertTrue(np.all(what[presence[..., 0] == 0] == 0.))
+
+
+class CheckpointedGradientsTest(unittest.TestCase):
+    batch_size, max_steps = 4, 3
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        rnd = np.random.RandomState(0)
+        self.imgs = rnd.rand(self.batch_size, 30, 30).astype(np.float32)
+        self.rnd = rnd
+        self.noise = None
+        self.checkpoint = None
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def gradients(self, checkpoint_every, swap_memory=False):
+        """Returns checkpointed gradients of a loss on the unrolled outputs and the same gradients without
+        checkpointing, computed by unrolling a single segment on the same noise."""
+        tf.reset_default_graph()
+        air = AIRonMNIST(tf.constant(self.imgs), None, max_steps=self.max_steps, checkpoint_every=checkpoint_every,
+                         swap_memory=swap_memory, step_bias=1., **small_kwargs)
+        noise, initial_states, outputs = zip(*air._segments)
+        outputs = [tf.concat(o, 0) for o in zip(*outputs)]
+
+        # fixed weights of every output make a loss that depends on all of them
+        weights = [np.random.RandomState(i).randn(*o.get_shape().as_list()).astype(np.float32)
+                   for i, o in enumerate(outputs)]
+        loss = lambda outputs: tf.add_n([tf.reduce_sum(o * w) for o, w in zip(outputs, weights)])
+
+        var_list = tf.trainable_variables()
+        grads = air._checkpointed_gradients(loss(outputs), var_list)
+
+        expected_outputs, _ = tf.nn.dynamic_rnn(air.cell, tf.concat(noise, 0), initial_state=initial_states[0],
+                                                time_major=True)
+        expected_grads = tf.gradients(loss(expected_outputs), var_list)
+
+        if self.noise is None:
+            shape = (self.max_steps, self.batch_size, air.cell.noise_size)
+            self.noise = self.rnd.randn(*shape).astype(np.float32)
+            self.noise[..., -1] = self.rnd.rand(*shape[:-1])
+
+        starts = xrange(0, self.max_steps, checkpoint_every)
+        feed_dict = {n: self.noise[start:start + checkpoint_every] for n, start in zip(noise, starts)}
+
+        with tf.Session() as sess:
+            saver = tf.train.Saver()
+            if self.checkpoint is None:
+                sess.run(tf.global_variables_initializer())
+                self.checkpoint = saver.save(sess, os.path.join(self.tmp_dir, 'model.ckpt'))
+            else:
+                saver.restore(sess, self.checkpoint)
+
+            # variables without gradients must be the same in both cases
+            self.assertEqual([g is None for g in grads], [g is None for g in expected_grads])
+            pairs = {v.name: (g, e) for v, g, e in zip(var_list, grads, expected_grads) if e is not None}
+            return sess.run(pairs, feed_dict)
+
+    def test_matches_single_segment(self):
+        results = []
+        for checkpoint_every in (1, 2, self.max_steps):
+            grads = self.gradients(checkpoint_every)
+            self.assertTrue(grads)
+            for name, (grad, expected) in grads.iteritems():
+                self.assertTrue(np.allclose(grad, expected, atol=1e-4, rtol=1e-4), (checkpoint_every, name))
+            results.append(grads)
+
+        # segment lengths don't change the gradients either
+        for grads in results[1:]:
+            for name, (grad, _) in grads.iteritems():
+                self.assertTrue(np.allclose(grad, results[0][name][0], atol=1e-4, rtol=1e-4), name)
+
+    def test_swap_memory(self):
+        grads = self.gradients(2, swap_memory=True)
+        for name, (grad, expected) in grads.iteritems():
+            self.assertTrue(np.allclose(grad, expected, atol=1e-4, rtol=1e-4), name)
+
+        tf.reset_default_graph()
+        obs = tf.constant(self.imgs)
+        air = AIRonMNIST(obs, None, max_steps=self.max_steps, checkpoint_every=2, swap_memory=True, **small_kwargs)
+        train_step, _ = air.train_step(1e-4, **default_priors())
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            sess.run(train_step)
+
+
+class ParallelCoreTest(unittest.TestCase):
+
+    def setUp(self):
+        tf.reset_default_graph()
+        self.batch_size, self.max_steps = 4, 3
+        obs = tf.constant(np.random.rand(self.batch_size, 30, 30).astype(np.float32))
+        nums = tf.constant(np.asarray([0, 1, 2, 1], dtype=np.uint8))
+        self.air = AIRonMNIST(obs, nums, max_steps=self.max_steps, core='parallel', **small_kwargs)
+        self.train_step, _ = self.air.train_step(1e-4, **default_priors())
+
+        self.sess = tf.Session()
+        self.sess.run(tf.global_variables_initializer())
+
+    def tearDown(self):
+        self.sess.close()
+
+    def test_outputs(self):
+        air = self.air
+        canvas, what, where, presence = self.sess.run([air.canvas, air.what, air.where, air.presence])
+        self.assertEqual(canvas.shape, (self.max_steps, self.batch_size, 30, 30))
+        self.assertEqual(what.shape, (self.max_steps, self.batch_size, air.n_appearance))
+        self.assertEqual(where.shape, (self.max_steps, self.batch_size, 4))
+        # slots are present only if all earlier slots are
+        self.assertTrue(np.all(np.diff(presence, axis=0) <= 0))
+
+    def test_train_step(self):
+        self.sess.run(self.train_step)
+
+    def test_unsupported_options(self):
+        obs = tf.zeros((self.batch_size, 30, 30))
+        with self.assertRaises(ValueError):
+            AIRonMNIST(obs, None, max_steps=self.max_steps, core='parallel', checkpoint_every=1, **small_kwargs)
+        with self.assertRaises(ValueError):
+            AIRonMNIST(obs, None, max_steps=self.max_steps, core='unknown', **small_kwargs)
+
+
+class StackedModelsTest(unittest.TestCase):
+
+    def test_unsupported_options(self):
+        tf.reset_default_graph()
+        obs = tf.zeros((4, 30, 30))
+        with self.assertRaises(ValueError):
+            AIRonMNIST(obs, None, max_steps=3, n_models=2, input_pyramid_level=1, learned_input_pooling=True,
+                       **small_kwargs)
+
+    def test_guard_numerics_unsupported(self):
+        tf.reset_default_graph()
+        air = AIRonMNIST(tf.zeros((4, 30, 30)), None, max_steps=3, n_models=2, **small_kwargs)
+        # one non-finite model would skip the updates of both
+        with self.assertRaises(ValueError):
+            air.train_step(1e-4, guard_numerics=True, **default_priors())
+
+
+class InputPyramidTest(unittest.TestCase):
+    batch_size, img_size = 4, 32
+
+    def build(self, learned_input_pooling):
+        tf.reset_default_graph()
+        self.imgs = np.random.RandomState(0).rand(self.batch_size, self.img_size, self.img_size).astype(np.float32)
+        air = AIRonMNIST(tf.constant(self.imgs), None, max_steps=3, input_pyramid_level=1,
+                         learned_input_pooling=learned_input_pooling, **small_kwargs)
+        train_step, _ = air.train_step(1e-4, **default_priors())
+        return air, train_step
+
+    def check(self, learned_input_pooling):
+        air, train_step = self.build(learned_input_pooling)
+        half_size = self.img_size // 2
+
+        # the input encoder sees the downsampled image
+        n_inputs = [v.get_shape().as_list()[0] for v in air.cell._input_encoder.get_variables()
+                    if len(v.get_shape()) == 2]
+        self.assertIn(half_size ** 2, n_inputs)
+        self.assertNotIn(self.img_size ** 2, n_inputs)
+
+        # while glimpses are cropped from the full-resolution one
+        resampled_sizes = {tuple(op.inputs[0].get_shape().as_list()[1:3])
+                           for op in tf.get_default_graph().get_operations() if op.type == 'Resampler'}
+        self.assertIn((self.img_size, self.img_size), resampled_sizes)
+        self.assertNotIn((half_size, half_size), resampled_sizes)
+
+        downsampled = air.cell._downsample_input(air.obs)
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            # learned pooling starts as average pooling
+            expected = self.imgs.reshape(self.batch_size, half_size, 2, half_size, 2).mean((2, 4))
+            self.assertTrue(np.allclose(sess.run(downsampled), expected, atol=1e-5))
+            sess.run(train_step)
+
+    def test_average_pooling(self):
+        self.check(False)
+
+    def test_learned_pooling(self):
+        self.check(True)
+
+
+class DynamicBatchTest(unittest.TestCase):
+
+    def build(self, **kwargs):
+        tf.reset_default_graph()
+        self.obs = tf.placeholder(tf.float32, (None, 30, 30))
+        self.nums = tf.placeholder(tf.uint8, (None,))
+        return AIRonMNIST(self.obs, self.nums, max_steps=3, **dict(small_kwargs, **kwargs))
+
+    def run_batches(self, air, fetches, batch_sizes=(1, 5)):
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            for batch_size in batch_sizes:
+                feed = {self.obs: np.random.rand(batch_size, 30, 30), self.nums: np.ones(batch_size)}
+                values = sess.run(fetches, feed)
+                self.assertEqual(values['what'].shape, (3, batch_size, air.n_appearance))
+                self.assertEqual(values['canvas'].shape, (3, batch_size, 30, 30))
+                self.assertEqual(values['num_step'].shape, (batch_size,))
+
+    def test_training(self):
+        air = self.build()
+        self.assertIsNone(air.batch_size)
+        train_step, _ = air.train_step(1e-4, **default_priors())
+        self.run_batches(air, dict(train_step=train_step, what=air.what, canvas=air.canvas,
+                                   num_step=air.num_step_per_sample))
+
+    def test_modes(self):
+        for kwargs in (dict(checkpoint_every=2), dict(presence_estimator='marginal'), dict(core='parallel'),
+                       dict(compact_absent=True)):
+            air = self.build(**kwargs)
+            train_step, _ = air.train_step(1e-4, **default_priors())
+            self.run_batches(air, dict(train_step=train_step, what=air.what, canvas=air.canvas,
+                                       num_step=air.num_step_per_sample), batch_sizes=(3,))
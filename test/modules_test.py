@@ -0,0 +1,52 @@
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from attend_infer_repeat.mnist_model import AIRonMNIST
+from attend_infer_repeat.modules import ConvEncoder, ConvDecoder
+from attend_infer_repeat.profiling import default_priors
+
+
+def n_params(module):
+    return sum(np.prod(v.get_shape().as_list()) for v in module.get_variables())
+
+
+class ConvModulesTest(unittest.TestCase):
+    batch_size = 2
+    img_sizes = ((30, 30), (50, 64))
+
+    def test_encoder(self):
+        counts = []
+        for img_size in self.img_sizes:
+            tf.reset_default_graph()
+            encoder = ConvEncoder([16])
+            output = encoder(tf.zeros((self.batch_size,) + img_size))
+            self.assertEqual(output.get_shape().as_list(), [self.batch_size, 16])
+            counts.append(n_params(encoder))
+
+        # pooling to a fixed grid makes the number of parameters independent of the image size
+        self.assertEqual(counts[0], counts[1])
+
+    def test_decoder(self):
+        # sizes that aren't multiples of the upsampling factor are cropped
+        for output_size in ((20, 20), (25, 31)):
+            tf.reset_default_graph()
+            decoder = ConvDecoder([16], output_size)
+            output = decoder(tf.zeros((self.batch_size, 8)))
+            self.assertEqual(output.get_shape().as_list(), [self.batch_size] + list(output_size))
+
+    def test_train_step(self):
+        for img_size in self.img_sizes:
+            tf.reset_default_graph()
+            obs = tf.constant(np.random.RandomState(0).rand(self.batch_size, *img_size).astype(np.float32))
+            air = AIRonMNIST(obs, None, max_steps=3, conv_modules=True, inpt_encoder_hidden=[16],
+                             glimpse_encoder_hidden=[16], glimpse_decoder_hidden=[16],
+                             transform_estimator_hidden=[16], steps_pred_hidden=[8], baseline_hidden=[8])
+            train_step, _ = air.train_step(1e-4, **default_priors())
+
+            with tf.Session() as sess:
+                sess.run(tf.global_variables_initializer())
+                sess.run(train_step)
+                canvas = sess.run(air.canvas)
+            self.assertEqual(canvas.shape, (3, self.batch_size) + img_size)
@@ -0,0 +1,77 @@
+import numpy as np
+import unittest
+
+import tensorflow as tf
+
+from attend_infer_repeat.neural import Linear, StackedLSTM, n_stacked_models, stacked_models, stacked_tile
+
+
+class StackedModelsTest(unittest.TestCase):
+
+    def setUp(self):
+        tf.reset_default_graph()
+        self.n_models, self.batch_size = 3, 4
+        self.x = np.random.rand(self.n_models * self.batch_size, 5).astype(np.float32)
+
+    def per_model(self, x):
+        return x.reshape((self.n_models, self.batch_size) + x.shape[1:])
+
+    def test_linear(self):
+        with stacked_models(self.n_models):
+            linear = Linear(2, initializers={'b': tf.random_normal_initializer()})
+        y = linear(tf.constant(self.x))
+
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            y, w, b = sess.run([y, linear.w, linear.b])
+
+        self.assertEqual(w.shape, (self.n_models, 5, 2))
+        self.assertEqual(b.shape, (self.n_models, 2))
+        for m, (x, y) in enumerate(zip(self.per_model(self.x), self.per_model(y))):
+            self.assertTrue(np.allclose(y, x.dot(w[m]) + b[m], atol=1e-5))
+
+    def test_linear_without_context_is_unstacked(self):
+        linear = Linear(2)
+        linear(tf.constant(self.x))
+        self.assertEqual(linear.w.get_shape().as_list(), [5, 2])
+
+    def test_context_is_per_graph(self):
+        with stacked_models(self.n_models):
+            self.assertEqual(n_stacked_models(), self.n_models)
+            with tf.Graph().as_default():
+                self.assertIsNone(n_stacked_models())
+                linear = Linear(2)
+                linear(tf.constant(self.x))
+                self.assertEqual(linear.w.get_shape().as_list(), [5, 2])
+
+            with stacked_models(None):
+                self.assertIsNone(n_stacked_models())
+            self.assertEqual(n_stacked_models(), self.n_models)
+        self.assertIsNone(n_stacked_models())
+
+    def test_lstm_models_are_independent(self):
+        lstm = StackedLSTM(6, self.n_models)
+        state = lstm.initial_state(self.n_models * self.batch_size, trainable=True)
+        x = tf.placeholder(tf.float32, self.x.shape)
+        output, _ = lstm(x, state)
+
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            y1 = sess.run(output, {x: self.x})
+            changed = self.x.copy()
+            changed[:self.batch_size] += 1.
+            y2 = sess.run(output, {x: changed})
+
+        diff = np.abs(self.per_model(y1) - self.per_model(y2)).max((1, 2))
+        self.assertGreater(diff[0], 0.)
+        self.assertTrue(np.all(diff[1:] == 0.))
+
+    def test_stacked_tile(self):
+        with stacked_models(self.n_models):
+            tiled = stacked_tile(tf.constant(np.arange(self.n_models * 2, dtype=np.float32).reshape(3, 1, 2)),
+                                 self.n_models * self.batch_size)
+
+        with tf.Session() as sess:
+            tiled = sess.run(tiled)
+        for m, t in enumerate(self.per_model(tiled)):
+            self.assertTrue(np.all(t == [2 * m, 2 * m + 1]))
@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from attend_infer_repeat.mnist_model import AIRonMNIST
+from attend_infer_repeat.numpy_inference import convert, crop, paste, load_inference_fn
+
+
+small_kwargs = dict(inpt_encoder_hidden=[16], glimpse_encoder_hidden=[16], glimpse_decoder_hidden=[16],
+                    transform_estimator_hidden=[16], steps_pred_hidden=[8], baseline_hidden=[8])
+
+
+class CropTest(unittest.TestCase):
+
+    def test_identity(self):
+        imgs = np.random.rand(2, 10, 12).astype(np.float32)
+        where = np.asarray([[1., 0., 1., 0.]] * 2, dtype=np.float32)
+        self.assertTrue(np.allclose(crop(imgs, where, (10, 12)), imgs, atol=1e-5))
+        self.assertTrue(np.allclose(paste(imgs, where, (10, 12)), imgs, atol=1e-5))
+
+    def test_outside_is_zero(self):
+        imgs = np.ones((1, 10, 10), dtype=np.float32)
+        where = np.asarray([[.5, 2., .5, 2.]], dtype=np.float32)
+        self.assertTrue(np.all(crop(imgs, where, (5, 5)) == 0.))
+
+
+class ParityTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_matches_tensorflow(self):
+        tf.reset_default_graph()
+        imgs = np.random.rand(5, 30, 30).astype(np.float32)
+        # a positive step bias makes most objects present, so that the canvas is compared too
+        kwargs = dict(small_kwargs, step_bias=2.)
+        air = AIRonMNIST(tf.constant(imgs), None, max_steps=3, deterministic=True, **kwargs)
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            checkpoint = tf.train.Saver().save(sess, os.path.join(self.tmp_dir, 'model.ckpt'))
+            what, where, presence, presence_prob, canvas = sess.run([air.what, air.where, air.presence,
+                                                                     air.presence_prob, air.final_canvas])
+
+        path = os.path.join(self.tmp_dir, 'air.npz')
+        convert(checkpoint, path, (30, 30), 3, **kwargs)
+        outputs = load_inference_fn(path, batch_size=2).run(imgs, canvas=True)
+
+        self.assertTrue(np.all(outputs['presence'] == presence[..., 0].T))
+        self.assertTrue(np.allclose(outputs['presence_prob'], presence_prob[..., 0].T, atol=1e-4))
+        self.assertTrue(np.allclose(outputs['what'], what.transpose((1, 0, 2)), atol=1e-4))
+        self.assertTrue(np.allclose(outputs['where'], where.transpose((1, 0, 2)), atol=1e-4))
+        self.assertTrue(np.allclose(outputs['canvas'], canvas, atol=1e-3))
@@ -0,0 +1,78 @@
+import time
+import unittest
+
+import numpy as np
+
+from attend_infer_repeat.data.online import SceneSynthesiser, SharedRingBuffer, OnlineScenes
+
+
+def block_templates(n, size=(28, 28)):
+    templates = np.zeros((n,) + size, dtype=np.uint8)
+    for i in xrange(n):
+        y, x = np.random.randint(10, size=2)
+        templates[i, y:y + 10 + i % 5, x:x + 8] = 255
+    return templates
+
+
+def make_batch(synthesiser, batch_size):
+    return {k: np.zeros(shape, dtype) for k, (shape, dtype) in synthesiser.batch_arrays(batch_size).iteritems()}
+
+
+class SceneSynthesiserTest(unittest.TestCase):
+
+    def setUp(self):
+        self.synthesiser = SceneSynthesiser(block_templates(20), n_objects=(0, 3))
+
+    def test_boxes_match_images(self):
+        batch = make_batch(self.synthesiser, 32)
+        self.synthesiser.fill(rng=np.random.RandomState(0), **batch)
+
+        counts = batch['nums']
+        self.assertLessEqual(counts.max(), 3)
+        for img, boxes, n in zip(batch['imgs'], batch['boxes'], counts):
+            occupied = np.zeros(img.shape, dtype=np.int32)
+            for y, x, h, w in boxes[:n].astype(np.int32):
+                self.assertTrue(np.all(img[y:y + h, x:x + w].max((0, 1)) == 1.))
+                occupied[y:y + h, x:x + w] += 1
+            self.assertTrue(np.all(boxes[n:] == 0.))
+            self.assertTrue(np.all(img[occupied == 0] == 0.))
+            self.assertLessEqual(occupied.max(), 1)
+
+
+class SharedRingBufferTest(unittest.TestCase):
+
+    def test_reuses_last_batch_and_overwrites_oldest(self):
+        buffer = SharedRingBuffer(3, dict(x=((2,), np.float32)))
+        for value in xrange(3):
+            i = buffer.acquire_write()
+            buffer.slot(i)['x'][...] = value
+            buffer.commit_write(i)
+
+        self.assertEqual(buffer.read()['x'][0], 0.)
+        # the slot being read is never written, the oldest unread batch is overwritten instead
+        i = buffer.acquire_write()
+        buffer.slot(i)['x'][...] = 3.
+        buffer.commit_write(i)
+
+        self.assertEqual([buffer.read()['x'][0] for _ in xrange(3)], [2., 3., 3.])
+        self.assertEqual(buffer.n_reused, 1)
+
+
+class OnlineScenesTest(unittest.TestCase):
+
+    def test_workers_produce_distinct_batches(self):
+        synthesiser = SceneSynthesiser(block_templates(20))
+        with OnlineScenes(synthesiser, batch_size=8, n_workers=2, seed=0) as scenes:
+            # later reads reuse the last batch if no new one has been written
+            deadline = time.time() + 10.
+            while scenes.metrics()['written'] < 2:
+                self.assertLess(time.time(), deadline, 'Fewer than two batches written after 10s')
+                time.sleep(.01)
+
+            batches = [scenes.next_batch(timeout=10.)['imgs'].copy() for _ in xrange(5)]
+            metrics = scenes.metrics()
+
+        self.assertEqual(metrics['read'], 5)
+        self.assertGreaterEqual(metrics['written'], 5 - metrics['reused'])
+        self.assertEqual(batches[0].shape, (8, 50, 50))
+        self.assertFalse(np.all(batches[0] == batches[-1]))
@@ -0,0 +1,36 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from attend_infer_repeat.population import read_metrics, select_survivors
+
+
+def entry(acc, loss):
+    return dict(test=dict(num_step_acc=acc, loss=loss))
+
+
+class PopulationTest(unittest.TestCase):
+
+    def test_select_survivors(self):
+        entries = {0: entry(.5, 10.), 1: entry(.9, 20.), 2: entry(.9, 15.), 3: entry(.1, 5.)}
+        self.assertEqual(select_survivors(entries, .5), [2, 1])
+        self.assertEqual(select_survivors(entries, .1), [2])
+
+    def test_non_finite_runs_are_culled(self):
+        entries = {0: entry(float('nan'), 10.), 1: entry(.5, float('inf')), 2: entry(.2, 1.)}
+        self.assertEqual(select_survivors(entries, 1.), [2])
+
+    def test_read_metrics(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'metrics.jsonl')
+            self.assertEqual(read_metrics(path), {})
+
+            with open(path, 'w') as f:
+                f.write(json.dumps(dict(itr=0, test=entry(.1, 1.)['test'])) + '\n')
+                f.write('{"itr": 10000, "te')
+            self.assertEqual(read_metrics(path).keys(), [0])
+        finally:
+            shutil.rmtree(tmp_dir)
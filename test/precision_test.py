@@ -0,0 +1,87 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from attend_infer_repeat.mnist_model import AIRonMNIST
+from attend_infer_repeat.precision import PrecisionPolicy
+from attend_infer_repeat.profiling import default_priors
+
+
+small_kwargs = dict(inpt_encoder_hidden=[16], glimpse_encoder_hidden=[16], glimpse_decoder_hidden=[16],
+                    transform_estimator_hidden=[16], steps_pred_hidden=[8], baseline_hidden=[8])
+
+
+class PrecisionPolicyTest(unittest.TestCase):
+    batch_size = 4
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.imgs = np.random.RandomState(0).rand(self.batch_size, 30, 30).astype(np.float32)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def build(self, precision, **kwargs):
+        return AIRonMNIST(tf.constant(self.imgs), None, max_steps=3, precision=precision,
+                          **dict(small_kwargs, **kwargs))
+
+    def test_float16_activations_with_float32_variables(self):
+        graph = tf.Graph()
+        with graph.as_default():
+            air = self.build(PrecisionPolicy(tf.float16, loss_scale=128.))
+            train_step, _ = air.train_step(1e-4, **default_priors())
+
+            variables = tf.global_variables()
+            self.assertTrue(variables)
+            for v in variables:
+                self.assertEqual(v.dtype.base_dtype, tf.float32, v.name)
+
+            # MLPs run in half precision, the transition in single precision
+            matmul_dtypes = {op.outputs[0].dtype for op in graph.get_operations() if op.type == 'MatMul'}
+            self.assertEqual(matmul_dtypes, {tf.float16, tf.float32})
+
+            resamplers = [op for op in graph.get_operations() if op.type == 'Resampler']
+            self.assertTrue(resamplers)
+            for op in resamplers:
+                self.assertEqual(op.outputs[0].dtype, tf.float16, op.name)
+
+            # the prior terms stay in single precision
+            for loss in (air.num_steps_prior_loss, air.appearance_prior_loss, air.where_kl):
+                self.assertEqual(loss.dtype, tf.float32)
+            half_prior_ops = [op.name for op in graph.get_operations() if '/prior_loss/' in op.name
+                              and any(o.dtype == tf.float16 for o in op.outputs)]
+            self.assertEqual(half_prior_ops, [])
+
+            with tf.Session() as sess:
+                sess.run(tf.global_variables_initializer())
+                sess.run(train_step)
+
+    def gradients(self, precision, checkpoint=None):
+        tf.reset_default_graph()
+        air = self.build(precision, deterministic=True)
+        loss = -tf.reduce_mean(tf.reduce_sum(air.output_distrib.log_prob(air.obs), (1, 2)))
+        var_list = tf.trainable_variables()
+        gvs = air._compute_gradients(tf.train.GradientDescentOptimizer(1.), loss, var_list)
+        grads = {v.name: g for g, v in gvs if g is not None}
+
+        with tf.Session() as sess:
+            saver = tf.train.Saver()
+            if checkpoint is None:
+                sess.run(tf.global_variables_initializer())
+                checkpoint = saver.save(sess, os.path.join(self.tmp_dir, 'model.ckpt'))
+            else:
+                saver.restore(sess, checkpoint)
+            return sess.run(grads), checkpoint
+
+    def test_loss_scale_returns_unscaled_gradients(self):
+        expected, checkpoint = self.gradients(None)
+        grads, _ = self.gradients(PrecisionPolicy(loss_scale=128.), checkpoint)
+
+        self.assertTrue(expected)
+        self.assertEqual(sorted(grads), sorted(expected))
+        for name, grad in grads.iteritems():
+            self.assertTrue(np.allclose(grad, expected[name], rtol=1e-5, atol=1e-6), name)
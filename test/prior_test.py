@@ -116,6 +116,12 @@ class ConditionalPresencePosteriorTest(TFTestBase):
         p = self.eval(self.probs, p)
         assert_array_equal(p, [.5, .5**2, .5**3, .5**3])
 
+    def test_more_steps(self):
+        p = [.5] * 5
+        p = self.eval(self.probs, p)
+        self.assertEqual(p.shape, (6,))
+        assert_array_equal(p, [.5, .5**2, .5**3, .5**4, .5**5, .5**5])
+
 
 class NumStepsKLTest(TFTestBase):
 
@@ -0,0 +1,54 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from attend_infer_repeat.mnist_model import AIRonMNIST
+from attend_infer_repeat.profiling import default_priors, module_scope, profile_step
+
+
+small_kwargs = dict(inpt_encoder_hidden=[16], glimpse_encoder_hidden=[16], glimpse_decoder_hidden=[16],
+                    transform_estimator_hidden=[16], steps_pred_hidden=[8], baseline_hidden=[8])
+
+
+class ModuleScopeTest(unittest.TestCase):
+
+    def test_scopes(self):
+        self.assertEqual(module_scope('AIRonMNIST/rnn/while/AIRCell/SpatialTransformer/Resampler'),
+                         'AIRCell/SpatialTransformer')
+        self.assertEqual(module_scope('loss/gradients/loss/prior_loss/Sum_grad/Tile'), 'prior_loss (grad)')
+        self.assertEqual(module_scope('loss/RMSProp/update'), 'loss/RMSProp')
+        self.assertEqual(module_scope('input/batch', 'PyFunc'), 'input')
+
+
+class ProfileStepTest(unittest.TestCase):
+
+    def setUp(self):
+        self.logdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.logdir)
+
+    def test_profile_step(self):
+        tf.reset_default_graph()
+        obs = tf.constant(np.random.RandomState(0).rand(4, 30, 30).astype(np.float32))
+        air = AIRonMNIST(obs, None, max_steps=3, **small_kwargs)
+        train_step, global_step = air.train_step(1e-4, **default_priors())
+
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            profile_step(sess, [train_step, air.loss.value], self.logdir, 1)
+            self.assertEqual(sess.run(global_step), 1)
+
+        with open(os.path.join(self.logdir, 'timeline_1.json')) as f:
+            trace = json.load(f)
+        self.assertTrue(trace['traceEvents'])
+
+        with open(os.path.join(self.logdir, 'profile_1.txt')) as f:
+            scopes = [line.split()[0] for line in f.read().splitlines()[1:]]
+        for prefix in ('AIRCell/', 'prior_loss', 'loss/'):
+            self.assertTrue(any(s.startswith(prefix) for s in scopes), prefix)
@@ -0,0 +1,112 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from attend_infer_repeat.mnist_model import AIRonMNIST
+from attend_infer_repeat.sequence import SequenceInference, build_sequence_graph
+
+
+# a positive step bias makes most objects present
+small_kwargs = dict(inpt_encoder_hidden=[16], glimpse_encoder_hidden=[16], glimpse_decoder_hidden=[16],
+                    transform_estimator_hidden=[16], steps_pred_hidden=[8], baseline_hidden=[8], step_bias=2.)
+
+
+class SequenceModeTest(unittest.TestCase):
+    batch_size, max_steps = 3, 3
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.imgs = np.random.RandomState(0).rand(self.batch_size, 30, 30).astype(np.float32)
+        self.fetches = 'what where where_loc presence canvas final_canvas'.split()
+
+        graph = tf.Graph()
+        with graph.as_default():
+            air = AIRonMNIST(tf.constant(self.imgs), None, max_steps=self.max_steps, deterministic=True,
+                             **small_kwargs)
+            with tf.Session() as sess:
+                sess.run(tf.global_variables_initializer())
+                self.checkpoint = tf.train.Saver().save(sess, os.path.join(self.tmp_dir, 'model.ckpt'))
+                self.expected = sess.run({k: getattr(air, k) for k in self.fetches})
+
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            self.air = AIRonMNIST(tf.constant(self.imgs), None, max_steps=self.max_steps, deterministic=True,
+                                  sequence_mode=True, **small_kwargs)
+            self.sess = tf.Session()
+            tf.train.Saver().restore(self.sess, self.checkpoint)
+
+    def tearDown(self):
+        self.sess.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def run_air(self, feed_dict=None):
+        return self.sess.run({k: getattr(self.air, k) for k in self.fetches}, feed_dict)
+
+    def test_defaults_match_normal_model(self):
+        values = self.run_air()
+        for k in self.fetches:
+            self.assertTrue(np.allclose(values[k], self.expected[k], atol=1e-5), k)
+
+    def test_step_limit(self):
+        step_limit = np.asarray([1, 2, 3], dtype=np.int32)
+        values = self.run_air({self.air.step_limit: step_limit})
+
+        for i, limit in enumerate(step_limit):
+            # executed steps are the same as without a limit, the others are zero
+            for k in ('what', 'where', 'presence', 'canvas'):
+                self.assertTrue(np.allclose(values[k][:limit, i], self.expected[k][:limit, i], atol=1e-5), k)
+                self.assertTrue(np.all(values[k][limit:, i] == 0.), k)
+            self.assertTrue(np.allclose(values['final_canvas'][i], values['canvas'][limit - 1, i], atol=1e-5))
+
+    def test_proposals_replace_where_loc(self):
+        proposals = np.random.RandomState(1).uniform(-1, 1, (self.max_steps, self.batch_size, 4))
+        mask = np.zeros((self.max_steps, self.batch_size, 1), dtype=np.float32)
+        mask[0, 0] = mask[1, 2] = 1.
+        values = self.run_air({self.air.where_proposals: proposals, self.air.proposal_mask: mask})
+
+        self.assertTrue(np.allclose(values['where_loc'][0, 0], proposals[0, 0], atol=1e-5))
+        self.assertTrue(np.allclose(values['where_loc'][1, 2], proposals[1, 2], atol=1e-5))
+        # the first step of the other examples doesn't depend on the proposals
+        self.assertTrue(np.allclose(values['where_loc'][0, 1:], self.expected['where_loc'][0, 1:], atol=1e-5))
+
+
+class SequenceInferenceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            self.air = build_sequence_graph(2, (30, 30), 3, **small_kwargs)
+            self.sess = tf.Session()
+            self.sess.run(tf.global_variables_initializer())
+        self.frames = np.random.RandomState(0).rand(2, 2, 30, 30).astype(np.float32)
+
+    def tearDown(self):
+        self.sess.close()
+
+    def test_carries_state_between_frames(self):
+        inference = SequenceInference(self.air, self.sess, extra_steps=None)
+        first, second = inference.run_sequences(self.frames)
+
+        # the first frame is inferred from the learned initial state
+        cold = self.sess.run(self.air.what, {self.air.obs: self.frames[:, 0]})
+        self.assertTrue(np.allclose(first['what'], cold, atol=1e-5))
+
+        # objects of the first frame are proposed at the same steps in the second one
+        present = first['presence'][..., 0] > .5
+        self.assertTrue(present.any())
+        self.assertTrue(np.allclose(second['where'][present], first['where'][present], atol=1e-5))
+
+        # and the second frame starts from the final state of the first one
+        inference.reset()
+        restarted = inference(self.frames[:, 1])
+        self.assertFalse(np.allclose(restarted['what'], second['what']))
+
+    def test_step_limit(self):
+        inference = SequenceInference(self.air, self.sess, extra_steps=0)
+        first, _ = inference.run_sequences(self.frames)
+        n_objects = (first['presence'][..., 0] > .5).sum(0)
+        self.assertEqual(inference.n_steps_run, 3 + n_objects.max())
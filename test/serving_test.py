@@ -0,0 +1,185 @@
+import json
+import time
+import urllib2
+import threading
+import unittest
+
+import numpy as np
+
+from attend_infer_repeat.serving import AIRServer, DynamicBatcher
+
+
+class FakeInference(object):
+    """Returns the first pixel of every image; blocks on `gate` if set."""
+    batch_size = 4
+
+    def __init__(self, gate=None, error=None):
+        self.gate = gate
+        self.error = error
+        self.batch_sizes = []
+        self.started = threading.Event()
+
+    def __call__(self, imgs):
+        self.started.set()
+        if self.gate is not None:
+            self.gate.wait()
+        self.batch_sizes.append(len(imgs))
+        if self.error is not None:
+            raise self.error
+        return dict(value=imgs[:, 0, 0].copy())
+
+
+def images(*values):
+    return np.asarray(values, dtype=np.float32).reshape(-1, 1, 1)
+
+
+class Call(threading.Thread):
+    """Calls `batcher` in a background thread."""
+
+    def __init__(self, batcher, imgs):
+        super(Call, self).__init__()
+        self.daemon = True
+        self.batcher, self.imgs = batcher, imgs
+        self.result, self.error = None, None
+        self.start()
+
+    def run(self):
+        try:
+            self.result = self.batcher(self.imgs)
+        except Exception as e:
+            self.error = e
+
+
+def wait_for(condition, timeout=5.):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError('Condition not met after {}s'.format(timeout))
+        time.sleep(.001)
+
+
+class DynamicBatcherTest(unittest.TestCase):
+
+    def test_coalesces_up_to_max_batch_size(self):
+        infer = FakeInference()
+        # the deadline is never reached, so only a full batch is run
+        batcher = DynamicBatcher(infer, max_latency=10.)
+        calls = [Call(batcher, images(i)) for i in xrange(4)]
+        for i, call in enumerate(calls):
+            call.join(5.)
+            self.assertEqual(call.result['value'].tolist(), [i])
+        self.assertEqual(infer.batch_sizes, [4])
+
+    def test_flushes_at_deadline(self):
+        infer = FakeInference()
+        batcher = DynamicBatcher(infer, max_batch_size=8, max_latency=.05)
+        start = time.time()
+        result = batcher(images(1, 2))
+        self.assertGreaterEqual(time.time() - start, .05)
+        self.assertEqual(result['value'].tolist(), [1, 2])
+        self.assertEqual(infer.batch_sizes, [2])
+
+    def test_splits_oversize_request(self):
+        infer = FakeInference()
+        batcher = DynamicBatcher(infer, max_latency=10.)
+        result = batcher(images(*range(10)))
+        self.assertEqual(result['value'].tolist(), range(10))
+        self.assertEqual(infer.batch_sizes, [4, 4, 2])
+
+        metrics = batcher.metrics()
+        self.assertEqual(metrics['n_requests'], 1)
+        self.assertEqual(metrics['n_batches'], 3)
+
+    def test_propagates_errors(self):
+        infer = FakeInference(error=ValueError('bad batch'))
+        batcher = DynamicBatcher(infer, max_latency=.01)
+        self.assertRaises(ValueError, batcher, images(1))
+
+        # the batching thread survives
+        infer.error = None
+        self.assertEqual(batcher(images(2))['value'].tolist(), [2])
+
+    def test_mixed_image_sizes_fail_only_their_batch(self):
+        gate = threading.Event()
+        infer = FakeInference(gate)
+        # batches only run when full, so the two mismatched requests below end up in the same batch
+        batcher = DynamicBatcher(infer, max_batch_size=2, max_latency=10.)
+        first = Call(batcher, images(0, 0))
+        wait_for(infer.started.is_set)
+        calls = [Call(batcher, images(1)), Call(batcher, np.zeros((1, 2, 2), dtype=np.float32))]
+        wait_for(lambda: batcher.metrics()['queue_depth'] == 2)
+
+        gate.set()
+        first.join(5.)
+        self.assertEqual(first.result['value'].tolist(), [0, 0])
+        for call in calls:
+            call.join(5.)
+            self.assertIsInstance(call.error, ValueError)
+
+        # the batching thread survives
+        self.assertEqual(batcher(images(2, 3), timeout=5.)['value'].tolist(), [2, 3])
+
+    def test_timeout(self):
+        gate = threading.Event()
+        batcher = DynamicBatcher(FakeInference(gate), max_latency=.01)
+        self.assertRaises(RuntimeError, batcher, images(1), .05)
+        gate.set()
+
+    def test_metrics(self):
+        gate = threading.Event()
+        infer = FakeInference(gate)
+        batcher = DynamicBatcher(infer, max_batch_size=1, max_latency=10.)
+        calls = [Call(batcher, images(0))]
+        # the first request blocks the batching thread, the others wait in the queue
+        wait_for(infer.started.is_set)
+        calls += [Call(batcher, images(i)) for i in (1, 2)]
+        wait_for(lambda: batcher.metrics()['queue_depth'] == 2)
+
+        gate.set()
+        for call in calls:
+            call.join(5.)
+        metrics = batcher.metrics()
+        self.assertEqual(metrics['queue_depth'], 0)
+        self.assertEqual(metrics['n_requests'], 3)
+        self.assertEqual(metrics['n_batches'], 3)
+        self.assertEqual(metrics['mean_batch_size'], 1.)
+        self.assertGreater(metrics['latency_p50_ms'], 0.)
+        self.assertLessEqual(metrics['latency_p50_ms'], metrics['latency_p99_ms'])
+
+        batcher.reset_metrics()
+        self.assertNotIn('latency_p50_ms', batcher.metrics())
+
+
+class ServerInference(object):
+    batch_size = 4
+    img_size = (2, 2)
+
+    def __call__(self, imgs):
+        n = len(imgs)
+        return dict(what=np.zeros((n, 3, 5)), where=np.zeros((n, 3, 4)), presence=np.ones((n, 3)))
+
+
+class AIRServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = AIRServer(('localhost', 0), DynamicBatcher(ServerInference(), max_latency=.01))
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://localhost:{}/decompose'.format(self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def post(self, imgs):
+        return urllib2.urlopen(self.url, json.dumps(dict(images=imgs.tolist())), timeout=10.)
+
+    def test_wrong_image_size_then_valid_request(self):
+        with self.assertRaises(urllib2.HTTPError) as context:
+            self.post(np.zeros((1, 3, 3)))
+        self.assertEqual(context.exception.code, 400)
+
+        response = json.loads(self.post(np.zeros((2, 2, 2))).read())
+        self.assertEqual(len(response['objects']), 2)
+        self.assertEqual(len(response['objects'][0]), 3)
@@ -0,0 +1,120 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from attend_infer_repeat.data.stream import ReplayBuffer, DirectoryStream, SocketStream, send_images
+
+
+def wait_until(condition, timeout=10.):
+    start = time.time()
+    while not condition() and time.time() - start < timeout:
+        time.sleep(.05)
+    return condition()
+
+
+class ReplayBufferTest(unittest.TestCase):
+
+    def test_reservoir(self):
+        buffer = ReplayBuffer(100, (2,), seed=0)
+        n = 10000
+        for i in xrange(n):
+            buffer.add(np.asarray([i // 256, i % 256], dtype=np.uint8))
+
+        self.assertEqual(buffer.size, 100)
+        self.assertEqual(buffer.n_seen, n)
+        self.assertEqual(buffer.metrics()['occupancy'], 1.)
+
+        # a uniform sample of the whole stream: distinct images with a mean index close to n / 2
+        ids = buffer._imgs[:, 0].astype(np.int32) * 256 + buffer._imgs[:, 1]
+        self.assertEqual(len(np.unique(ids)), 100)
+        self.assertLess(abs(ids.mean() - n / 2.), 1500)
+
+    def test_quantisation_and_lag(self):
+        buffer = ReplayBuffer(10, (4, 4), seed=0)
+        imgs = np.random.rand(5, 4, 4)
+        buffer.add(imgs)
+        self.assertEqual(buffer.metrics()['never_sampled'], 5)
+
+        sample = buffer.sample(1000)
+        self.assertEqual(sample.dtype, np.float32)
+        self.assertLessEqual(np.abs(np.sort(np.unique(sample)) - np.sort(np.unique(np.round(imgs * 255) / 255))).max(),
+                             1e-6)
+        metrics = buffer.metrics()
+        self.assertEqual(metrics['never_sampled'], 0)
+        self.assertGreaterEqual(metrics['training_lag'], 0.)
+        self.assertEqual(metrics['seen'], 5)
+
+        with self.assertRaises(ValueError):
+            buffer.add(np.zeros((2, 3, 3)))
+
+
+class StreamSourceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.buffer = ReplayBuffer(100, (6, 6))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_directory(self):
+        with DirectoryStream(self.tmp_dir, self.buffer, poll_interval=.05, settle_time=0., remove=True):
+            np.save(os.path.join(self.tmp_dir, 'a.npy'), np.random.rand(3, 6, 6))
+            np.save(os.path.join(self.tmp_dir, 'b.npy'), np.random.rand(6, 6))
+            self.assertTrue(wait_until(lambda: self.buffer.n_seen == 4))
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+    def write(self, name, content, age):
+        path = os.path.join(self.tmp_dir, name)
+        if isinstance(content, str):
+            with open(path, 'wb') as f:
+                f.write(content)
+        else:
+            np.save(path, content)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_directory_retries_failed_files(self):
+        stream = DirectoryStream(self.tmp_dir, self.buffer, poll_interval=0., settle_time=0.)
+        self.write('a.npy', 'not an array', age=2.)
+        self.assertEqual(stream._poll(), [])
+        self.assertEqual(stream.n_errors, 1)
+
+        # e.g. a file that was still being written
+        self.write('a.npy', np.zeros((6, 6)), age=1.)
+        self.assertEqual(len(stream._poll()), 1)
+        self.assertEqual(stream._poll(), [])
+
+    def test_directory_quarantines_failed_files(self):
+        stream = DirectoryStream(self.tmp_dir, self.buffer, poll_interval=0., settle_time=0., max_attempts=2)
+        self.write('a.npy', 'not an array', age=1.)
+        for _ in xrange(3):
+            self.assertEqual(stream._poll(), [])
+
+        self.assertEqual(stream.n_errors, 2)
+        self.assertEqual(stream.n_quarantined, 1)
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir, 'failed')), ['a.npy'])
+
+    def test_directory_high_water_mark(self):
+        stream = DirectoryStream(self.tmp_dir, self.buffer, poll_interval=0., settle_time=0.)
+        self.write('a.npy', np.zeros((6, 6)), age=3.)
+        self.write('b.npy', np.zeros((6, 6)), age=3.)
+        self.assertEqual(len(stream._poll()), 2)
+        self.assertEqual(stream._poll(), [])
+
+        self.write('c.npy', np.zeros((6, 6)), age=1.)
+        self.assertEqual(len(stream._poll()), 1)
+        self.assertEqual(stream._poll(), [])
+        # only files with the newest modification time are remembered
+        self.assertEqual(len(stream._at_high_water), 1)
+
+    def test_socket(self):
+        with SocketStream(self.buffer, timeout=.05) as source:
+            send_images(source.address, np.random.rand(7, 6, 6))
+            send_images(source.address, np.zeros((6, 6), dtype=np.uint8))
+            self.assertTrue(wait_until(lambda: self.buffer.n_seen == 8))
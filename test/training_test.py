@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import tensorflow as tf
+from attrdict import AttrDict
+
+from attend_infer_repeat.ops import apply_if_finite
+from attend_infer_repeat.training import NumericsWatchdog
+
+
+class NumericsGuardTest(unittest.TestCase):
+
+    def setUp(self):
+        tf.reset_default_graph()
+        self.tmp_dir = tempfile.mkdtemp()
+
+        self.x = tf.Variable(1., name='x')
+        self.c = tf.placeholder(tf.float32, ())
+        loss = self.c * self.x ** 2
+
+        self.global_step = tf.train.get_or_create_global_step()
+        self.skipped_steps = tf.Variable(0, trainable=False, name='skipped_steps')
+        self.learning_rate = tf.Variable(.1, trainable=False, name='learning_rate')
+        self.opt = tf.train.RMSPropOptimizer(self.learning_rate, momentum=.9)
+        gvs = self.opt.compute_gradients(loss)
+        self.train_step, _, self.n_skipped = apply_if_finite(self.opt, gvs, [loss], self.global_step,
+                                                             self.skipped_steps)
+
+        self.sess = tf.Session()
+        self.sess.run(tf.global_variables_initializer())
+
+    def tearDown(self):
+        self.sess.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def step(self, c):
+        return self.sess.run([self.train_step, self.n_skipped], {self.c: c})
+
+    def test_skips_non_finite_updates(self):
+        self.step(1.)
+        x, step = self.sess.run([self.x, self.global_step])
+
+        for c in (np.inf, np.nan):
+            applied, skipped = self.step(c)
+            self.assertFalse(applied)
+        self.assertEqual(skipped, 2)
+        self.assertEqual(self.sess.run(self.x), x)
+        self.assertEqual(self.sess.run(self.global_step), step + 2)
+
+        applied, skipped = self.step(1.)
+        self.assertTrue(applied)
+        self.assertEqual(skipped, 2)
+        self.assertNotEqual(self.sess.run(self.x), x)
+
+    def test_slots_created_outside_cond(self):
+        # `apply_if_finite` relies on the private `Optimizer._create_slots` of the TensorFlow version in the README
+        slot_names = self.opt.get_slot_names()
+        self.assertTrue(slot_names)
+        slots = [self.opt.get_slot(self.x, name) for name in slot_names]
+        self.assertNotIn(None, slots)
+        self.assertEqual(len(self.sess.run(tf.report_uninitialized_variables())), 0)
+
+        self.step(1.)
+        values = self.sess.run(slots)
+        self.step(np.nan)
+        for before, after in zip(values, self.sess.run(slots)):
+            self.assertEqual(before, after)
+
+    def test_rollback(self):
+        saver = tf.train.Saver()
+        air = AttrDict(learning_rate=self.learning_rate)
+        watchdog = NumericsWatchdog(air, self.sess, saver, max_consecutive=3, lr_decay=.5)
+
+        watchdog.after_step(self.step(1.)[1])
+        watchdog.save(os.path.join(self.tmp_dir, 'model.ckpt'), 1)
+        x = self.sess.run(self.x)
+
+        watchdog.after_step(self.step(1.)[1])
+        rolled_back = [watchdog.after_step(self.step(np.nan)[1]) for _ in xrange(3)]
+        self.assertEqual(rolled_back, [False, False, True])
+        self.assertEqual(watchdog.n_skipped, 3)
+        self.assertEqual(self.sess.run(self.x), x)
+        self.assertAlmostEqual(self.sess.run(self.learning_rate), .05)